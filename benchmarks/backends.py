@@ -0,0 +1,38 @@
+"""
+Time of evaluating the same programs by different interpreters.
+
+    $ python -m benchmarks.backends
+"""
+
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace
+from pycalc.interpreter.interpret import Interpreter
+from pycalc.interpreter.closures import ClosureInterpreter
+from pycalc.interpreter.pyast import AstInterpreter
+from pycalc.interpreter.vm import VMInterpreter
+
+PROGRAMS = {
+    "arithmetics": "f(x) = x * 2 + x // 3 - (x << 1) % 7 \n reduce((a, b) = a + f(b), range(0, 10000))",
+    "loop": "c = 0 \n s = 0 \n while(() = c < 20000, () = s = s + c * c % 7; c = c + 1) \n s",
+    "recursion": "fib(n) = if(n < 2, () = n, () = fib(n - 1) + fib(n - 2))\nfib(18)",
+}
+
+BACKENDS = {
+    "interpreter": Interpreter,
+    "closures": ClosureInterpreter,
+    "ast": AstInterpreter,
+    "vm": VMInterpreter,
+}
+
+
+def main():
+    for program, code in PROGRAMS.items():
+        for backend, interpreter_class in BACKENDS.items():
+            interpreter = interpreter_class()
+            elapsed = timeit(lambda: interpreter.interpret(code, dict(stdnamespace)), number=3)
+            print(f"{program:<12} {backend:<12} {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
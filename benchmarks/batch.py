@@ -0,0 +1,44 @@
+"""
+Time per row of evaluating a formula over columns, row by row and by
+columns (numpy is used for the columns of floats if it is installed).
+
+    $ python -m benchmarks.batch
+"""
+
+from array import array
+from random import Random
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace, stdpure
+from pycalc.interpreter import batch
+from pycalc.interpreter.interpret import Interpreter
+
+FORMULA = "price * qty * (1 - discount)"
+ROWS = 200000
+
+
+def main():
+    random = Random(0)
+    columns = {
+        "price": [random.random() * 100 for _ in range(ROWS)],
+        "qty": [float(random.randint(0, 10)) for _ in range(ROWS)],
+        "discount": [random.random() for _ in range(ROWS)],
+    }
+    buffers = {name: array("d", column) for name, column in columns.items()}
+    prepared = Interpreter(pure=stdpure).prepare(FORMULA, stdnamespace, params=list(columns))
+
+    def rows():
+        for row in zip(*columns.values()):
+            prepared.evaluate(*row)
+
+    for title, run in (
+        ("rows", rows),
+        ("lists", lambda: prepared.evaluate_columns(columns)),
+        ("buffers" + (", numpy" if batch.numpy is not None else ""), lambda: prepared.evaluate_columns(buffers)),
+    ):
+        elapsed = timeit(run, number=1)
+        print(f"{title:<16} {elapsed / ROWS * 1e9:.0f}ns per row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Scaling of the parallel evaluation by the number of worker processes, up
+to the number of cores of the machine. Formula defines a function, so
+it is evaluated row by row in every worker.
+
+    $ python -m benchmarks.parallel
+"""
+
+import os
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace
+from pycalc.interpreter.interpret import Interpreter
+from pycalc.interpreter.parallel import ParallelEvaluator
+
+FORMULA = "f(x) = x * 2 + 1\nf(price) * qty - f(qty)"
+ROWS = 100000
+CHUNKSIZE = 10000
+
+
+def main():
+    columns = {"price": [i / 7 for i in range(ROWS)], "qty": [i % 11 for i in range(ROWS)]}
+    prepared = Interpreter().prepare(FORMULA, stdnamespace, params=list(columns))
+    single = timeit(lambda: prepared.evaluate_columns(columns), number=1)
+    print(f"in process: {single:.2f}s")
+
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        with ParallelEvaluator(FORMULA, "std.stdlibrary:stdnamespace", list(columns),
+                               workers=workers, chunksize=CHUNKSIZE) as evaluator:
+            # the workers are started by the first evaluation
+            evaluator.evaluate_columns({name: column[:CHUNKSIZE * workers] for name, column in columns.items()})
+            elapsed = timeit(lambda: evaluator.evaluate_columns(columns), number=1)
+
+        print(f"{workers} workers: {elapsed:.2f}s, {single / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Time per level of recursion of the interpreter, for calls in tail
+position and for the ones that are not, by depth of the recursion.
+
+    $ python -m benchmarks.recursion
+"""
+
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace
+from pycalc.interpreter.interpret import Interpreter
+
+PROGRAMS = {
+    "tail": "f(n, acc) = if(n == 0, () = acc, () = f(n - 1, acc + n))\nf({depth}, 0)",
+    "not tail": "f(n) = if(n == 0, () = 0, () = 1 + f(n - 1))\nf({depth})",
+}
+DEPTHS = (100, 1000, 10000, 100000)
+
+
+def main():
+    interpreter = Interpreter()
+
+    for program, code in PROGRAMS.items():
+        for depth in DEPTHS:
+            source = code.format(depth=depth)
+            elapsed = timeit(lambda: interpreter.interpret(source, dict(stdnamespace)), number=1)
+            print(f"{program:<10} depth {depth:<8} {elapsed / depth * 1e6:.1f}us per level")
+
+
+if __name__ == "__main__":
+    main()
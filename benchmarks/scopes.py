@@ -0,0 +1,60 @@
+"""
+Memory taken by long runs of the turing machine example, and time of
+defining closures in a loop.
+
+    $ python -m benchmarks.scopes
+
+Memory must stay flat between rounds: nothing created by the program
+outlives it, except of the cycles of named functions and namespaces
+they are defined in, those are collected by gc.
+"""
+
+import gc
+import os
+import tracemalloc
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace
+from pycalc.interpreter.interpret import Interpreter
+from pycalc.interpreter.closures import ClosureInterpreter
+from pycalc.interpreter.vm import VMInterpreter
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "examples")
+ROUNDS = 5
+RUNS = 20
+CLOSURES = "reduce((a, b) = a + len(map((x) = x + b, range(0, 1))), range(0, 20000))"
+
+
+def memory(interpreter: Interpreter, code: str):
+    namespace = dict(stdnamespace, println=lambda *args: None)
+    gc.collect()
+    tracemalloc.start()
+
+    for i in range(ROUNDS):
+        for _ in range(RUNS):
+            interpreter.interpret(code, namespace)
+
+        current, peak = tracemalloc.get_traced_memory()
+        collected = gc.collect()
+        print(f"  round {i}: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB, "
+              f"{collected} objects in cycles")
+
+    tracemalloc.stop()
+
+
+def main():
+    with open(os.path.join(EXAMPLES_DIR, "turingmachine.calc")) as fd:
+        code = fd.read()
+
+    for interpreter_class in (Interpreter, ClosureInterpreter, VMInterpreter):
+        print(f"turingmachine.calc x{RUNS}, {interpreter_class.__name__}:")
+        memory(interpreter_class(), code)
+
+    for interpreter_class in (Interpreter, ClosureInterpreter, VMInterpreter):
+        interpreter = interpreter_class()
+        elapsed = timeit(lambda: interpreter.interpret(CLOSURES, dict(stdnamespace)), number=3)
+        print(f"closures definitions, {interpreter_class.__name__}: {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Throughput of one interpreter shared by a pool of threads, by the number
+of threads. Every script is interpreted with the frozen stdlib, so the
+namespace is not copied for it. Threads of CPython with the GIL execute
+python code one at a time, so only free-threaded builds may scale here.
+
+    $ python -m benchmarks.threads
+"""
+
+import os
+from timeit import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from std.stdlibrary import stdlib
+from pycalc.interpreter.interpret import Interpreter
+
+CODE = "f(n) = if(n < 2, () = n, () = f(n - 1) + f(n - 2))\nx = {n}\nf(x) + pi"
+SCRIPTS = 200
+
+
+def main():
+    interpreter = Interpreter()
+    scripts = [CODE.format(n=10 + i % 5) for i in range(SCRIPTS)]
+    single = None
+
+    for threads in sorted({1, 2, 4, max(os.cpu_count() or 1, 1)}):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            elapsed = timeit(lambda: list(executor.map(lambda code: interpreter.interpret(code, stdlib), scripts)),
+                             number=1)
+
+        single = single or elapsed
+        print(f"{threads} threads: {SCRIPTS / elapsed:.0f} scripts/s, {single / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Memory taken by tokens of a compiled program, tokens allocated and time
+spent while evaluating an arithmetics-heavy program.
+
+    $ python -m benchmarks.tokens
+"""
+
+import os
+import sys
+import tracemalloc
+from timeit import timeit
+
+from std.stdlibrary import stdnamespace
+from pycalc.interpreter import interpret
+from pycalc.interpreter.interpret import Interpreter
+from pycalc.interpreter.vm import VMInterpreter
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "examples")
+ARITHMETICS = "f(x) = x * 2 + x // 3 - (x << 1) % 7 \n reduce((a, b) = a + f(b), range(0, 10000))"
+
+
+def compiled_size(interpreter: Interpreter, code: str) -> int:
+    tracemalloc.start()
+    stacks = interpreter.stackbuilder.build(interpreter.tokenizer.tokenize(code))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del stacks
+
+    return size
+
+
+def blocks_size(interpreter: VMInterpreter, code: str) -> int:
+    stacks = interpreter.stackbuilder.build(interpreter.tokenizer.tokenize(code))
+    tracemalloc.start()
+    blocks = [interpreter.compile(stack) for stack in stacks]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del blocks
+
+    return size
+
+
+def token_size(interpreter: Interpreter) -> int:
+    token = interpreter.tokenizer.tokenize("1")[0][0]
+    size = sys.getsizeof(token)
+
+    if hasattr(token, "__dict__"):
+        size += sys.getsizeof(token.__dict__)
+
+    return size
+
+
+def runtime_tokens(interpreter: Interpreter, code: str) -> int:
+    """
+    Number of tokens created by the interpreter while evaluating the
+    already built program
+    """
+
+    stacks = interpreter.stackbuilder.build(interpreter.tokenizer.tokenize(code))
+    created = 0
+
+    class CountedToken(interpret.Token):
+        __slots__ = ()
+
+        def __init__(self, *args, **kwargs):
+            nonlocal created
+            created += 1
+            super().__init__(*args, **kwargs)
+
+    original, interpret.Token = interpret.Token, CountedToken
+
+    try:
+        namespaces = interpret.NamespaceStack([stdnamespace, {}])
+        interpreter._interpreter(stacks, namespaces)
+    finally:
+        interpret.Token = original
+
+    return created
+
+
+def main():
+    interpreter = Interpreter()
+
+    with open(os.path.join(EXAMPLES_DIR, "turingmachine.calc")) as fd:
+        code = fd.read() * 100
+
+    print(f"compiled program: {compiled_size(interpreter, code) / 1024:.1f} KiB")
+    print(f"vm code blocks: {blocks_size(VMInterpreter(), code) / 1024:.1f} KiB")
+    print(f"token: {token_size(interpreter)} bytes")
+    print(f"tokens allocated while evaluating: {runtime_tokens(interpreter, ARITHMETICS)}")
+    print(f"evaluation time: {timeit(lambda: interpreter.interpret(ARITHMETICS, stdnamespace), number=5):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
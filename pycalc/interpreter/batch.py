@@ -0,0 +1,349 @@
+import array
+from itertools import repeat
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from pycalc.tokentypes.tokens import Token
+from pycalc.tokentypes.types import TokenKind, TokenType, Stack, Namespace
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CHUNKSIZE = 65536
+
+# kinds of operations of the plan
+CONST = 0
+COLUMN = 1
+UNARY = 2
+BINARY = 3
+CALL = 4
+
+# floats keep integers of this magnitude exactly, so they are compared
+# with floats exactly as python compares them
+_EXACT_INT = 2 ** 53
+
+Operation = Tuple[int, object, object]
+
+
+class Plan:
+    """
+    Expression compiled for columns: operations in order of the stack, and
+    names of the columns it uses. Every operation is (kind, argument, type
+    of the token), where argument is the value of the constant, name of
+    the column, executor of the operator, or the pure function with number
+    of its arguments
+    """
+
+    __slots__ = ("operations", "columns")
+
+    def __init__(self, operations: List[Operation], columns: List[str]):
+        self.operations = operations
+        self.columns = columns
+
+
+def plan(stacks: List[Stack[Token]], namespace: Namespace, params: Sequence[str],
+         executors: Dict[TokenType, Callable], unary_executors: Dict[TokenType, Callable],
+         pure: Dict[int, Callable]) -> Optional[Plan]:
+    """
+    Plan of the program, or None if it can not be executed for columns:
+    it is not a single expression of the parameters, values of the namespace,
+    operators and calls of the pure functions (by ids), or it would fail
+    because of number of values in it. Functions are never values of the
+    plan: higher-order functions are pure only as long as the functions they
+    are given are, and those are called again for rows of the chunk that
+    fails
+    """
+
+    if len(stacks) != 1:
+        return None
+
+    operations: List[Operation] = []
+    columns: List[str] = []
+    depth = 0
+
+    for token in stacks[0]:
+        if token.kind in (TokenKind.NUMBER, TokenKind.STRING):
+            operations.append((CONST, token.value, token.type))
+            depth += 1
+        elif token.type == TokenType.VAR:
+            if token.value in params:
+                operations.append((COLUMN, token.value, token.type))
+
+                if token.value not in columns:
+                    columns.append(token.value)
+            elif token.value in namespace and not callable(namespace[token.value]):
+                value = namespace[token.value]
+                operations.append((CONST, int(value) if isinstance(value, int) else value, token.type))
+            else:
+                return None
+
+            depth += 1
+        elif token.kind == TokenKind.UNARY_OPERATOR:
+            if depth < 1:
+                return None
+
+            operations.append((UNARY, unary_executors[token.type], token.type))
+        elif token.kind == TokenKind.OPERATOR and token.type in executors \
+                and token.type != TokenType.OP_DOT:
+            if depth < 2:
+                return None
+
+            operations.append((BINARY, executors[token.type], token.type))
+            depth -= 1
+        elif token.type == TokenType.FUNCCALL:
+            func = namespace.get(token.value.name)
+            argscount = token.value.argscount
+
+            if token.value.name in params or id(func) not in pure or depth < argscount:
+                return None
+
+            operations.append((CALL, (func, argscount), token.type))
+            depth += 1 - argscount
+        else:
+            return None
+
+    return Plan(operations, columns) if depth == 1 else None
+
+
+def evaluate_columns(program: Optional[Plan], params: Sequence[str], evaluate: Callable,
+                     columns: Mapping[str, Sequence], chunksize: int = CHUNKSIZE) -> list:
+    """
+    Evaluates the program for every row of the columns: sequences or
+    buffers of values of the parameters, all of the same length. Values
+    are read as python values (buffers are converted by their tolist()).
+
+    If the program has a plan, every operation of it is applied to whole
+    chunks of columns: by ufuncs of numpy for buffers of floats (if numpy
+    is installed), by mapping it over lists of values otherwise. Results
+    are exactly the ones evaluating row by row gives: the chunk that fails,
+    or that numpy may compute inexactly (it signals that by floating point
+    errors), is computed again in the slower way. Evaluate is the function
+    evaluating a single row, so errors are the same too
+    """
+
+    length = columns_length(columns, params)
+    arrays = None
+
+    if program is not None and numpy is not None and program.columns:
+        arrays = {name: _float_array(columns[name]) for name in program.columns}
+
+        if any(column is None for column in arrays.values()):
+            arrays = None
+
+    results = []
+
+    for start in range(0, length, chunksize):
+        end = min(start + chunksize, length)
+        values = None
+
+        if arrays is not None:
+            try:
+                values = _execute_numpy(program, {name: column[start:end] for name, column in arrays.items()},
+                                        end - start)
+            except Exception:
+                values = None
+
+        if values is None:
+            rows = {name: _python_values(columns[name][start:end]) for name in params}
+
+            if program is not None:
+                try:
+                    values = _execute(program, rows, end - start)
+                except Exception:
+                    values = None
+
+            if values is None:
+                values = [evaluate(*row) for row in zip(*(rows[name] for name in params))]
+
+        results.extend(values)
+
+    return results
+
+
+def columns_length(columns: Mapping[str, Sequence], params: Sequence[str]) -> int:
+    """
+    Number of rows of the columns. Raises TypeError if they are not the
+    columns of exactly the parameters, and ValueError if they are of
+    different lengths
+    """
+
+    unknown = [name for name in columns if name not in params]
+    missing = [name for name in params if name not in columns]
+
+    if unknown:
+        raise TypeError(f"unknown parameters: {', '.join(unknown)}")
+    elif missing:
+        raise TypeError(f"missing parameters: {', '.join(missing)}")
+
+    lengths = {len(columns[name]) for name in params}
+
+    if len(lengths) > 1:
+        raise ValueError("columns are of different lengths")
+
+    return lengths.pop() if lengths else 0
+
+
+class _NotVectorizable(Exception):
+    """
+    Raised if the operation can not be applied to the columns in this way
+    """
+
+
+def _execute(program: Plan, rows: Dict[str, list], length: int) -> list:
+    # values on the stack are constants or lists of values of the rows
+    stack: List[Tuple[bool, object]] = []
+    loaded: Dict[str, list] = {}
+
+    for kind, argument, _ in program.operations:
+        if kind == CONST:
+            stack.append((False, argument))
+        elif kind == COLUMN:
+            if argument not in loaded:
+                loaded[argument] = [int(value) if isinstance(value, int) else value for value in rows[argument]]
+
+            stack.append((True, loaded[argument]))
+        else:
+            if kind == UNARY:
+                func, count = argument, 1
+            elif kind == BINARY:
+                func, count = argument, 2
+            else:
+                func, count = argument
+
+            operands = stack[len(stack) - count:]
+            del stack[len(stack) - count:]
+
+            if not any(is_column for is_column, _ in operands):
+                value = func(*(value for _, value in operands))
+                stack.append((False, int(value) if isinstance(value, int) else value))
+                continue
+
+            values = map(func, *(value if is_column else repeat(value, length) for is_column, value in operands))
+            stack.append((True, [int(value) if isinstance(value, int) else value for value in values]))
+
+    is_column, value = stack.pop()
+
+    return value if is_column else [value] * length
+
+
+def _execute_numpy(program: Plan, arrays: Dict[str, "numpy.ndarray"], length: int) -> list:
+    """
+    Executes the expression of columns of floats by numpy. Arrays on the
+    stack are either of floats, or of integers (results of comparisons).
+    Only operations those give exactly what python would are done, others
+    raise _NotVectorizable
+    """
+
+    stack: list = []
+
+    with numpy.errstate(all="raise", under="ignore"):
+        for kind, argument, typeof in program.operations:
+            if kind == CONST:
+                stack.append(argument)
+            elif kind == COLUMN:
+                stack.append(arrays[argument])
+            elif kind == UNARY:
+                operand = stack.pop()
+
+                if isinstance(operand, numpy.ndarray):
+                    stack.append(_UNARY_UFUNCS[typeof](operand))
+                else:
+                    value = argument(operand)
+                    stack.append(int(value) if isinstance(value, int) else value)
+            elif kind == BINARY:
+                right, left = stack.pop(), stack.pop()
+
+                if not isinstance(left, numpy.ndarray) and not isinstance(right, numpy.ndarray):
+                    value = argument(left, right)
+                    stack.append(int(value) if isinstance(value, int) else value)
+                elif typeof in _COMPARISON_UFUNCS:
+                    left, right = _compared(left), _compared(right)
+                    stack.append(_COMPARISON_UFUNCS[typeof](left, right).astype(numpy.int64))
+                elif typeof in _BINARY_UFUNCS:
+                    if not (_is_floats(left) or _is_floats(right)):
+                        # integers of numpy are not the ones of python
+                        raise _NotVectorizable
+
+                    left, right = _operand(left), _operand(right)
+                    stack.append(_BINARY_UFUNCS[typeof](left, right))
+                else:
+                    raise _NotVectorizable
+            else:
+                raise _NotVectorizable
+
+    value = stack.pop()
+
+    if not isinstance(value, numpy.ndarray):
+        return [value] * length
+
+    return value.tolist()
+
+
+def _operand(value):
+    if isinstance(value, numpy.ndarray):
+        return value
+    elif type(value) is int:
+        return float(value)
+    elif type(value) is float:
+        return value
+
+    raise _NotVectorizable
+
+
+def _compared(value):
+    if isinstance(value, numpy.ndarray) or type(value) is float:
+        return value
+    elif type(value) is int and -_EXACT_INT <= value <= _EXACT_INT:
+        return float(value)
+
+    raise _NotVectorizable
+
+
+def _is_floats(value) -> bool:
+    return type(value) is float or (isinstance(value, numpy.ndarray) and value.dtype == numpy.float64)
+
+
+def _float_array(column) -> Optional["numpy.ndarray"]:
+    """
+    The column as a numpy array without copying it, if it is a buffer
+    of floats
+    """
+
+    if isinstance(column, numpy.ndarray):
+        return column if column.ndim == 1 and column.dtype == numpy.float64 else None
+    elif isinstance(column, array.array) and column.typecode == "d":
+        return numpy.frombuffer(column, dtype=numpy.float64)
+    elif isinstance(column, memoryview) and column.format == "d" and column.ndim == 1:
+        return numpy.frombuffer(column, dtype=numpy.float64)
+
+    return None
+
+
+def _python_values(column: Sequence) -> list:
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+
+if numpy is not None:
+    _UNARY_UFUNCS = {
+        TokenType.UN_POS: numpy.positive,
+        TokenType.UN_NEG: numpy.negative,
+    }
+    _BINARY_UFUNCS = {
+        TokenType.OP_ADD:      numpy.add,
+        TokenType.OP_SUB:      numpy.subtract,
+        TokenType.OP_MUL:      numpy.multiply,
+        TokenType.OP_DIV:      numpy.true_divide,
+        TokenType.OP_FLOORDIV: numpy.floor_divide,
+        TokenType.OP_MOD:      numpy.remainder,
+        # power of numpy is not always rounded as the one of python is
+    }
+    _COMPARISON_UFUNCS = {
+        TokenType.OP_EQEQ:  numpy.equal,
+        TokenType.OP_NOTEQ: numpy.not_equal,
+        TokenType.OP_GT:    numpy.greater,
+        TokenType.OP_GE:    numpy.greater_equal,
+        TokenType.OP_LT:    numpy.less,
+        TokenType.OP_LE:    numpy.less_equal,
+    }
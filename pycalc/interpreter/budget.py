@@ -0,0 +1,198 @@
+import sys
+from time import monotonic
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional
+
+from pycalc.tokentypes.types import BudgetExceededError
+
+
+# steps between looking at the clock
+CHECK_EVERY = 256
+
+# no position: budget errors are located at the calls exceeding the
+# budget, as the arguments errors are
+_NOWHERE = (-1, -1)
+
+
+class Budget:
+    """
+    Limits of everything evaluated in the with-block of the budget (in
+    the same thread, or the same task of asyncio): steps (calls of the
+    functions of programs, values taken by the functions iterating over
+    sequences, and iterations of the loops those are compiled into
+    jumps), seconds of the wall-clock time, bytes of
+    memory allocated by malloc and friends, and depth of the calls in
+    progress. None means no limit. Exceeding a limit raises the
+    BudgetExceededError.
+
+    Budget is not changed by the evaluations, so it may be entered
+    any number of times, in any number of threads at once. Every entering
+    starts the budget over. Budget entered inside of another one can not
+    exceed what is left of the outer one, and is spent from it
+    """
+
+    __slots__ = ("steps", "seconds", "memory", "depth")
+
+    def __init__(self, steps: Optional[int] = None, seconds: Optional[float] = None,
+                 memory: Optional[int] = None, depth: Optional[int] = None):
+        self.steps = steps
+        self.seconds = seconds
+        self.memory = memory
+        self.depth = depth
+
+    def __enter__(self) -> "Meter":
+        meter = Meter(self, _meter.get())
+        meter.token = _meter.set(meter)
+
+        return meter
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        meter = _meter.get()
+        _meter.reset(meter.token)
+
+        if meter.parent is not None:
+            meter.parent.spend(meter)
+
+    def __repr__(self):
+        return f"Budget(steps={self.steps!r}, seconds={self.seconds!r}, " \
+               f"memory={self.memory!r}, depth={self.depth!r})"
+
+
+class Meter:
+    """
+    What is left of the budget being spent. Depth is the number of calls
+    in progress. On every step interpreters decrement the countdown, and
+    call check() once it is over. Countdown never exceeds the steps those
+    may be made before some of the limits is reached (every step is at
+    most one call deeper), so the limits cost a single subtraction and
+    comparison per step
+    """
+
+    __slots__ = ("parent", "steps", "deadline", "memory", "depth", "max_depth", "countdown",
+                 "_period", "_start_steps", "_start_memory", "token")
+
+    def __init__(self, budget: Budget, parent: Optional["Meter"]):
+        self.parent = parent
+        self.steps = budget.steps
+        self.memory = budget.memory
+        self.deadline = None if budget.seconds is None else monotonic() + budget.seconds
+        self.depth = parent.depth if parent is not None else 0
+        self.max_depth = sys.maxsize if budget.depth is None else self.depth + budget.depth
+
+        if parent is not None:
+            self.steps = _least(self.steps, parent.steps)
+            self.memory = _least(self.memory, parent.memory)
+            self.deadline = _least(self.deadline, parent.deadline)
+            self.max_depth = min(self.max_depth, parent.max_depth)
+
+        self._start_steps = self.steps
+        self._start_memory = self.memory
+        self.token = None
+        self._reset_countdown()
+
+    def check(self, deeper: bool = True):
+        """
+        Called once the countdown is over: raises if the step being made
+        exceeds the budget. Deeper is whether the step is a call that is
+        going to be in progress together with the current ones (not a call
+        in tail position)
+        """
+
+        if deeper and self.depth >= self.max_depth:
+            raise BudgetExceededError("depth budget exceeded", _NOWHERE)
+
+        if self.steps is not None:
+            self.steps -= self._period
+
+            if self.steps < 0:
+                self.steps = 0
+                raise BudgetExceededError("steps budget exceeded", _NOWHERE)
+
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise BudgetExceededError("time budget exceeded", _NOWHERE)
+
+        self._reset_countdown(self.depth + deeper)
+
+    def allocate(self, size: int):
+        if self.memory is not None:
+            if size > self.memory:
+                raise BudgetExceededError("memory budget exceeded", _NOWHERE)
+
+            self.memory -= size
+
+    def spend(self, child: "Meter"):
+        """
+        Spends what the budget entered inside of this one spent
+        """
+
+        if self.steps is not None:
+            self.steps = max(self._steps_left() - (child._start_steps - child._steps_left()), 0)
+            self._reset_countdown()
+
+        if self.memory is not None:
+            self.memory = max(self.memory - (child._start_memory - child.memory), 0)
+
+    def _steps_left(self) -> int:
+        # steps of the current countdown are not subtracted yet
+        return max(self.steps - (self._period - self.countdown), 0)
+
+    def _reset_countdown(self, depth: Optional[int] = None):
+        depth = self.depth if depth is None else depth
+        self._period = min(CHECK_EVERY, self.max_depth - depth + 1)
+
+        if self.steps is not None:
+            self._period = min(self._period, self.steps + 1)
+
+        self.countdown = self._period
+
+
+def allocate(size: int):
+    """
+    Spends the bytes of memory from the current budget, if there is one.
+    Called by the functions allocating memory before they do it
+    """
+
+    meter = _meter.get()
+
+    if meter is not None:
+        meter.allocate(size)
+
+
+def metered(iterable: Iterable) -> Iterable:
+    """
+    The iterable, every value of those is a step of the current budget,
+    if there is one. Called by the functions iterating over sequences, so
+    loops calling nothing but external functions are limited too
+    """
+
+    meter = _meter.get()
+
+    if meter is None:
+        return iterable
+
+    return _metered(meter, iterable)
+
+
+def _metered(meter: Meter, iterable: Iterable) -> Iterator:
+    for value in iterable:
+        meter.countdown -= 1
+
+        if meter.countdown <= 0:
+            meter.check(False)
+
+        yield value
+
+
+def _least(a, b):
+    if a is None:
+        return b
+    elif b is None:
+        return a
+
+    return min(a, b)
+
+
+_meter: ContextVar[Optional[Meter]] = ContextVar("pycalc_budget", default=None)
+
+# meter of the budget entered by the current thread (or task), if any
+current = _meter.get
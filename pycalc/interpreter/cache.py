@@ -0,0 +1,123 @@
+import sys
+from threading import Lock
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from pycalc.tokentypes.tokens import Token
+from pycalc.tokentypes.types import TokenType, Stack
+
+
+Program = List[Stack[Token]]
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    currsize: int
+    nbytes: int
+
+
+class ProgramCache:
+    """
+    Least recently used cache of built programs, keyed by their source.
+    Bounded by the number of programs and (optionally) by the number of
+    bytes they take. Programs larger than the whole bytes budget are
+    not cached at all.
+
+    Cached programs are shared between all the evaluations of the same
+    source, so nothing must modify them: neither interpreters nor
+    optimizers do
+    """
+
+    def __init__(self, maxsize: int = 1024, maxbytes: Optional[int] = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = self.misses = self.evictions = 0
+        self.nbytes = 0
+        self._programs: "OrderedDict[str, Tuple[Program, int]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, code: str) -> Optional[Program]:
+        with self._lock:
+            entry = self._programs.get(code)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._programs.move_to_end(code)
+
+            return entry[0]
+
+    def put(self, code: str, program: Program, size: Optional[int] = None):
+        """
+        Size is the number of bytes the program takes, if it is not
+        a built program (see program_size()). The program replaces the
+        one of the same code, even if it is too large to be cached
+        """
+
+        if size is None:
+            size = program_size(program) if self.maxbytes is not None else 0
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            if code in self._programs:
+                self.nbytes -= self._programs.pop(code)[1]
+
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+
+            self._programs[code] = (program, size)
+            self.nbytes += size
+
+            while len(self._programs) > self.maxsize \
+                    or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, (_, evicted_size) = self._programs.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                currsize=len(self._programs),
+                nbytes=self.nbytes
+            )
+
+    def clear(self):
+        with self._lock:
+            self._programs.clear()
+            self.hits = self.misses = self.evictions = 0
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._programs)
+
+    def __contains__(self, code: str):
+        return code in self._programs
+
+
+def program_size(program: Program) -> int:
+    """
+    Approximate number of bytes taken by the program: stacks, tokens
+    and their values (including bodies of the functions)
+    """
+
+    size = sys.getsizeof(program)
+
+    for stack in program:
+        size += sys.getsizeof(stack)
+
+        for token in stack:
+            size += sys.getsizeof(token) + sys.getsizeof(token.value)
+
+            if token.type == TokenType.FUNCDEF:
+                size += program_size([token.value.args, token.value.body])
+
+    return size
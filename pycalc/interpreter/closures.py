@@ -0,0 +1,369 @@
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from pycalc.interpreter.interpret import Interpreter, NamespaceStack, Value
+from pycalc.tokentypes.tokens import Token
+from pycalc.tokentypes.types import (TokenKind, TokenType, Stack, ArgumentsError,
+                                     NameNotFoundError, ExternalFunctionError,
+                                     BudgetExceededError, PyCalcError)
+
+Code = Callable[[NamespaceStack], Value]
+
+
+# closures are nested as deep as the expression tree is, so too deep
+# expressions would hit the recursion limit
+MAX_DEPTH = 200
+
+# where a name is looked up, see resolve()
+ARGUMENT = 0
+CELL = 1
+GLOBAL = 2
+DYNAMIC = 3
+
+
+class _NotCompilable(Exception):
+    """
+    Raised while compiling a stack that would fail in runtime because
+    of number of values in it, or that is too deep to be compiled
+    """
+
+
+class Scopes(NamespaceStack):
+    """
+    Namespaces stack of the compiled code. Additionally keeps arguments
+    namespaces of all the enclosing functions (cells[0] is of the
+    outermost one), as they were when the function was defined, and
+    the globals and the builtins namespaces
+    """
+
+    __slots__ = ("cells", "globals")
+
+    def __init__(self, head: Optional[tuple], cells: Tuple[dict, ...], globals_: Tuple[dict, dict]):
+        super().__init__()
+        self.head = head
+        self.cells = cells
+        self.globals = globals_
+
+    def copy(self) -> "Scopes":
+        return Scopes(self.head, self.cells, self.globals)
+
+
+class Scope:
+    """
+    Function being compiled: its nesting level, names of its arguments
+    and names it may assign. Assigned names appear in namespaces only
+    in runtime (if ever), so they can not be resolved in advance
+    """
+
+    __slots__ = ("parent", "level", "args", "assigned")
+
+    def __init__(self, parent: Optional["Scope"], token: Token):
+        self.parent = parent
+        self.level = parent.level + 1 if parent else 1
+        self.args: Set[str] = {arg.value for arg in token.value.args}
+        self.assigned: Set[str] = set()
+
+        for body_token in token.value.body:
+            if body_token.type == TokenType.IDENTIFIER:
+                self.assigned.add(body_token.value)
+            elif body_token.type == TokenType.FUNCDEF:
+                self.assigned.add(body_token.value.name)
+
+
+def resolve(scope: Optional[Scope], name: str) -> Tuple[int, int]:
+    """
+    Returns where the name is found in runtime, exactly as the
+    NamespaceStack would find it:
+        - ARGUMENT: argument of the function itself, that is always
+          in the top namespace
+        - CELL, i: argument of the enclosing function, that is always
+          in the cells[i] namespace
+        - GLOBAL: in the globals or the builtins (bottom namespaces), as
+          no namespace of the enclosing functions may contain it
+        - DYNAMIC: may be assigned by some of the functions, so the
+          namespaces are searched one by one
+    """
+
+    current = scope
+
+    while current is not None:
+        if name in current.args:
+            if current is scope:
+                return ARGUMENT, 0
+
+            return CELL, current.level - 1
+        elif name in current.assigned:
+            return DYNAMIC, 0
+
+        current = current.parent
+
+    return GLOBAL, 0
+
+
+def _value(value: Value) -> Value:
+    # the same conversion Interpreter._token does: bools are
+    # results of comparisons, but language has integers only
+    return int(value) if isinstance(value, int) else value
+
+
+class ClosureInterpreter(Interpreter):
+    """
+    Interpreter that compiles every stack into a tree of closures once,
+    so executing it (including bodies of functions on every call) does
+    not dispatch tokens anymore. Results and errors are the same as the
+    Interpreter gives. Names are resolved while compiling (see resolve()),
+    so most of the lookups do not search the namespaces stack.
+
+    Stacks those would fail because of number of values in them are
+    executed by the reference interpreter instead, so they fail in the
+    same way and in the same moment. The same is done for too deep
+    expressions
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reference = Interpreter(self.tokenizer, self.stackbuilder)
+
+    def _compile_program(self, exprs: Iterable[Stack[Token]]) -> Iterable[Code]:
+        return map(self.compile, exprs)
+
+    def _run(self, exprs: Iterable[Code], namespaces: NamespaceStack) -> Value:
+        # bottom namespaces are the builtins and the globals
+        scopes = Scopes(namespaces.head, (), tuple(namespaces)[1::-1])
+
+        return super()._run(exprs, scopes)
+
+    async def _run_async(self, exprs: Iterable[Stack[Token]], namespaces: NamespaceStack,
+                         yield_every: int) -> Value:
+        # code awaiting the calls can not be compiled, so it is
+        # executed by the reference interpreter
+        return await self._reference._run_async(exprs, namespaces, yield_every)
+
+    def _interpret_line(self, expression: Code, namespaces: NamespaceStack) -> Value:
+        return expression(namespaces)
+
+    def compile(self, expression: Stack[Token], scope: Optional[Scope] = None) -> Code:
+        try:
+            return self._compile(expression, scope)
+        except _NotCompilable:
+            reference = self._reference
+
+            def fallback(namespaces: NamespaceStack) -> Value:
+                return reference._interpret_line(expression, namespaces)
+
+            return fallback
+
+    def _compile(self, expression: Stack[Token], scope: Optional[Scope]) -> Code:
+        statements: List[Code] = []
+        stack: List[Tuple[Code, int]] = []
+        # identifiers on the stack with their names, by ids of their codes
+        identifiers = {}
+
+        for token in expression:
+            if token.kind in (TokenKind.NUMBER, TokenKind.STRING):
+                stack.append((self._const(token.value), 1))
+            elif token.type == TokenType.IDENTIFIER:
+                code = self._const(token.value)
+                identifiers[id(code)] = code, token.value
+                stack.append((code, 1))
+            elif token.type == TokenType.VAR:
+                stack.append((self._load(token, scope), 1))
+            elif token.kind == TokenKind.UNARY_OPERATOR:
+                (operand,), depth = self._pop(stack, 1)
+                code = self._unary(self.unary_executors[token.type], operand)
+                stack.append((code, depth))
+            elif token.type == TokenType.OP_SEMICOLON:
+                if len(stack) != 1:
+                    raise _NotCompilable
+
+                statements.append(stack.pop()[0])
+            elif token.type == TokenType.OP_EQ:
+                (left, right), depth = self._pop(stack, 2)
+                code, target = identifiers.get(id(left), (None, None))
+                target = target if code is left else None
+                stack.append((self._assign(left, right, target, scope), depth))
+            elif token.kind == TokenKind.OPERATOR:
+                (left, right), depth = self._pop(stack, 2)
+                code = self._binary(self.executors[token.type], left, right)
+                stack.append((code, depth))
+            elif token.type == TokenType.FUNCCALL:
+                args, depth = self._pop(stack, token.value.argscount)
+                stack.append((self._call(token, args, scope), depth))
+            elif token.type == TokenType.FUNCDEF:
+                stack.append((self._funcdef(token, scope), 1))
+            else:
+                raise _NotCompilable
+
+        if len(stack) != 1:
+            raise _NotCompilable
+
+        result = stack.pop()[0]
+
+        if not statements:
+            return result
+
+        def sequence(namespaces: NamespaceStack) -> Value:
+            for statement in statements:
+                statement(namespaces)
+
+            return result(namespaces)
+
+        return sequence
+
+    @staticmethod
+    def _pop(stack: List[Tuple[Code, int]], count: int) -> Tuple[Tuple[Code, ...], int]:
+        """
+        Pops operands of a node. Returns them and depth of the node
+        """
+
+        if len(stack) < count:
+            raise _NotCompilable
+
+        if not count:
+            return (), 1
+
+        operands = stack[-count:]
+        del stack[-count:]
+        depth = max(depth for _, depth in operands) + 1
+
+        if depth > MAX_DEPTH:
+            raise _NotCompilable
+
+        return tuple(code for code, _ in operands), depth
+
+    @staticmethod
+    def _const(value: Value) -> Code:
+        return lambda namespaces: value
+
+    @staticmethod
+    def _getter(name: str, pos: Tuple[int, int], scope: Optional[Scope]) -> Code:
+        """
+        Returns a function looking the name up as it is resolved. The
+        value is returned as it is
+        """
+
+        kind, index = resolve(scope, name)
+
+        if kind == ARGUMENT:
+            return lambda namespaces: namespaces.head[0][name]
+        elif kind == CELL:
+            return lambda namespaces: namespaces.cells[index][name]
+        elif kind == GLOBAL:
+            def get_global(namespaces: Scopes) -> Value:
+                globals_, builtins = namespaces.globals
+
+                if name in globals_:
+                    return globals_[name]
+                elif name in builtins:
+                    return builtins[name]
+
+                raise NameNotFoundError(name, pos)
+
+            return get_global
+
+        def get(namespaces: NamespaceStack) -> Value:
+            try:
+                return namespaces.get(name)
+            except NameNotFoundError as exc:
+                raise NameNotFoundError(str(exc), pos) from None
+
+        return get
+
+    def _load(self, token: Token, scope: Optional[Scope]) -> Code:
+        name = token.value
+        kind, index = resolve(scope, name)
+
+        # arguments are the most frequent ones, so they are not
+        # looked up through the getter
+        if kind == ARGUMENT:
+            def load_argument(namespaces: NamespaceStack) -> Value:
+                value = namespaces.head[0][name]
+                return int(value) if isinstance(value, int) else value
+
+            return load_argument
+        elif kind == CELL:
+            def load_cell(namespaces: NamespaceStack) -> Value:
+                value = namespaces.cells[index][name]
+                return int(value) if isinstance(value, int) else value
+
+            return load_cell
+
+        get = self._getter(name, token.pos, scope)
+
+        return lambda namespaces: _value(get(namespaces))
+
+    @staticmethod
+    def _unary(executor: Callable, operand: Code) -> Code:
+        return lambda namespaces: _value(executor(operand(namespaces)))
+
+    @staticmethod
+    def _binary(executor: Callable, left: Code, right: Code) -> Code:
+        return lambda namespaces: _value(executor(left(namespaces), right(namespaces)))
+
+    @staticmethod
+    def _assign(left: Code, right: Code, target: Optional[str], scope: Optional[Scope]) -> Code:
+        if target is not None and resolve(scope, target)[0] == ARGUMENT:
+            # argument is always in the top namespace, so the nearest
+            # namespace containing it is the top one
+            def assign_argument(namespaces: NamespaceStack) -> Value:
+                value = right(namespaces)
+                namespaces.head[0][target] = value
+
+                return value
+
+            return assign_argument
+
+        def assign(namespaces: NamespaceStack) -> Value:
+            key = left(namespaces)
+            value = right(namespaces)
+            namespaces.set(key, value)
+
+            return value
+
+        return assign
+
+    def _call(self, token: Token, args: Tuple[Code, ...], scope: Optional[Scope]) -> Code:
+        pos = token.pos
+        get = self._getter(token.value.name, pos, scope)
+
+        def call(namespaces: NamespaceStack) -> Value:
+            values = [arg(namespaces) for arg in args]
+            func = get(namespaces)
+
+            try:
+                return _value(func(*values))
+            except (ArgumentsError, BudgetExceededError) as exc:
+                raise type(exc)(str(exc), pos) from None
+            except PyCalcError as exc:
+                raise exc from None
+            except Exception as exc:
+                raise ExternalFunctionError(str(exc), pos)
+
+        return call
+
+    def _funcdef(self, token: Token, scope: Optional[Scope]) -> Code:
+        name = token.value.name
+        fargs = [arg.value for arg in token.value.args]
+        body = self.compile(token.value.body, Scope(scope, token))
+        nested = scope is not None
+
+        def funcdef(namespaces: NamespaceStack) -> Value:
+            captured = namespaces.copy()
+
+            if nested:
+                # the top namespace is the arguments of the function
+                # this one is defined in
+                captured.cells = namespaces.cells + (namespaces.head[0],)
+
+            func = self._spawn_function(
+                namespace=captured,
+                name=name,
+                fargs=fargs,
+                body=body
+            )
+
+            if name:
+                namespaces.set(name, func)
+
+            return func
+
+        return funcdef
@@ -1,21 +1,121 @@
+import asyncio
 import operator
+from inspect import isawaitable
 from functools import reduce
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple, Union, List
+from typing import (Callable, Dict, FrozenSet, Generator, Hashable, Optional, Tuple, Union, List, Iterable,
+                    Mapping, Sequence)
 
 from pycalc.lex import tokenizer as _tokenizer
-from pycalc.stack import builder
-from pycalc.tokentypes.tokens import Token, Tokens, Function
-from pycalc.tokentypes.types import (TokenKind, TokenType, Stack, Namespace, Number,
+from pycalc.interpreter import batch, budget as _budget, memo as _memo
+from pycalc.interpreter.cache import ProgramCache, program_size
+from pycalc.interpreter.scriptcache import ScriptCache, file_digest
+from pycalc.stack import builder, optimizer as _optimizer
+from pycalc.tokentypes.tokens import Token, Function
+from pycalc.tokentypes.types import (TokenKind, TokenType, Stack, Namespace, FrozenNamespace, Number,
                                      NamespaceValue, ArgumentsError, NameNotFoundError,
                                      InvalidSyntaxError, ExternalFunctionError,
-                                     PyCalcError, NoCodeError)
+                                     BudgetExceededError, PyCalcError, NoCodeError)
 
 
 Value = Union[Number, Function]
 
+# calls interpret_async() makes between giving the control back to the
+# event loop
+YIELD_EVERY = 1000
+
+
+class Call:
+    """
+    Call of the function made by the frame
+    """
+
+    __slots__ = ("func", "args", "pos")
+
+    def __init__(self, func: Callable, args: list, pos: Tuple[int, int]):
+        self.func = func
+        self.args = args
+        self.pos = pos
+
+
+# executes the expression, yields calls those are made by the caller and
+# receives their results. Returns the result of the expression, or the
+# call that gives it
+Frame = Generator[Call, Value, Union[Value, Call]]
+
+
+class Compiled:
+    """
+    Optimized and compiled programs of the same source: names of the
+    namespace the optimizer depends on (see names() of the optimizer),
+    and the programs by what they depend on among these names. Names
+    are None if the optimizer can not tell them, so nothing is reused
+    """
+
+    __slots__ = ("names", "programs", "nbytes")
+
+    def __init__(self, names: Optional[FrozenSet[str]]):
+        self.names = names
+        self.programs: Dict[Hashable, list] = {}
+        self.nbytes = 0
+
+
+class Definition:
+    """
+    Definition of the function of the program. Is kept by the function,
+    so the interpreter spawned it may call it without the python recursion.
+    Scope is the head of the namespaces stack the function was defined
+    in, names the body uses are looked up from it by memo.analyze()
+    """
+
+    __slots__ = ("interpreter", "namespace", "name", "fargs", "body", "scope", "memo", "_droppable")
+
+    def __init__(self, interpreter: "Interpreter", namespace: "NamespaceStack",
+                 name: str, fargs: List[str], body: Stack[Token]):
+        self.interpreter = interpreter
+        self.namespace = namespace
+        self.name = name
+        self.fargs = fargs
+        self.body = body
+        self.scope = namespace.head
+        # None while the function is not analyzed yet, False if it is
+        # not pure
+        self.memo: Union[_memo.Memo, None, bool] = None
+        self._droppable: Optional[bool] = None
+
+    @property
+    def droppable(self) -> bool:
+        """
+        Whether namespace of the call contains nothing but the arguments:
+        the body neither assigns nor defines named functions
+        """
+
+        if self._droppable is None:
+            self._droppable = not any(
+                token.type == TokenType.OP_EQ
+                or (token.type == TokenType.FUNCDEF and token.value.name)
+                for token in self.body
+            )
+
+        return self._droppable
+
+
+class NamespaceStack:
+    """
+    Stack of namespaces, kept as a linked chain of immutable links
+    (namespace, link below it). Links are never changed, so a copy just
+    shares the chain: it takes no time and no memory no matter how deep
+    the stack is. Pushing and popping namespaces moves the head of this
+    stack only, the namespaces themselves are shared (as they were by
+    copies of a list)
+    """
+
+    __slots__ = ("head",)
+
+    def __init__(self, namespaces: Iterable[Namespace] = ()):
+        self.head: Optional[tuple] = None
+        self.add_namespaces(*namespaces)
 
-class NamespaceStack(Stack[dict]):
     def add_namespaces(self, *namespaces: Namespace):
         for namespace in namespaces:
             self.append(namespace)
@@ -27,23 +127,72 @@ class NamespaceStack(Stack[dict]):
         self.add_namespace(namespace)
         return self
 
+    def append(self, namespace: Namespace):
+        self.head = (namespace, self.head)
+
+    def pop(self) -> Namespace:
+        namespace, self.head = self.head
+
+        return namespace
+
+    @property
+    def top(self) -> Namespace:
+        return self.head[0]
+
     def get(self, var: str) -> NamespaceValue:
-        for namespace in self[::-1]:
+        link = self.head
+
+        while link is not None:
+            namespace, link = link
+
             if var in namespace:
                 return namespace[var]
 
         raise NameNotFoundError(var, (-1, -1))
 
     def set(self, key: str, value: NamespaceValue):
-        for namespace in self[::-1]:
+        link = self.head
+        above = None
+
+        while link is not None:
+            namespace, link = link
+
             if key in namespace:
+                if type(namespace) is FrozenNamespace and above is not None:
+                    # the name is shadowed by the namespace above instead
+                    namespace = above
+
                 namespace[key] = value
-                break
-        else:
-            self.top[key] = value
+                return
+
+            above = namespace
+
+        self.top[key] = value
 
     def copy(self) -> "NamespaceStack":
-        return NamespaceStack(super().copy())
+        stack = NamespaceStack()
+        stack.head = self.head
+
+        return stack
+
+    def __iter__(self):
+        # from the bottom to the top, as a list would be iterated
+        namespaces = []
+        link = self.head
+
+        while link is not None:
+            namespace, link = link
+            namespaces.append(namespace)
+
+        return reversed(namespaces)
+
+    def __len__(self):
+        length, link = 0, self.head
+
+        while link is not None:
+            length, link = length + 1, link[1]
+
+        return length
 
     def __enter__(self):
         pass
@@ -52,6 +201,123 @@ class NamespaceStack(Stack[dict]):
         self.pop()
 
 
+class _FrameState:
+    """
+    Frame on the explicit calls stack: the frame itself, position of
+    the call made it, positions of the first and of the last calls in
+    tail position those replaced it, namespaces stack the frame's
+    function pushed its namespace to, namespaces stacks to pop when the
+    frame is over, memo keys of the calls the result of the frame is
+    the result of, and whether the frame is a call counted in depth of
+    the budget (frames of steps of external functions are not)
+    """
+
+    __slots__ = ("frame", "pos", "first_tail_pos", "tail_pos", "namespace", "droppable", "pending",
+                 "memo_keys", "counted")
+
+    def __init__(self, frame: Optional[Frame], pos: Optional[Tuple[int, int]]):
+        self.frame = frame
+        self.pos = pos
+        self.first_tail_pos: Optional[Tuple[int, int]] = None
+        self.tail_pos: Optional[Tuple[int, int]] = None
+        self.namespace: Optional[NamespaceStack] = None
+        self.droppable = False
+        self.pending: List[NamespaceStack] = []
+        self.memo_keys: List[_memo.Key] = []
+        self.counted = True
+
+    def enter(self, definition: Definition, frame: Frame):
+        self.frame = frame
+        self.namespace = definition.namespace
+        self.droppable = definition.droppable
+
+    def release(self):
+        """
+        The frame is replaced by its tail call
+        """
+
+        if self.namespace is not None:
+            if self.droppable:
+                self.namespace.pop()
+            else:
+                self.pending.append(self.namespace)
+
+        self.namespace = None
+
+    def leave(self):
+        self.release()
+
+        while self.pending:
+            self.pending.pop().pop()
+
+
+class Prepared:
+    """
+    Program prepared by Interpreter.prepare() to be evaluated many times
+    with different values of its parameters. It is built, optimized and
+    (by the compiling interpreters) compiled once. Namespace it was
+    prepared with is copied into the frozen one, so its names give the
+    same values on every evaluation, no matter what happens to the
+    namespace later.
+
+    Evaluations share nothing they may change: parameters, and the names
+    the program binds, are kept in the globals namespace created for
+    every evaluation
+    """
+
+    __slots__ = ("code", "params", "_interpreter", "_program", "_builtins", "_plan")
+
+    def __init__(self, interpreter: "Interpreter", code: str, params: Tuple[str, ...],
+                 program: list, builtins: FrozenNamespace, plan: Optional[batch.Plan] = None):
+        self.code = code
+        self.params = params
+        self._interpreter = interpreter
+        self._program = program
+        self._builtins = builtins
+        self._plan = plan
+
+    def evaluate(self, *values: Value, **bindings: Value) -> Value:
+        """
+        Executes the program with the parameters bound to the values
+        (in order of the parameters) and to the bindings (by names)
+        """
+
+        if len(values) > len(self.params):
+            raise TypeError(f"expected {len(self.params)} parameters, got {len(values)}")
+
+        given = dict(zip(self.params, values))
+
+        for name, value in bindings.items():
+            if name not in self.params:
+                raise TypeError(f"unknown parameter: {name}")
+            elif name in given:
+                raise TypeError(f"parameter is given twice: {name}")
+
+            given[name] = value
+
+        if len(given) != len(self.params):
+            missing = ", ".join(name for name in self.params if name not in given)
+            raise TypeError(f"missing parameters: {missing}")
+
+        namespaces = NamespaceStack()
+        namespaces.add_namespaces(self._builtins, given)
+
+        return self._interpreter._run(self._program, namespaces)
+
+    def evaluate_columns(self, columns: Mapping[str, Sequence], chunksize: int = batch.CHUNKSIZE) -> list:
+        """
+        Evaluates the program for every row of the columns (values of the
+        parameters by their names). Gives the same results as evaluate()
+        called for every row, but a single expression is executed once
+        per chunk of rows, for whole columns (see batch.evaluate_columns())
+        """
+
+        return batch.evaluate_columns(self._plan, self.params, self.evaluate, columns, chunksize)
+
+    def __repr__(self):
+        return f"Prepared({self.code!r}, params={self.params!r})"
+
+
 class ABCInterpreter(ABC):
     @abstractmethod
     def interpret(self, code: str, namespace: Namespace) -> Value:
@@ -96,49 +362,226 @@ class Interpreter(ABCInterpreter):
     def __init__(self,
                  tokenize: Optional[_tokenizer.ABCTokenizer] = None,
                  stackbuilder: Optional[builder.ABCBuilder] = None,
+                 optimizer: Optional[_optimizer.ABCOptimizer] = None,
+                 cache: Optional[ProgramCache] = None,
+                 memo: Optional[_memo.MemoCache] = None,
+                 pure: Iterable[Callable] = (),
                  ):
-        self.tokenizer = tokenize or _tokenizer.Tokenizer()
+        self.tokenizer = tokenize or _tokenizer.RegexTokenizer()
         self.stackbuilder = stackbuilder or builder.SortingStationBuilder()
+        self.optimizer = optimizer or _optimizer.ConstantFolder(
+            executors=self.executors,
+            unary_executors=self.unary_executors
+        )
+        # built programs by their sources
+        self.cache = cache if cache is not None else ProgramCache()
+        # optimized and compiled programs by their sources (see Compiled)
+        self.compiled = ProgramCache(maxsize=self.cache.maxsize, maxbytes=self.cache.maxbytes)
+        # results of the pure functions of programs. Functions those use
+        # nothing but the pure ones (by ids) are pure too
+        self.memo = memo if memo is not None else _memo.MemoCache()
+        self.pure = {id(func): func for func in pure}
 
     def interpret(self, code: str, namespace: Namespace) -> Value:
         """
         Currently parses only one-line expressions
         """
 
-        tokens = self.tokenizer.tokenize(code)
-        stacks = self.stackbuilder.build(tokens)
+        program = self._compiled(code, namespace)
         namespaces = NamespaceStack()
         # empty namespace especially for global namespace
         # because default one must not be overridden by
         # global namespace of code
         namespaces.add_namespaces(namespace, {})
 
+        return self._run(program, namespaces)
+
+    def prepare(self, code: str, namespace: Namespace, params: Sequence[str] = (),
+                program: Optional[List[Stack[Token]]] = None) -> Prepared:
+        """
+        Prepares the code to be evaluated many times (see Prepared).
+        Parameters are the names the code uses, those are given on every
+        evaluation instead of being taken from the namespace. Program is
+        the code built already (for example, loaded by load_program()),
+        if it is given, the code is not built again
+        """
+
+        stacks = program if program is not None else self._build(code)
+        params = tuple(params)
+        # parameters are unknown, so they are hidden from the optimizer
+        builtins = FrozenNamespace((name, value) for name, value in namespace.items() if name not in params)
+        stacks = self.optimizer.optimize(stacks, builtins)
+        plan = batch.plan(stacks, builtins, params, self.executors, self.unary_executors, self.pure)
+
+        return Prepared(self, code, params, list(self._compile_program(stacks)), builtins, plan)
+
+    def interpret_stream(self, stream: Iterable[str], namespace: Namespace) -> Value:
+        """
+        Same as interpret(), but takes code by lines (for example, from
+        a file object). Every line is executed right after it is parsed,
+        so nothing is kept in memory except of the current line
+        """
+
+        lines = self.tokenizer.tokenize_stream(stream)
+        stacks = self.optimizer.optimize_stream(self.stackbuilder.build_stream(lines), namespace)
+        namespaces = NamespaceStack()
+        namespaces.add_namespaces(namespace, {})
+
         return self._interpreter(stacks, namespaces)
 
-    def _interpreter(self, exprs: List[Stack[Token]], namespaces: NamespaceStack) -> Value:
-        if not exprs:
+    def interpret_file(self, filename: str, namespace: Namespace,
+                       cache: Optional[ScriptCache] = None) -> Value:
+        """
+        Same as interpret_stream() for the script file. If cache is
+        given, built program is loaded from it instead of tokenizing
+        and building while the script is unchanged, and is stored into
+        it otherwise
+        """
+
+        if cache is None:
+            with open(filename) as fd:
+                return self.interpret_stream(fd, namespace)
+
+        digest = file_digest(filename)
+        program = cache.load(filename, digest)
+        namespaces = NamespaceStack()
+        namespaces.add_namespaces(namespace, {})
+
+        if program is not None:
+            return self._interpreter(self.optimizer.optimize_stream(program, namespace), namespaces)
+
+        with open(filename) as fd:
+            lines = self.tokenizer.tokenize_stream(fd)
+            program = cache.storing(filename, digest, self.stackbuilder.build_stream(lines))
+
+            return self._interpreter(self.optimizer.optimize_stream(program, namespace), namespaces)
+
+    async def interpret_async(self, code: str, namespace: Namespace, yield_every: int = YIELD_EVERY) -> Value:
+        """
+        Same as interpret(), but for the event loop of asyncio. External
+        functions may return awaitables (for example, be coroutine
+        functions), those are awaited. The control is given back to
+        the loop every yield_every calls, so long loops do not block
+        other tasks. Functions those call their callbacks many times
+        (like while or map) do not block it either, if they tell the
+        calls they make by their steps attribute (see _execute_async())
+        """
+
+        stacks = self.optimizer.optimize(self._build(code), namespace)
+        namespaces = NamespaceStack()
+        namespaces.add_namespaces(namespace, {})
+
+        return await self._run_async(stacks, namespaces, yield_every)
+
+    def _build(self, code: str) -> List[Stack[Token]]:
+        stacks = self.cache.get(code)
+
+        if stacks is None:
+            stacks = self.stackbuilder.build(self.tokenizer.tokenize(code))
+            self.cache.put(code, stacks)
+
+        return stacks
+
+    def _compiled(self, code: str, namespace: Namespace) -> Iterable:
+        """
+        Optimized and compiled program of the code. Cached while the
+        optimizer tells what it depends on in the namespace, and that
+        is the same
+        """
+
+        stacks = self._build(code)
+        compiled = self.compiled.get(code)
+
+        if compiled is None:
+            compiled = Compiled(self.optimizer.names(stacks))
+            self.compiled.put(code, compiled, 0)
+
+        if compiled.names is None:
+            return self._compile_program(self.optimizer.optimize(stacks, namespace))
+
+        dependencies = self.optimizer.dependencies(compiled.names, namespace)
+        program = compiled.programs.get(dependencies)
+
+        if program is None:
+            optimized = self.optimizer.optimize(stacks, namespace)
+            program = compiled.programs[dependencies] = list(self._compile_program(optimized))
+
+            if self.compiled.maxbytes is not None:
+                # compiled code is taken as large as the stacks it is
+                # compiled from
+                compiled.nbytes += program_size(optimized)
+                self.compiled.put(code, compiled, compiled.nbytes)
+
+        return program
+
+    def _interpreter(self, exprs: Iterable[Stack[Token]], namespaces: NamespaceStack) -> Value:
+        return self._run(self._compile_program(exprs), namespaces)
+
+    def _compile_program(self, exprs: Iterable[Stack[Token]]) -> Iterable:
+        """
+        Turns stacks into whatever _interpret_line() executes. Stacks
+        are executed as they are by this interpreter
+        """
+
+        return exprs
+
+    def _run(self, exprs: Iterable, namespaces: NamespaceStack) -> Value:
+        result = no_code = object()
+
+        for expr in exprs:
+            result = self._interpret_line(expr, namespaces)
+
+        if result is no_code:
             raise NoCodeError
 
-        return list(map(lambda expr: self._interpret_line(expr, namespaces), exprs))[-1]
+        return result
+
+    async def _run_async(self, exprs: Iterable[Stack[Token]], namespaces: NamespaceStack,
+                         yield_every: int) -> Value:
+        result = no_code = object()
+
+        for expr in exprs:
+            result = await self._execute_async(self._frame(expr, namespaces, deferred=True), yield_every)
+
+        if result is no_code:
+            raise NoCodeError
+
+        return result
 
     def _interpret_line(self, expression: Stack[Token], namespaces: NamespaceStack) -> Value:
-        stack: Stack[Token] = Stack()
+        return self._execute(self._frame(expression, namespaces))
+
+    def _frame(self, expression: Stack[Token], namespaces: NamespaceStack, deferred: bool = False) -> Frame:
+        """
+        Executes the expression. Calls those may recurse (functions of
+        the program and functions with tail calls) are not made here,
+        but yielded to _execute() that sends their results back. The
+        call giving the result of the whole expression (a call in tail
+        position) is returned instead of being made. If deferred, all
+        the calls are yielded (see _execute_async())
+        """
+
+        # values are kept as they are, without wrapping into tokens.
+        # Their positions are needed for errors only, so they are
+        # recovered from the expression when an error is raised
+        stack: List[Value] = []
+        last = len(expression) - 1
 
         for i, token in enumerate(expression):
             if token.kind in (TokenKind.NUMBER, TokenKind.STRING) \
                     or token.type == TokenType.IDENTIFIER:
-                stack.append(token)
+                stack.append(token.value)
             elif token.type == TokenType.VAR:
                 try:
-                    stack.append(self._token(namespaces.get(token.value), token.pos))
+                    value = namespaces.get(token.value)
                 except NameNotFoundError as exc:
                     raise NameNotFoundError(str(exc), token.pos) from None
 
+                stack.append(int(value) if isinstance(value, int) else value)
+
             elif token.kind == TokenKind.UNARY_OPERATOR:
-                stack.append(self._token(
-                    self.unary_executors[token.type](stack.pop().value),  # noqa
-                    token.pos
-                ))
+                value = self.unary_executors[token.type](stack.pop())
+                stack.append(int(value) if isinstance(value, int) else value)
 
             elif token.type == TokenType.OP_SEMICOLON:
                 if len(stack) > 1:
@@ -147,15 +590,13 @@ class Interpreter(ABCInterpreter):
                 stack.pop()
             elif token.type == TokenType.OP_EQ:
                 right, left = stack.pop(), stack.pop()
-                namespaces.set(left.value, right.value)
+                namespaces.set(left, right)
                 stack.append(right)
 
             elif token.kind == TokenKind.OPERATOR:
                 right, left = stack.pop(), stack.pop()
-                stack.append(self._token(
-                    self.executors[token.type](left.value, right.value),
-                    token.pos
-                ))
+                value = self.executors[token.type](left, right)
+                stack.append(int(value) if isinstance(value, int) else value)
             elif token.type == TokenType.FUNCCALL:
                 try:
                     func = namespaces.get(token.value.name)
@@ -164,16 +605,21 @@ class Interpreter(ABCInterpreter):
 
                 stack, args = self._get_func_args(token.value.argscount, stack)
 
-                try:
-                    call_result = func(*(arg.value for arg in args))
-                except ArgumentsError as exc:
-                    raise ArgumentsError(str(exc), token.pos) from None
-                except PyCalcError as exc:
-                    raise exc from None
-                except Exception as exc:
-                    raise ExternalFunctionError(str(exc), token.pos)
-
-                stack.append(self._token(call_result, token.pos))
+                if i == last and not stack:
+                    return Call(func, args, token.pos)
+                elif deferred or self._is_own(func) or hasattr(func, "tailcall"):
+                    value = yield Call(func, args, token.pos)
+                else:
+                    try:
+                        value = func(*args)
+                    except (ArgumentsError, BudgetExceededError) as exc:
+                        raise type(exc)(str(exc), token.pos) from None
+                    except PyCalcError as exc:
+                        raise exc from None
+                    except Exception as exc:
+                        raise ExternalFunctionError(str(exc), token.pos)
+
+                stack.append(int(value) if isinstance(value, int) else value)
             elif token.type == TokenType.FUNCDEF:
                 func = self._spawn_function(
                     namespace=namespaces.copy(),
@@ -187,12 +633,7 @@ class Interpreter(ABCInterpreter):
                     # is just an empty string
                     namespaces.set(token.value.name, func)
 
-                stack.append(Token(
-                    kind=TokenKind.FUNC,
-                    typeof=TokenType.FUNC,
-                    value=func,
-                    pos=token.pos
-                ))
+                stack.append(func)
             else:
                 raise InvalidSyntaxError(
                     f"unknown token: {token.type.name}({token.value})",
@@ -202,65 +643,432 @@ class Interpreter(ABCInterpreter):
         result = stack.pop()
 
         if stack:
-            raise InvalidSyntaxError("multiple values left in stack", stack[0].pos)
+            raise InvalidSyntaxError("multiple values left in stack", self._positions(expression)[0])
+
+        return result
+
+    def _execute(self, frame: Frame) -> Value:
+        """
+        Executes the frame together with all the calls it yields. Frames
+        of the called functions are kept in the explicit stack instead
+        of the python one, and a call in tail position replaces the
+        frame that made it, so the depth of recursion is limited by
+        memory only.
+
+        Namespace of the replaced frame is popped right away if the
+        function can not assign names in it (so it only ever contains
+        the arguments, those are shadowed by any following frame of the
+        same function). Otherwise it is popped when the call returns,
+        exactly as it would be without replacing. Errors get the same
+        positions as if every call was made by the python recursion
+        """
+
+        frames: List[_FrameState] = []
+        current = _FrameState(frame, None)
+        value = None
+        # budget of the evaluation, see budget.Budget
+        meter = _budget.current()
 
-        return result.value
+        while True:
+            try:
+                call = current.frame.send(value)
+                tail = False
+            except StopIteration as stop:
+                call, tail = stop.value, True
+            except BaseException as exc:
+                raise self._unwind(exc, current, frames, meter)
+
+            if type(call) is not Call:
+                value = call
+            else:
+                try:
+                    func, args = self._select(call.func, call.args)
+                    definition = func.definition if self._is_own(func) else None
+                    key = None
+
+                    if definition is not None:
+                        self._check_args(definition.fargs, args)
+                        key = self._memo_key(definition, args)
+                        value = None if key is None else self.memo.get(key)
+
+                        if value is not None:
+                            # the result is known, so nothing is called
+                            definition = None
+                        elif meter is not None:
+                            meter.countdown -= 1
+
+                            if meter.countdown <= 0:
+                                meter.check(not tail)
+                            if not tail:
+                                meter.depth += 1
+                    else:
+                        value = func(*args)
+                        value = int(value) if isinstance(value, int) else value
+                except BaseException as exc:
+                    raise self._unwind(self._locate_error(exc, call.pos), current, frames, meter)
+
+                if definition is not None:
+                    if tail:
+                        current.release()
+                        current.first_tail_pos = current.first_tail_pos or call.pos
+                        current.tail_pos = call.pos
+                    else:
+                        frames.append(current)
+                        current = _FrameState(None, call.pos)
+
+                    if key is not None:
+                        current.memo_keys.append(key)
+
+                    definition.namespace.append(self._get_args_namespace(definition.fargs, args))
+                    current.enter(definition, self._frame(definition.body, definition.namespace))
+                    value = None
+                    continue
+                elif not tail:
+                    continue
+
+            # the frame is over, its result is in the value
+            current.leave()
+
+            for key in current.memo_keys:
+                self.memo.put(key, value)
+
+            if not frames:
+                return value
+
+            if meter is not None and current.counted:
+                meter.depth -= 1
+
+            current = frames.pop()
+
+    async def _execute_async(self, frame: Frame, yield_every: int) -> Value:
+        """
+        Same as _execute(), but all the calls are made here (frames are
+        deferred ones), so awaitables returned by external functions are
+        awaited, and the control is given back to the event loop every
+        yield_every calls.
+
+        Steps attribute of the external function calling its callbacks
+        receives the same arguments and returns the generator yielding
+        the calls it makes (callables and their arguments), receiving
+        their results and returning the result of the function. Such
+        a generator is executed as a frame, so its calls are made here
+        too (and errors are the same as the function itself gives)
+        """
+
+        frames: List[_FrameState] = []
+        current = _FrameState(frame, None)
+        value = None
+        # budget of the evaluation, see budget.Budget
+        meter = _budget.current()
+        countdown = yield_every
+
+        while True:
+            try:
+                call = current.frame.send(value)
+                tail = False
+            except StopIteration as stop:
+                call, tail = stop.value, True
+            except BaseException as exc:
+                raise self._unwind(exc, current, frames, meter)
+
+            if type(call) is not Call:
+                value = call
+            else:
+                countdown -= 1
+
+                if countdown <= 0:
+                    countdown = yield_every
+                    await asyncio.sleep(0)
+
+                try:
+                    func, args = self._select(call.func, call.args)
+                    definition = func.definition if self._is_own(func) else None
+                    steps = None
+                    key = None
+
+                    if definition is not None:
+                        self._check_args(definition.fargs, args)
+                        key = self._memo_key(definition, args)
+                        value = None if key is None else self.memo.get(key)
+
+                        if value is not None:
+                            definition = None
+                    elif hasattr(func, "steps"):
+                        steps = func.steps(*args)
+                    else:
+                        value = func(*args)
+
+                        if isawaitable(value):
+                            value = await value
+
+                        value = int(value) if isinstance(value, int) else value
+
+                    if meter is not None and definition is not None:
+                        meter.countdown -= 1
+
+                        if meter.countdown <= 0:
+                            meter.check(not tail)
+                        if not tail:
+                            meter.depth += 1
+                except BaseException as exc:
+                    raise self._unwind(self._locate_error(exc, call.pos), current, frames, meter)
+
+                if definition is not None or steps is not None:
+                    if tail:
+                        current.release()
+                        current.first_tail_pos = current.first_tail_pos or call.pos
+                        current.tail_pos = call.pos
+                    else:
+                        frames.append(current)
+                        current = _FrameState(None, call.pos)
+
+                    if key is not None:
+                        current.memo_keys.append(key)
+
+                    if steps is not None:
+                        current.frame = self._steps_frame(steps, call.pos)
+                        current.counted = current.counted and tail
+                    else:
+                        definition.namespace.append(self._get_args_namespace(definition.fargs, args))
+                        current.enter(definition, self._frame(definition.body, definition.namespace, True))
+
+                    value = None
+                    continue
+                elif not tail:
+                    continue
+
+            current.leave()
+
+            for key in current.memo_keys:
+                self.memo.put(key, value)
+
+            if not frames:
+                return value
+
+            if meter is not None and current.counted:
+                meter.depth -= 1
+
+            current = frames.pop()
+
+    @staticmethod
+    def _steps_frame(steps: Generator, pos: Tuple[int, int]) -> Frame:
+        """
+        Frame of the steps generator of the external function: its calls
+        are made at the position of the call of the function itself
+        """
+
+        value = None
+
+        while True:
+            try:
+                func, args = steps.send(value)
+            except StopIteration as stop:
+                result = stop.value
+                return int(result) if isinstance(result, int) else result
+
+            value = yield Call(func, list(args), pos)
+
+    def _is_own(self, func: Callable) -> bool:
+        """
+        Whether the function is defined by the program executed by this
+        interpreter, so it can be called by _execute()
+        """
+
+        return type(func) is Function and func.definition is not None \
+            and func.definition.interpreter is self
+
+    def _memo_key(self, definition: Definition, args: Sequence[Value]) -> Optional[_memo.Key]:
+        """
+        Key of the call in the memo, or None if results of the function are
+        not cached: it is not pure, it calls nothing (see Memo), or some of
+        the arguments can not be a part of the key. Function is analyzed on
+        its first call, and is not pure anymore once some of the names it
+        uses are changed
+        """
+
+        memo = definition.memo
+
+        if memo is False or self.memo.maxsize <= 0:
+            return None
+        elif memo is None:
+            memo = definition.memo = _memo.analyze(definition, self, self.pure) or False
+
+            if memo is False or memo.leaf:
+                return None
+        elif memo.leaf:
+            return None
+        elif not memo.valid():
+            definition.memo = False
+            return None
+
+        return memo.key(args)
+
+    @staticmethod
+    def _select(func: Callable, args: list) -> Tuple[Callable, list]:
+        """
+        Functions those call one of their arguments in tail position (like
+        if or branch) may tell which one they would call: tailcall
+        attribute of such a function receives the same arguments and
+        returns the pair of callable and its arguments, or None if the
+        function must be called itself. Errors mean the same
+        """
+
+        while type(func) is not Function:
+            tailcall = getattr(func, "tailcall", None)
+
+            if tailcall is None:
+                break
+
+            try:
+                selected = tailcall(*args)
+            except Exception:
+                # let the function itself fail
+                break
+
+            if selected is None:
+                break
+
+            func, args = selected
+
+        return func, args
+
+    def _unwind(self, exc: BaseException, current: "_FrameState",
+                frames: List["_FrameState"], meter: Optional[_budget.Meter] = None) -> BaseException:
+        """
+        Pops namespaces of all the frames (and their depth from the budget),
+        and locates the error at the calls those made them, from the
+        innermost to the outermost one
+        """
+
+        while True:
+            if current.tail_pos is not None:
+                # calls in between just pass the error through, except
+                # of the arguments error, that is located at every call
+                exc = self._locate_error(exc, current.tail_pos)
+                exc = self._locate_error(exc, current.first_tail_pos)
+
+            current.leave()
+
+            if current.pos is None:
+                return exc
+
+            exc = self._locate_error(exc, current.pos)
+
+            if meter is not None and current.counted:
+                meter.depth -= 1
+
+            current = frames.pop()
+
+    @staticmethod
+    def _locate_error(exc: BaseException, pos: Tuple[int, int]) -> BaseException:
+        """
+        The error as the call at the position raises it
+        """
+
+        if isinstance(exc, (ArgumentsError, BudgetExceededError)):
+            return type(exc)(str(exc), pos)
+        elif isinstance(exc, PyCalcError) or not isinstance(exc, Exception):
+            return exc
+
+        error = ExternalFunctionError(str(exc), pos)
+        error.__context__ = exc
+
+        return error
+
+    def _positions(self, expression: Stack[Token]) -> List[Tuple[int, int]]:
+        """
+        Positions of the values left in the stack after the expression
+        is executed: positions of the tokens those gave them. Stack
+        effects of the tokens are replayed, nothing is executed
+        """
+
+        positions: List[Tuple[int, int]] = []
+
+        for token in expression:
+            if token.kind in (TokenKind.NUMBER, TokenKind.STRING) \
+                    or token.type in (TokenType.IDENTIFIER, TokenType.VAR, TokenType.FUNCDEF):
+                positions.append(token.pos)
+            elif token.kind == TokenKind.UNARY_OPERATOR:
+                positions[-1] = token.pos
+            elif token.type == TokenType.OP_SEMICOLON:
+                positions.pop()
+            elif token.type == TokenType.OP_EQ:
+                # assignment gives the right value itself
+                right = positions.pop()
+                positions[-1] = right
+            elif token.kind == TokenKind.OPERATOR:
+                positions.pop()
+                positions[-1] = token.pos
+            elif token.type == TokenType.FUNCCALL:
+                positions, _ = self._get_func_args(token.value.argscount, positions)
+                positions.append(token.pos)
+
+        return positions
 
     def _spawn_function(self,
                         namespace: NamespaceStack,
                         name: str,
                         fargs: List[str],
                         body: Stack[Token]) -> Function:
+        definition = Definition(self, namespace, name, fargs, body)
+
         def real_function(*args) -> Number:
-            if not fargs and args:
-                raise ArgumentsError("function takes no arguments", (-1, -1))
-            elif len(fargs) != len(args):
-                text = (
-                    "not enough arguments",
-                    "too much arguments"
-                )[len(fargs) < len(args)]
-
-                raise ArgumentsError(
-                    f"{text}: expected {len(fargs)}, got {len(args)}",
-                    (-1, -1)
-                )
+            self._check_args(fargs, args)
+            key = self._memo_key(definition, args)
+
+            if key is not None:
+                result = self.memo.get(key)
+
+                if result is not None:
+                    return result
+
+            meter = _budget.current()
+
+            if meter is not None:
+                meter.countdown -= 1
+
+                if meter.countdown <= 0:
+                    meter.check()
+
+                meter.depth += 1
 
             args_namespace = self._get_args_namespace(fargs, args)
 
-            with namespace.with_add_namespace(args_namespace):
-                return self._interpret_line(body, namespace)
+            try:
+                with namespace.with_add_namespace(args_namespace):
+                    result = self._interpret_line(body, namespace)
+            finally:
+                if meter is not None:
+                    meter.depth -= 1
+
+            if key is not None:
+                self.memo.put(key, result)
+
+            return result
 
         return Function(
             name=f"{name or '<lambda>'}({','.join(fargs)})",
-            target=real_function
+            target=real_function,
+            definition=definition
         )
 
     @staticmethod
-    def _token(num: Number, pos: Tuple[int, int]) -> Token:
-        if isinstance(num, int):
-            return Token(
-                kind=TokenKind.NUMBER,
-                typeof=TokenType.INTEGER,
-                value=int(num),
-                pos=pos
-            )
-        elif isinstance(num, float):
-            return Token(
-                kind=TokenKind.NUMBER,
-                typeof=TokenType.FLOAT,
-                value=num,
-                pos=pos
-            )
-        else:
-            return Token(
-                kind=TokenKind.OTHER,
-                typeof=TokenType.OTHER,
-                value=num,
-                pos=pos
+    def _check_args(fargs: List[str], args: Sequence[Value]):
+        if not fargs and args:
+            raise ArgumentsError("function takes no arguments", (-1, -1))
+        elif len(fargs) != len(args):
+            text = (
+                "not enough arguments",
+                "too much arguments"
+            )[len(fargs) < len(args)]
+
+            raise ArgumentsError(
+                f"{text}: expected {len(fargs)}, got {len(args)}",
+                (-1, -1)
             )
 
     @staticmethod
-    def _get_func_args(argscount: int, stack: Stack[Token]) -> Tuple[Stack[Token], Tokens]:
+    def _get_func_args(argscount: int, stack: list) -> Tuple[list, list]:
         if not argscount:
             return stack, []
 
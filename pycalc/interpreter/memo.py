@@ -0,0 +1,309 @@
+import os
+import marshal
+from hashlib import sha256
+from threading import Lock
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from pycalc import __version__
+from pycalc.interpreter.scriptcache import dump_program
+from pycalc.tokentypes.tokens import Token, Function
+from pycalc.tokentypes.types import TokenType, Stack
+
+
+Result = Union[int, float, str]
+Key = Tuple[bytes, tuple]
+# namespaces link, the name looked up from it, and the value it gave
+Guard = Tuple[Optional[tuple], str, object]
+
+MAGIC = b"PYCALC-MEMO\x00\x01"
+
+# only immutable values those can be compared and written to disk are
+# taken as arguments and cached as results
+RESULTS = (int, float, str)
+
+_MISSING = object()
+
+
+class MemoInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    currsize: int
+    maxsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.
+
+
+class MemoCache:
+    """
+    Least recently used cache of results of the pure functions of programs
+    (see analyze()), keyed by digests of the functions and their arguments.
+    If path is given, results are loaded from the file when the cache is
+    created, and are written into it by save(), so they survive restarts.
+    Broken or outdated file is just ignored
+    """
+
+    def __init__(self, maxsize: int = 4096, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = self.misses = self.evictions = 0
+        self._results: "OrderedDict[Key, Result]" = OrderedDict()
+        self._lock = Lock()
+
+        if path is not None:
+            self._load(path)
+
+    def get(self, key: Key) -> Optional[Result]:
+        with self._lock:
+            result = self._results.get(key)
+
+            if result is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._results.move_to_end(key)
+
+            return result
+
+    def put(self, key: Key, result: Result):
+        if self.maxsize <= 0 or type(result) not in RESULTS:
+            return
+
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def info(self) -> MemoInfo:
+        with self._lock:
+            return MemoInfo(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                currsize=len(self._results),
+                maxsize=self.maxsize
+            )
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def save(self):
+        """
+        Writes the results into the file the cache was created with.
+        Errors are ignored: the results just will be computed again
+        """
+
+        if self.path is None:
+            return
+
+        with self._lock:
+            results = tuple(self._results.items())
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+            with open(temporary, "wb") as fd:
+                fd.write(MAGIC)
+                marshal.dump(__version__, fd)
+                marshal.dump(results, fd)
+
+            # readers never see a partially written file
+            os.replace(temporary, self.path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+    def _load(self, path: str):
+        try:
+            with open(path, "rb") as fd:
+                if fd.read(len(MAGIC)) != MAGIC or marshal.load(fd) != __version__:
+                    return
+
+                results = marshal.load(fd)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+
+        # the most recently used ones are the last, and survive the
+        # eviction if the file is larger than the cache
+        for key, result in results[-self.maxsize:] if self.maxsize > 0 else ():
+            self._results[key] = result
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key: Key):
+        return key in self._results
+
+
+class Memo:
+    """
+    Pure function as analyze() found it: digest of its body together with
+    everything it uses, and guards - the names those must give the same
+    values for the digest to stay valid. Leaf functions call nothing, so
+    they are cheaper to compute than to look up their results: they are
+    not cached themselves, but their callers are
+    """
+
+    __slots__ = ("digest", "guards", "leaf")
+
+    def __init__(self, digest: bytes, guards: List[Guard], leaf: bool = False):
+        self.digest = digest
+        self.guards = guards
+        self.leaf = leaf
+
+    def valid(self) -> bool:
+        for head, name, value in self.guards:
+            if lookup(head, name) is not value:
+                return False
+
+        return True
+
+    def key(self, args: Sequence) -> Optional[Key]:
+        """
+        Key of the call with the arguments, or None if some of them can
+        not be a part of the key. Floats are keyed by their exact hex
+        representations, as 1.0 == 1 but the results may differ
+        """
+
+        key = []
+
+        for arg in args:
+            if type(arg) is float:
+                key.append((arg.hex(),))
+            elif type(arg) is int or type(arg) is str:
+                key.append(arg)
+            else:
+                return None
+
+        return self.digest, tuple(key)
+
+
+def lookup(head: Optional[tuple], name: str) -> object:
+    """
+    Looks the name up in the namespaces link exactly as the NamespaceStack
+    does, but gives _MISSING instead of raising
+    """
+
+    while head is not None:
+        namespace, head = head
+
+        if name in namespace:
+            return namespace[name]
+
+    return _MISSING
+
+
+def analyze(definition, interpreter: object, pure: Dict[int, Callable],
+            _visiting: Optional[Set[int]] = None) -> Optional[Memo]:
+    """
+    Returns the Memo of the named function of the program (by its
+    interpret.Definition), or None if the function is not pure. The
+    function is pure, if its body (including the bodies of the functions
+    it defines):
+        - assigns nothing and defines no named functions
+        - takes no attributes
+        - uses only numbers, strings, its own arguments, the pure functions
+          (by ids), and the pure functions of the program, those were
+          defined by the same interpreter
+    Names the body uses are looked up in namespaces the function was defined
+    in, as they are at the moment (values of those are guarded)
+    """
+
+    if not definition.name or not isinstance(definition.body, Stack):
+        return None
+
+    free: Set[str] = set()
+    calls: List[str] = []
+
+    if not _free_names(definition.body, set(definition.fargs), free, calls):
+        return None
+
+    visiting = (_visiting or set()) | {id(definition)}
+    head = definition.scope
+    bindings, guards = [], []
+
+    for name in sorted(free):
+        value = lookup(head, name)
+
+        if type(value) in RESULTS:
+            bindings.append((name, repr(value)))
+        elif id(value) in pure and pure[id(value)] is value:
+            code = getattr(value, "__code__", None)
+            bindings.append((
+                name,
+                getattr(value, "__module__", None) or "",
+                getattr(value, "__qualname__", None) or repr(value),
+                code.co_firstlineno if code is not None else -1
+            ))
+        elif type(value) is Function and value.definition is not None \
+                and value.definition.interpreter is interpreter:
+            if id(value.definition) in visiting:
+                # recursion: the function is being analyzed by one of the
+                # callers, those guard its names themselves
+                bindings.append((name, value.definition.name))
+            else:
+                memo = analyze(value.definition, interpreter, pure, visiting)
+
+                if memo is None:
+                    return None
+
+                bindings.append((name, memo.digest))
+                guards.extend(memo.guards)
+        else:
+            return None
+
+        guards.append((head, name, value))
+
+    digest = sha256(marshal.dumps((
+        __version__,
+        type(interpreter).__qualname__,
+        tuple(definition.fargs),
+        dump_program([definition.body]),
+        tuple(bindings)
+    ))).digest()
+
+    return Memo(digest, guards, leaf=not calls)
+
+
+def _free_names(body: Stack[Token], bound: Set[str], free: Set[str], calls: List[str]) -> bool:
+    """
+    Collects names the body uses, those are not its arguments, and names
+    of all the functions it calls. Returns False if the body is not pure
+    by itself
+    """
+
+    for token in body:
+        if token.type in (TokenType.OP_EQ, TokenType.OP_DOT):
+            return False
+        elif token.type == TokenType.VAR:
+            if token.value not in bound:
+                free.add(token.value)
+        elif token.type == TokenType.FUNCCALL:
+            calls.append(token.value.name)
+
+            if token.value.name not in bound:
+                free.add(token.value.name)
+        elif token.type == TokenType.FUNCDEF:
+            if token.value.name:
+                return False
+
+            args = bound | {arg.value for arg in token.value.args}
+
+            if not _free_names(token.value.body, args, free, calls):
+                return False
+
+    return True
@@ -0,0 +1,212 @@
+import os
+import marshal
+import importlib
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Deque, Dict, Iterable, Iterator, Mapping, Optional, Sequence, Union
+
+from pycalc.interpreter import batch
+from pycalc.interpreter.interpret import Interpreter, Prepared, Value
+from pycalc.interpreter.scriptcache import dump_program, load_program
+from pycalc.tokentypes.types import Namespace
+
+
+# namespace itself, or "module:name" reference to it
+NamespaceRef = Union[Namespace, str]
+
+# chunks being evaluated by every worker at once, so a worker always has
+# the next one while the results of the previous one are sent
+_CHUNKS_PER_WORKER = 2
+
+# state of the worker process, set by _initialize()
+_interpreter: Optional[Interpreter] = None
+_namespace: Optional[Namespace] = None
+_prepared: Optional[Prepared] = None
+
+
+class ParallelEvaluator:
+    """
+    Evaluates the code by the pool of worker processes. The code is built
+    once, and is shipped to every worker once, when it starts, as plain
+    data dump_program() gives, so nothing created by the interpreter is
+    pickled. Every worker prepares the program itself (see Prepared).
+
+    Interpreter is the function creating the interpreter of the workers
+    (the class itself, by default), so it must be picklable. Namespace is
+    pickled too, or is given as "module:name" reference to it, those is
+    imported by the workers: namespaces usually have lambdas, those can
+    not be pickled.
+
+    Rows of the columns are split into chunks those are evaluated by
+    the workers (by evaluate_columns() of the prepared program), results
+    are given in order of the rows
+    """
+
+    def __init__(self,
+                 code: str,
+                 namespace: NamespaceRef,
+                 params: Sequence[str] = (),
+                 workers: Optional[int] = None,
+                 interpreter: Callable[[], Interpreter] = Interpreter,
+                 chunksize: int = batch.CHUNKSIZE,
+                 ):
+        local = interpreter()
+        program = local.stackbuilder.build(local.tokenizer.tokenize(code))
+
+        self.params = tuple(params)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_initialize,
+            initargs=(interpreter, namespace, (code, marshal.dumps(dump_program(program)), self.params))
+        )
+        self._window = self.workers * _CHUNKS_PER_WORKER
+
+    def imap_columns(self, columns: Mapping[str, Sequence]) -> Iterator[list]:
+        """
+        Yields results of chunks of rows in order, as soon as they are
+        ready. Columns are the same evaluate_columns() of the Prepared
+        takes
+        """
+
+        chunks = (self._slice(columns, start) for start in range(0, self._length(columns), self.chunksize))
+
+        for future in self._submit(_evaluate, ((chunk,) for chunk in chunks)):
+            yield future.result()
+
+    def evaluate_columns(self, columns: Mapping[str, Sequence], out: Optional[SharedMemory] = None) -> Optional[list]:
+        """
+        Results of all the rows. If the out shared memory is given, workers
+        write results right into it as floats (8 bytes per row), and
+        nothing is returned
+        """
+
+        if out is None:
+            return [value for chunk in self.imap_columns(columns) for value in chunk]
+
+        length = self._length(columns)
+
+        if out.size < length * 8:
+            raise ValueError(f"shared memory of {out.size} bytes is less than {length} floats")
+
+        chunks = (
+            (self._slice(columns, start), out.name, start)
+            for start in range(0, length, self.chunksize)
+        )
+
+        for future in self._submit(_evaluate_into, chunks):
+            future.result()
+
+        return None
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _length(self, columns: Mapping[str, Sequence]) -> int:
+        return batch.columns_length(columns, self.params)
+
+    def _slice(self, columns: Mapping[str, Sequence], start: int) -> Dict[str, Sequence]:
+        return {name: _picklable(column[start:start + self.chunksize]) for name, column in columns.items()}
+
+    def _submit(self, func: Callable, calls: Iterable[tuple]) -> Iterator[Future]:
+        """
+        Submits the calls and yields their futures in order. No more than
+        the window of calls is submitted at once, so columns are not copied
+        for all the workers in advance
+        """
+
+        pending: Deque[Future] = deque()
+
+        for args in calls:
+            pending.append(self._executor.submit(func, *args))
+
+            if len(pending) >= self._window:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def interpret_many(codes: Iterable[str], namespace: NamespaceRef, workers: Optional[int] = None,
+                   interpreter: Callable[[], Interpreter] = Interpreter, chunksize: int = 16) -> Iterator[Value]:
+    """
+    Interprets independent scripts by the pool of worker processes, and
+    yields their results in order. Every script is executed with its own
+    copy of the namespace. Results must be picklable, so scripts can not
+    give functions
+    """
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize,
+                             initargs=(interpreter, namespace, None)) as executor:
+        yield from executor.map(_interpret, codes, chunksize=chunksize)
+
+
+def _initialize(interpreter: Callable[[], Interpreter], namespace: NamespaceRef, program: Optional[tuple]):
+    global _interpreter, _namespace, _prepared
+
+    if isinstance(namespace, str):
+        module, _, name = namespace.partition(":")
+        namespace = getattr(importlib.import_module(module), name)
+
+    _interpreter = interpreter()
+    _namespace = namespace
+
+    if program is not None:
+        code, data, params = program
+        _prepared = _interpreter.prepare(code, namespace, params, program=load_program(marshal.loads(data)))
+
+
+def _interpret(code: str) -> Value:
+    return _interpreter.interpret(code, dict(_namespace))
+
+
+def _evaluate(columns: Dict[str, Sequence]) -> list:
+    return _prepared.evaluate_columns(columns)
+
+
+def _evaluate_into(columns: Dict[str, Sequence], name: str, start: int):
+    results = array("d", _prepared.evaluate_columns(columns))
+    memory = _attach(name)
+
+    try:
+        view = memory.buf.cast("d")
+        view[start:start + len(results)] = results
+        view.release()
+    finally:
+        memory.close()
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 the memory is tracked by every process
+        # attached to it, and is reported as leaked when it exits
+        memory = SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+
+        return memory
+
+
+def _picklable(column: Sequence) -> Sequence:
+    """
+    Memory views can not be pickled, so they are sent as arrays (or lists,
+    if there is no array of their format)
+    """
+
+    if not isinstance(column, memoryview):
+        return column
+    elif column.ndim == 1 and len(column.format) == 1 and column.format in "bBhHiIlLqQfd":
+        return array(column.format, column.tobytes())
+
+    return column.tolist()
@@ -0,0 +1,253 @@
+import ast
+from typing import Dict, List, Optional, Tuple
+
+from pycalc.interpreter.closures import (ClosureInterpreter, Code, Scope, ARGUMENT, CELL,
+                                         resolve, _NotCompilable, _value)
+from pycalc.interpreter.interpret import NamespaceStack, Value
+from pycalc.tokentypes.tokens import Token
+from pycalc.tokentypes.types import (TokenKind, TokenType, Stack, ArgumentsError,
+                                     ExternalFunctionError, BudgetExceededError, PyCalcError)
+
+# name of the source in tracebacks of the compiled code
+FILENAME = "<pycalc>"
+
+# the only local name of the compiled code. Variables of the program
+# are kept in namespaces, so they never clash with it
+_NAMESPACES = "namespaces"
+
+_UNARY_OPERATORS = {
+    TokenType.UN_POS: ast.UAdd,
+    TokenType.UN_NEG: ast.USub,
+}
+_BINARY_OPERATORS = {
+    TokenType.OP_ADD:         ast.Add,
+    TokenType.OP_SUB:         ast.Sub,
+    TokenType.OP_DIV:         ast.Div,
+    TokenType.OP_FLOORDIV:    ast.FloorDiv,
+    TokenType.OP_MUL:         ast.Mult,
+    TokenType.OP_MOD:         ast.Mod,
+    TokenType.OP_LSHIFT:      ast.LShift,
+    TokenType.OP_RSHIFT:      ast.RShift,
+    TokenType.OP_BITWISE_AND: ast.BitAnd,
+    TokenType.OP_BITWISE_OR:  ast.BitOr,
+    TokenType.OP_BITWISE_XOR: ast.BitXor,
+    TokenType.OP_POW:         ast.Pow,
+}
+_COMPARISONS = {
+    TokenType.OP_EQEQ:  ast.Eq,
+    TokenType.OP_NOTEQ: ast.NotEq,
+    TokenType.OP_GT:    ast.Gt,
+    TokenType.OP_GE:    ast.GtE,
+    TokenType.OP_LT:    ast.Lt,
+    TokenType.OP_LE:    ast.LtE,
+}
+
+
+def _assign(namespaces: NamespaceStack, name: str, value: Value) -> Value:
+    namespaces.set(name, value)
+    return value
+
+
+def _assign_argument(namespaces: NamespaceStack, name: str, value: Value) -> Value:
+    namespaces.head[0][name] = value
+    return value
+
+
+def _call(namespaces: NamespaceStack, get: Code, pos: Tuple[int, int], *args: Value) -> Value:
+    # arguments are evaluated before the function is looked up,
+    # exactly as the Interpreter does
+    func = get(namespaces)
+
+    try:
+        return _value(func(*args))
+    except (ArgumentsError, BudgetExceededError) as exc:
+        raise type(exc)(str(exc), pos) from None
+    except PyCalcError as exc:
+        raise exc from None
+    except Exception as exc:
+        raise ExternalFunctionError(str(exc), pos)
+
+
+class AstInterpreter(ClosureInterpreter):
+    """
+    Interpreter that translates every stack into a python lambda via
+    the ast module, so arithmetics is executed by CPython itself with
+    native operators. Nodes of the generated code carry positions of
+    the tokens, so tracebacks point into the source of the program.
+
+    Variables, calls and function definitions keep the semantics of
+    the Interpreter (and so its results and errors), that's why they
+    are compiled into calls of small helpers
+    """
+
+    def _compile(self, expression: Stack[Token], scope: Optional[Scope]) -> Code:
+        symbols: Dict[str, object] = {
+            "_assign": _assign,
+            "_assign_argument": _assign_argument,
+            "_call": _call,
+            "_value": _value,
+        }
+        statements: List[ast.expr] = []
+        stack: List[Tuple[ast.expr, int]] = []
+
+        for token in expression:
+            if token.kind in (TokenKind.NUMBER, TokenKind.STRING) \
+                    or token.type == TokenType.IDENTIFIER:
+                node = ast.Constant(value=token.value)
+                stack.append((self._locate(node, token), 1))
+            elif token.type == TokenType.VAR:
+                stack.append((self._load_node(token, scope, symbols), 1))
+            elif token.kind == TokenKind.UNARY_OPERATOR:
+                (operand,), depth = self._pop(stack, 1)
+                node = ast.UnaryOp(op=_UNARY_OPERATORS[token.type](), operand=operand)
+                stack.append((self._locate(node, token), depth))
+            elif token.type == TokenType.OP_SEMICOLON:
+                if len(stack) != 1:
+                    raise _NotCompilable
+
+                statements.append(stack.pop()[0])
+            elif token.type == TokenType.OP_EQ:
+                (left, right), depth = self._pop(stack, 2)
+                helper = "_assign"
+
+                if isinstance(left, ast.Constant) and isinstance(left.value, str) \
+                        and resolve(scope, left.value)[0] == ARGUMENT:
+                    helper = "_assign_argument"
+
+                stack.append((self._helper(helper, token, left, right), depth))
+            elif token.type in _BINARY_OPERATORS:
+                (left, right), depth = self._pop(stack, 2)
+                node = ast.BinOp(left=left, op=_BINARY_OPERATORS[token.type](), right=right)
+                stack.append((self._locate(node, token), depth))
+            elif token.type in _COMPARISONS:
+                # comparisons are the only operators giving booleans
+                # out of normalized operands
+                (left, right), depth = self._pop(stack, 2)
+                node = ast.Compare(left=left, ops=[_COMPARISONS[token.type]()], comparators=[right])
+                node = ast.Call(func=ast.Name("_value", ast.Load()), args=[self._locate(node, token)], keywords=[])
+                stack.append((self._locate(node, token), depth))
+            elif token.type == TokenType.OP_DOT:
+                (left, right), depth = self._pop(stack, 2)
+                node = ast.Call(func=ast.Name("getattr", ast.Load()), args=[left, right], keywords=[])
+                node = ast.Call(func=ast.Name("_value", ast.Load()), args=[self._locate(node, token)], keywords=[])
+                stack.append((self._locate(node, token), depth))
+            elif token.type == TokenType.FUNCCALL:
+                args, depth = self._pop(stack, token.value.argscount)
+                getter = self._symbol(symbols, "_get", self._getter(token.value.name, token.pos, scope))
+                node = self._helper("_call", token, getter, ast.Constant(token.pos), *args)
+                stack.append((node, depth))
+            elif token.type == TokenType.FUNCDEF:
+                # function body is compiled separately, and definition
+                # itself is the same as in the closures
+                funcdef = self._symbol(symbols, "_funcdef", self._funcdef(token, scope))
+                node = ast.Call(func=funcdef, args=[self._namespaces()], keywords=[])
+                stack.append((self._locate(node, token), 1))
+            else:
+                raise _NotCompilable
+
+        if len(stack) != 1:
+            raise _NotCompilable
+
+        body = stack.pop()[0]
+
+        if statements:
+            # statements are evaluated one by one, the last one is the result
+            body = ast.Subscript(
+                value=ast.Tuple(elts=[*statements, body], ctx=ast.Load()),
+                slice=ast.Constant(-1),
+                ctx=ast.Load()
+            )
+
+        tree = ast.Expression(body=ast.Lambda(
+            args=ast.arguments(
+                posonlyargs=[],
+                args=[ast.arg(arg=_NAMESPACES)],
+                kwonlyargs=[],
+                kw_defaults=[],
+                defaults=[]
+            ),
+            body=body
+        ))
+
+        return eval(compile(self._fix_locations(tree), FILENAME, "eval"), symbols)
+
+    def _load_node(self, token: Token, scope: Optional[Scope], symbols: Dict[str, object]) -> ast.expr:
+        name = token.value
+        kind, index = resolve(scope, name)
+
+        # arguments are subscribed directly, other names are looked up
+        # by getters of the closures
+        if kind == ARGUMENT:
+            head = ast.Attribute(value=self._namespaces(), attr="head", ctx=ast.Load())
+            node = ast.Subscript(
+                value=ast.Subscript(value=head, slice=ast.Constant(0), ctx=ast.Load()),
+                slice=ast.Constant(name),
+                ctx=ast.Load()
+            )
+        elif kind == CELL:
+            cells = ast.Attribute(value=self._namespaces(), attr="cells", ctx=ast.Load())
+            node = ast.Subscript(
+                value=ast.Subscript(value=cells, slice=ast.Constant(index), ctx=ast.Load()),
+                slice=ast.Constant(name),
+                ctx=ast.Load()
+            )
+        else:
+            getter = self._symbol(symbols, "_get", self._getter(name, token.pos, scope))
+            node = ast.Call(func=getter, args=[self._namespaces()], keywords=[])
+
+        node = ast.Call(func=ast.Name("_value", ast.Load()), args=[self._locate(node, token)], keywords=[])
+
+        return self._locate(node, token)
+
+    @staticmethod
+    def _symbol(symbols: Dict[str, object], prefix: str, value: object) -> ast.expr:
+        """
+        Makes the value accessible from the compiled code by a unique name
+        """
+
+        name = f"{prefix}{len(symbols)}"
+        symbols[name] = value
+
+        return ast.Name(name, ast.Load())
+
+    def _helper(self, name: str, token: Token, *args: ast.expr) -> ast.expr:
+        node = ast.Call(
+            func=ast.Name(name, ast.Load()),
+            args=[self._namespaces(), *args],
+            keywords=[]
+        )
+
+        return self._locate(node, token)
+
+    @staticmethod
+    def _namespaces() -> ast.expr:
+        return ast.Name(_NAMESPACES, ast.Load())
+
+    @staticmethod
+    def _locate(node: ast.expr, token: Token) -> ast.expr:
+        line, column = token.pos
+        node.lineno = node.end_lineno = max(line, 0) + 1
+        node.col_offset = node.end_col_offset = max(column, 0)
+
+        return node
+
+    @staticmethod
+    def _fix_locations(tree: ast.Expression) -> ast.Expression:
+        """
+        Nodes without own tokens (names, constants of helpers) get the
+        position of their parent node
+        """
+
+        def fix(node: ast.AST, lineno: int, col_offset: int):
+            if "lineno" in node._attributes:
+                if getattr(node, "lineno", None) is None:
+                    node.lineno = node.end_lineno = lineno
+                    node.col_offset = node.end_col_offset = col_offset
+                else:
+                    lineno, col_offset = node.lineno, node.col_offset
+
+            for child in ast.iter_child_nodes(node):
+                fix(child, lineno, col_offset)
+
+        fix(tree, 1, 0)
+        return tree
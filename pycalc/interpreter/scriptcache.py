@@ -0,0 +1,230 @@
+import os
+import struct
+import marshal
+from hashlib import sha256
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+from pycalc import __version__
+from pycalc.tokentypes.tokens import Token, Func, FuncDef
+from pycalc.tokentypes.types import TokenKind, TokenType, Stack
+
+
+Program = List[Stack[Token]]
+
+MAGIC = b"PYCALC\x00\x02"
+SUFFIX = f".pycalc-{__version__}.calcc"
+
+_KINDS = {kind.value: kind for kind in TokenKind}
+_TYPES = {typeof.value: typeof for typeof in TokenType}
+# size of the whole file is written after the header once all the stacks
+# are, so files those were not written till the end are never loaded
+_SIZE = struct.Struct("<Q")
+_READ_SIZE = 1 << 16
+
+
+class ScriptCache:
+    """
+    Built programs of the scripts, stored on disk. By default, a cache
+    file is kept in the __pycache__ directory next to the script. It
+    is valid while both source of the script and version of pycalc
+    are the same as they were when the file was written (source is
+    told by its digest, see file_digest()).
+
+    Stacks are written and read one by one, so neither storing nor
+    loading keeps the whole program in memory, and the first line of
+    the script is executed as soon as it is built or loaded
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+
+    def path(self, filename: str) -> str:
+        name = os.path.basename(filename)
+
+        if name.endswith(".calc"):
+            name = name[:-len(".calc")]
+
+        if self.directory is None:
+            return os.path.join(os.path.dirname(filename), "__pycache__", name + SUFFIX)
+
+        # scripts from different directories may have the same names
+        location = sha256(os.path.abspath(filename).encode()).hexdigest()[:16]
+
+        return os.path.join(self.directory, f"{name}.{location}{SUFFIX}")
+
+    def load(self, filename: str, digest: bytes) -> Optional[Iterator[Stack[Token]]]:
+        """
+        Returns stacks of the program from the cache, those are read
+        while they are iterated, or None if there is no valid one
+        """
+
+        try:
+            fd = open(self.path(filename), "rb")
+        except OSError:
+            return None
+
+        try:
+            if fd.read(len(MAGIC)) == MAGIC \
+                    and marshal.load(fd) == (__version__, digest) \
+                    and _SIZE.unpack(fd.read(_SIZE.size)) == (os.fstat(fd.fileno()).st_size,):
+                return _load_stacks(fd)
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            pass
+
+        fd.close()
+
+        return None
+
+    def store(self, filename: str, digest: bytes, program: Iterable[Stack[Token]]):
+        """
+        Writes the program into the cache. Errors are ignored: the
+        script just will be built again next time
+        """
+
+        for _ in self.storing(filename, digest, program):
+            pass
+
+    def storing(self, filename: str, digest: bytes,
+                stacks: Iterable[Stack[Token]]) -> Iterator[Stack[Token]]:
+        """
+        Yields stacks as they are, writing every one into the cache
+        before. The file becomes valid when they are over: if the program
+        was not read till the end (because of an error), nothing is stored
+        """
+
+        path = self.path(filename)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        fd = None
+
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fd = open(temporary, "wb")
+            fd.write(MAGIC)
+            marshal.dump((__version__, digest), fd)
+            size_offset = fd.tell()
+            fd.write(_SIZE.pack(0))
+        except OSError:
+            fd = _discard(fd, temporary)
+
+        try:
+            for stack in stacks:
+                if fd is not None:
+                    try:
+                        marshal.dump(_dump_stack(stack), fd)
+                    except OSError:
+                        fd = _discard(fd, temporary)
+
+                yield stack
+
+            if fd is not None:
+                try:
+                    fd.seek(size_offset)
+                    fd.write(_SIZE.pack(os.fstat(fd.fileno()).st_size))
+                    fd.close()
+                    # readers never see a partially written file
+                    os.replace(temporary, path)
+                    fd = None
+                except OSError:
+                    pass
+        finally:
+            _discard(fd, temporary)
+
+
+def file_digest(filename: str) -> bytes:
+    """
+    Digest of the source of the script, read by chunks
+    """
+
+    digest = sha256()
+
+    with open(filename, "rb") as fd:
+        for chunk in iter(lambda: fd.read(_READ_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.digest()
+
+
+def _load_stacks(fd: BinaryIO) -> Iterator[Stack[Token]]:
+    with fd:
+        while True:
+            try:
+                data = marshal.load(fd)
+            except EOFError:
+                return
+
+            yield _load_stack(data)
+
+
+def _discard(fd: Optional[BinaryIO], temporary: str) -> None:
+    if fd is not None:
+        try:
+            fd.close()
+            os.remove(temporary)
+        except OSError:
+            pass
+
+    return None
+
+
+def dump_program(program: Program) -> tuple:
+    """
+    Turns the program into nested tuples of plain values, those can
+    be serialized by marshal
+    """
+
+    return tuple(_dump_stack(stack) for stack in program)
+
+
+def load_program(data: tuple) -> Program:
+    return [_load_stack(stack) for stack in data]
+
+
+def _dump_stack(stack: Iterable[Token]) -> tuple:
+    """
+    Stack is stored by columns: kinds and types of the tokens as bytes,
+    their values and flattened positions. Indexes of functions tokens
+    are stored separately, as their values are converted
+    """
+
+    kinds, types, values, positions, functions = bytearray(), bytearray(), [], [], []
+
+    for i, token in enumerate(stack):
+        value = token.value
+
+        if token.type == TokenType.FUNCCALL:
+            value = (value.name, value.argscount)
+            functions.append(i)
+        elif token.type == TokenType.FUNCDEF:
+            value = (value.name, _dump_stack(value.args), _dump_stack(value.body))
+            functions.append(i)
+
+        kinds.append(token.kind)
+        types.append(token.type)
+        values.append(value)
+        positions.extend(token.pos)
+
+    return bytes(kinds), bytes(types), tuple(values), tuple(positions), tuple(functions)
+
+
+def _load_stack(data: tuple) -> Stack[Token]:
+    kinds, types, values, positions, functions = data
+    pairs = iter(positions)
+    stack: Stack[Token] = Stack(map(
+        Token,
+        map(_KINDS.__getitem__, kinds),
+        map(_TYPES.__getitem__, types),
+        values,
+        zip(pairs, pairs)
+    ))
+
+    for i in functions:
+        token = stack[i]
+
+        if token.type == TokenType.FUNCCALL:
+            token.value = Func(*token.value)
+        else:
+            name, args, body = token.value
+            token.value = FuncDef(name=name, args=list(_load_stack(args)), body=_load_stack(body))
+
+    return stack
+
@@ -0,0 +1,557 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from pycalc.interpreter import budget as _budget
+from pycalc.interpreter.interpret import Interpreter, NamespaceStack, Value
+from pycalc.tokentypes.tokens import Token, Func
+from pycalc.tokentypes.types import (TokenKind, TokenType, Stack, ArgumentsError,
+                                     NameNotFoundError, ExternalFunctionError,
+                                     BudgetExceededError, PyCalcError)
+
+
+# every instruction is a pair of an opcode and its argument
+LOAD_CONST = 0     # push consts[arg]
+LOAD_NAME = 1      # push value of variable names[arg]
+UNARY_OP = 2       # apply unary_executors[arg] to the top of the stack
+BINARY_OP = 3      # apply executors[arg] to two values on the top
+STORE_NAME = 4     # pop value and name, set the name, push value back
+POP_TOP = 5        # semicolon: drop the result of the statement
+CALL = 6           # call function consts[arg].name with consts[arg].argscount values
+MAKE_FUNCTION = 7  # define function described by consts[arg]
+FALLBACK = 8       # execute tokens consts[arg] by the reference interpreter
+STATEMENT = 9      # call statement consts[arg], or jump to the code of its callback
+JUMP = 10          # continue from code[arg]
+POP_JUMP_IF_FALSE = 11  # pop value, continue from code[arg] if it is false
+LOOP = 12          # pop value, jump back to code[arg], one more step of the budget
+ENTER_SCOPE = 13   # push namespace of the inlined callback
+LEAVE_SCOPE = 14   # pop namespace of the inlined callback
+NOP = 15           # lambda that is not created, as its statement is inlined
+
+# statements of the std-library those are compiled into jumps: their
+# statement attributes tell which of them they are
+IF = "if"
+BRANCH = "branch"
+WHILE = "while"
+
+Position = Tuple[int, int]
+# code[start:end] is a callback inlined by the statement at the position
+Handler = Tuple[int, int, Position]
+
+
+class CodeBlock:
+    """
+    Compiled stack: flat instructions stream, pools of constants and
+    names those are referenced by instructions, positions of the tokens
+    every instruction was made of, maximal depth of the values stack
+    needed to execute it, and the callbacks inlined by statements (inner
+    ones go first)
+    """
+
+    __slots__ = ("code", "consts", "names", "positions", "stacksize", "handlers")
+
+    def __init__(self,
+                 code: array,
+                 consts: list,
+                 names: List[str],
+                 positions: List[Position],
+                 stacksize: int,
+                 handlers: Tuple[Handler, ...] = ()):
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.positions = positions
+        self.stacksize = stacksize
+        self.handlers = handlers
+
+
+class FunctionCode:
+    """
+    Constant of MAKE_FUNCTION instruction
+    """
+
+    __slots__ = ("name", "fargs", "body")
+
+    def __init__(self, name: str, fargs: List[str], body: Optional[CodeBlock]):
+        self.name = name
+        self.fargs = fargs
+        self.body = body
+
+
+class StatementCode:
+    """
+    Constant of STATEMENT instruction: the call, kind of the statement,
+    its callbacks (indexes of the arguments those are lambdas written in
+    place, their functions and bodies), where the code of every callback
+    starts, and where the statement ends. Callbacks are not on the values
+    stack: if the name is the statement in runtime, their code is jumped
+    to, otherwise they are created (and compiled, the first time) right
+    before the call
+    """
+
+    __slots__ = ("func", "kind", "callbacks", "targets", "end")
+
+    def __init__(self, func: Func, kind: str, callbacks: List[Tuple[int, FunctionCode, Stack[Token]]]):
+        self.func = func
+        self.kind = kind
+        self.callbacks = callbacks
+        self.targets: Tuple[int, ...] = ()
+        self.end = 0
+
+
+class _NotCompilable(Exception):
+    """
+    Raised while compiling a stack that would fail in runtime
+    because of number of values in it
+    """
+
+
+class VMInterpreter(Interpreter):
+    """
+    Interpreter that compiles every stack (including bodies of the
+    functions) into a CodeBlock once, and executes blocks by a tight
+    dispatch loop over integer opcodes. Values are kept in the
+    preallocated stack as they are, without wrapping into tokens.
+
+    Stacks those would fail because of number of values in them are
+    compiled into a single FALLBACK instruction, so the reference
+    interpreter fails on them in the same way and in the same moment.
+
+    Calls of if, branch and while with lambdas without arguments written
+    in place are compiled into jumps to the inlined code of the lambdas,
+    so no function is created and called. Whether the name is the
+    statement is checked right before the call, as names may be shadowed.
+    Inlined code has a namespace of its own, and fails as the call would,
+    but every iteration of the inlined loop is a single step of the Budget
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reference = Interpreter(self.tokenizer, self.stackbuilder)
+        # executors tables indexed by arguments of UNARY_OP and BINARY_OP
+        self._unary_opcodes = {typeof: i for i, typeof in enumerate(self.unary_executors)}
+        self._unary_table = list(self.unary_executors.values())
+        self._binary_opcodes = {typeof: i for i, typeof in enumerate(self.executors)}
+        self._binary_table = list(self.executors.values())
+
+    def _compile_program(self, exprs: Iterable[Stack[Token]]) -> Iterable[CodeBlock]:
+        return map(self.compile, exprs)
+
+    async def _run_async(self, exprs: Iterable[Stack[Token]], namespaces: NamespaceStack,
+                         yield_every: int) -> Value:
+        # code awaiting the calls can not be compiled, so it is
+        # executed by the reference interpreter
+        return await self._reference._run_async(exprs, namespaces, yield_every)
+
+    def compile(self, expression: Stack[Token]) -> CodeBlock:
+        try:
+            return self._compile(expression)
+        except _NotCompilable:
+            return CodeBlock(
+                code=array("H", (FALLBACK, 0)),
+                consts=[expression],
+                names=[],
+                positions=[(-1, -1)],
+                stacksize=0
+            )
+
+    def _compile(self, expression: Stack[Token]) -> CodeBlock:
+        code: List[int] = []
+        consts: list = []
+        names: List[str] = []
+        positions: List[Position] = []
+        handlers: List[Handler] = []
+        const_indexes: Dict[tuple, int] = {}
+        name_indexes: Dict[str, int] = {}
+        # for every value on the stack: index of MAKE_FUNCTION and the token
+        # if it is a lambda without arguments, so it may be inlined
+        lambdas: List[Optional[Tuple[int, Token]]] = []
+        # bodies of the functions are compiled once the stack is, except
+        # the ones of inlined lambdas
+        functions: List[Tuple[FunctionCode, Token]] = []
+        inlined = set()
+        depth = stacksize = 0
+
+        def emit(opcode: int, arg: int, pos: Position, pops: int, pushes: int) -> int:
+            nonlocal depth, stacksize
+
+            if depth < pops:
+                raise _NotCompilable
+
+            depth += pushes - pops
+            stacksize = max(stacksize, depth)
+            del lambdas[len(lambdas) - pops:]
+            lambdas.extend((None,) * pushes)
+            code.extend((opcode, arg))
+            positions.append(pos)
+
+            return len(code) - 2
+
+        def const(value: Union[Value, Func, FunctionCode, StatementCode]) -> int:
+            # 1, 1.0 and True are equal, but must not be merged
+            key = (type(value), value) if isinstance(value, (int, float, str)) else (id(value),)
+
+            if key not in const_indexes:
+                const_indexes[key] = len(consts)
+                consts.append(value)
+
+            return const_indexes[key]
+
+        def name(value: str) -> int:
+            if value not in name_indexes:
+                name_indexes[value] = len(names)
+                names.append(value)
+
+            return name_indexes[value]
+
+        def block(tokens: Stack[Token], base: int):
+            # compiles the tokens on top of the base values
+            for token in tokens:
+                if token.kind in (TokenKind.NUMBER, TokenKind.STRING) \
+                        or token.type == TokenType.IDENTIFIER:
+                    emit(LOAD_CONST, const(token.value), token.pos, 0, 1)
+                elif token.type == TokenType.VAR:
+                    emit(LOAD_NAME, name(token.value), token.pos, 0, 1)
+                elif token.kind == TokenKind.UNARY_OPERATOR:
+                    emit(UNARY_OP, self._unary_opcodes[token.type], token.pos, 1, 1)
+                elif token.type == TokenType.OP_SEMICOLON:
+                    if depth != base + 1:
+                        raise _NotCompilable
+
+                    emit(POP_TOP, 0, token.pos, 1, 0)
+                elif token.type == TokenType.OP_EQ:
+                    emit(STORE_NAME, 0, token.pos, 2, 1)
+                elif token.kind == TokenKind.OPERATOR:
+                    emit(BINARY_OP, self._binary_opcodes[token.type], token.pos, 2, 1)
+                elif token.type == TokenType.FUNCCALL:
+                    if not statement(token):
+                        emit(CALL, const(token.value), token.pos, token.value.argscount, 1)
+                elif token.type == TokenType.FUNCDEF:
+                    function = FunctionCode(
+                        name=token.value.name,
+                        fargs=[arg.value for arg in token.value.args],
+                        body=None
+                    )
+                    functions.append((function, token))
+                    index = emit(MAKE_FUNCTION, const(function), token.pos, 0, 1)
+
+                    if not token.value.name and not token.value.args:
+                        lambdas[-1] = index, token
+                else:
+                    raise _NotCompilable
+
+            if depth != base + 1:
+                raise _NotCompilable
+
+        def inline(body: Stack[Token], pos: Position):
+            # namespace of the callback that neither assigns nor defines
+            # named functions stays empty, so it is not pushed at all
+            scoped = any(
+                token.type == TokenType.OP_EQ
+                or (token.type == TokenType.FUNCDEF and token.value.name)
+                for token in body
+            )
+            start = len(code)
+
+            if scoped:
+                emit(ENTER_SCOPE, 0, pos, 0, 0)
+
+            block(body, depth)
+
+            if scoped:
+                emit(LEAVE_SCOPE, 0, pos, 0, 0)
+
+            handlers.append((start, len(code), pos))
+
+        def statement(token: Token) -> bool:
+            # compiles the call of the statement with the lambdas written in
+            # place into jumps. Returns False if it is not such a call
+            nonlocal depth, stacksize
+
+            kind, count, pos = token.value.name, token.value.argscount, token.pos
+
+            if kind == IF and count in (2, 3):
+                indexes = list(range(1, count))
+            elif kind == WHILE and count == 2:
+                indexes = [0, 1]
+            elif kind == BRANCH and count >= 2:
+                indexes = list(range(1, count, 2)) + ([count - 1] if count % 2 else [])
+            else:
+                return False
+
+            if depth < count:
+                return False
+
+            args = lambdas[len(lambdas) - count:]
+
+            if any(args[i] is None for i in indexes):
+                return False
+
+            saved = len(code), len(handlers), len(functions), depth, stacksize, lambdas[:]
+            callbacks = [(i, consts[code[args[i][0] + 1]], args[i][1].value.body) for i in indexes]
+            compiled = StatementCode(token.value, kind, callbacks)
+            emit(STATEMENT, const(compiled), pos, count, 0)
+            targets, jumps = [], []
+
+            try:
+                if kind == WHILE:
+                    targets.append(len(code))
+                    inline(callbacks[0][2], pos)
+                    exit_jump = emit(POP_JUMP_IF_FALSE, 0, pos, 1, 0)
+                    inline(callbacks[1][2], pos)
+                    emit(LOOP, targets[0], pos, 1, 0)
+                    code[exit_jump + 1] = len(code)
+                    emit(LOAD_CONST, const(0), pos, 0, 1)
+                else:
+                    for _, _, body in callbacks:
+                        if targets:
+                            # every callback starts with no value of
+                            # the previous one
+                            depth -= 1
+                            lambdas.pop()
+
+                        targets.append(len(code))
+                        inline(body, pos)
+                        jumps.append(emit(JUMP, 0, pos, 0, 0))
+
+                    # the last callback ends right where the statement does
+                    del code[jumps.pop():]
+                    positions.pop()
+            except _NotCompilable:
+                length, handlers_length, functions_length, depth, stacksize, lambdas[:] = saved
+                del code[length:], positions[length // 2:], handlers[handlers_length:]
+                del functions[functions_length:]
+
+                return False
+
+            for jump in jumps:
+                code[jump + 1] = len(code)
+
+            for i in indexes:
+                code[args[i][0]] = NOP
+                inlined.add(id(consts[code[args[i][0] + 1]]))
+
+            compiled.targets = tuple(targets)
+            compiled.end = len(code)
+
+            return True
+
+        block(expression, 0)
+
+        for function, token in functions:
+            if id(function) not in inlined:
+                function.body = self.compile(token.value.body)
+
+        typecode = "H" if max(code, default=0) <= 0xFFFF else "I"
+
+        return CodeBlock(
+            code=array(typecode, code),
+            consts=consts,
+            names=names,
+            positions=positions,
+            stacksize=stacksize,
+            handlers=tuple(handlers)
+        )
+
+    def _interpret_line(self, block: CodeBlock, namespaces: NamespaceStack) -> Value:
+        code, consts, names = block.code, block.consts, block.names
+        stack = [None] * block.stacksize
+        sp = pc = 0
+        end = len(code)
+        head = namespaces.head
+
+        try:
+            while pc < end:
+                opcode, arg = code[pc], code[pc + 1]
+                pc += 2
+
+                if opcode == LOAD_CONST:
+                    stack[sp] = consts[arg]
+                    sp += 1
+                elif opcode == LOAD_NAME:
+                    try:
+                        value = namespaces.get(names[arg])
+                    except NameNotFoundError as exc:
+                        raise NameNotFoundError(str(exc), block.positions[pc // 2 - 1]) from None
+
+                    stack[sp] = int(value) if isinstance(value, int) else value
+                    sp += 1
+                elif opcode == BINARY_OP:
+                    sp -= 1
+                    value = self._binary_table[arg](stack[sp - 1], stack[sp])
+                    stack[sp - 1] = int(value) if isinstance(value, int) else value
+                elif opcode == CALL:
+                    func = consts[arg]
+
+                    try:
+                        target = namespaces.get(func.name)
+                    except NameNotFoundError as exc:
+                        raise NameNotFoundError(str(exc), block.positions[pc // 2 - 1]) from None
+
+                    sp -= func.argscount
+                    args = stack[sp:sp + func.argscount]
+
+                    try:
+                        value = target(*args)
+                    except (ArgumentsError, BudgetExceededError) as exc:
+                        raise type(exc)(str(exc), block.positions[pc // 2 - 1]) from None
+                    except PyCalcError as exc:
+                        raise exc from None
+                    except Exception as exc:
+                        raise ExternalFunctionError(str(exc), block.positions[pc // 2 - 1])
+
+                    stack[sp] = int(value) if isinstance(value, int) else value
+                    sp += 1
+                elif opcode == JUMP:
+                    pc = arg
+                elif opcode == POP_JUMP_IF_FALSE:
+                    sp -= 1
+
+                    if not stack[sp]:
+                        pc = arg
+                elif opcode == UNARY_OP:
+                    value = self._unary_table[arg](stack[sp - 1])
+                    stack[sp - 1] = int(value) if isinstance(value, int) else value
+                elif opcode == STORE_NAME:
+                    sp -= 1
+                    namespaces.set(stack[sp - 1], stack[sp])
+                    stack[sp - 1] = stack[sp]
+                elif opcode == POP_TOP:
+                    sp -= 1
+                elif opcode == ENTER_SCOPE:
+                    namespaces.append({})
+                elif opcode == LEAVE_SCOPE:
+                    namespaces.pop()
+                elif opcode == LOOP:
+                    sp -= 1
+                    meter = _budget.current()
+
+                    if meter is not None:
+                        meter.countdown -= 1
+
+                        if meter.countdown <= 0:
+                            try:
+                                meter.check(False)
+                            except BudgetExceededError as exc:
+                                raise BudgetExceededError(str(exc), block.positions[pc // 2 - 1]) from None
+
+                    pc = arg
+                elif opcode == STATEMENT:
+                    statement = consts[arg]
+                    pos = block.positions[pc // 2 - 1]
+
+                    try:
+                        target = namespaces.get(statement.func.name)
+                    except NameNotFoundError as exc:
+                        raise NameNotFoundError(str(exc), pos) from None
+
+                    count = statement.func.argscount - len(statement.callbacks)
+                    sp -= count
+                    args = stack[sp:sp + count]
+
+                    if getattr(target, "statement", None) == statement.kind:
+                        chosen = self._choose(statement, args, pos)
+
+                        if chosen is not None:
+                            pc = statement.targets[chosen]
+                            continue
+
+                        value = 0
+                    else:
+                        value = self._call_statement(statement, target, args, namespaces, pos)
+
+                    stack[sp] = value
+                    sp += 1
+                    pc = statement.end
+                elif opcode == MAKE_FUNCTION:
+                    function = consts[arg]
+                    func = self._spawn_function(
+                        namespace=namespaces.copy(),
+                        name=function.name,
+                        fargs=function.fargs,
+                        body=function.body
+                    )
+
+                    if function.name:
+                        namespaces.set(function.name, func)
+
+                    stack[sp] = func
+                    sp += 1
+                elif opcode == NOP:
+                    pass
+                else:  # FALLBACK
+                    return self._reference._interpret_line(consts[arg], namespaces)
+        except Exception as exc:
+            if not block.handlers:
+                raise
+
+            # namespaces of the inlined callbacks are left
+            namespaces.head = head
+
+            raise self._relocate(block.handlers, pc - 2, exc) from None
+
+        return stack[0]
+
+    @staticmethod
+    def _choose(statement: StatementCode, args: list, pos: Position) -> Optional[int]:
+        """
+        Index of the callback the statement calls with the values of the
+        arguments those are not callbacks, or None if it gives 0 itself
+        """
+
+        if statement.kind == IF:
+            if args[0]:
+                return 0
+
+            return 1 if len(statement.targets) > 1 else None
+        elif statement.kind == WHILE:
+            return 0
+        elif callable(args[0]):
+            raise ArgumentsError("invalid arguments", pos)
+
+        for i, condition in enumerate(args):
+            if condition:
+                return i
+
+        return len(args) if len(statement.targets) > len(args) else None
+
+    def _call_statement(self, statement: StatementCode, target, args: list,
+                        namespaces: NamespaceStack, pos: Position) -> Value:
+        # the name is not the statement, so the callbacks are created and
+        # are passed to the call as they are written
+        for i, function, body in statement.callbacks:
+            if function.body is None:
+                function.body = self.compile(body)
+
+            args.insert(i, self._spawn_function(
+                namespace=namespaces.copy(),
+                name=function.name,
+                fargs=function.fargs,
+                body=function.body
+            ))
+
+        try:
+            value = target(*args)
+        except (ArgumentsError, BudgetExceededError) as exc:
+            raise type(exc)(str(exc), pos) from None
+        except PyCalcError as exc:
+            raise exc from None
+        except Exception as exc:
+            raise ExternalFunctionError(str(exc), pos)
+
+        return int(value) if isinstance(value, int) else value
+
+    @staticmethod
+    def _relocate(handlers: Tuple[Handler, ...], failed: int, exc: Exception) -> Exception:
+        """
+        The error of the instruction code[failed], as the calls of the
+        inlined callbacks it is in would give it
+        """
+
+        for start, end, pos in handlers:
+            if start <= failed < end:
+                if isinstance(exc, (ArgumentsError, BudgetExceededError)):
+                    exc = type(exc)(str(exc), pos)
+                elif not isinstance(exc, PyCalcError):
+                    exc = ExternalFunctionError(str(exc), pos)
+
+        return exc
@@ -1,10 +1,11 @@
+import re
 import enum
 import string
 from functools import reduce
 from abc import ABC, abstractmethod
-from typing import List, Iterator, Tuple, Callable
+from typing import List, Iterable, Iterator, Tuple, Callable, Optional
 
-from pycalc.tokentypes.tokens import Lexeme, Lexemes, Token, Tokens, FuncDef
+from pycalc.tokentypes.tokens import Lexeme, Lexemes, Token, Tokens, TokenValue, FuncDef
 from pycalc.tokentypes.types import (LexemeType, TokenType, TokenKind, OPERATORS_TABLE,
                                      OPERATORS_CHARS, UNARY_OPERATORS, Stack,
                                      InvalidSyntaxError)
@@ -38,9 +39,18 @@ class ABCTokenizer(ABC):
         and name function takes; also OP_EQ is ignored in this case)
         """
 
+    def tokenize_stream(self, stream: Iterable[str]) -> Iterator[Tokens]:
+        """
+        Same as tokenize(), but takes the source by pieces (for example,
+        lines of a file) and yields its lines as soon as they are parsed.
+        By default, the whole source is read first
+        """
+
+        return iter(self.tokenize("".join(stream)))
+
 
 def tokenize(data: str) -> List[Tokens]:
-    return Tokenizer().tokenize(data)
+    return RegexTokenizer().tokenize(data)
 
 
 class Tokenizer(ABCTokenizer):
@@ -520,6 +530,255 @@ class Tokenizer(ABCTokenizer):
         raise InvalidSyntaxError("unexpected lexeme type: " + lexeme.type.name, lexeme.pos)
 
 
+_OPERATOR_CHARS_CLASS = "".join(map(re.escape, sorted(OPERATORS_CHARS - {"."})))
+
+# blanks are consumed as a prefix of every lexeme, so they never
+# produce a match on their own
+_LEXEMES_RE = re.compile(rf"""
+    [ \t\r]*
+    (?:
+        (?P<WORD>(?:[^{_OPERATOR_CHARS_CLASS}."() \t\r\n]|\.(?=[0-9]))+)
+      | (?P<OPERATOR>[{_OPERATOR_CHARS_CLASS}]+)
+      | (?P<PAREN>[()])
+      | (?P<EOL>\n)
+      | (?P<STRING>"(?:[^"\\]|\\.)*")
+      | (?P<DOT>\.(?![0-9]))
+      | (?P<QUOTE>")
+    )
+""", re.VERBOSE | re.DOTALL)
+
+# maximal number of distinct words remembered by the lexer
+_CACHE_SIZE = 4096
+_LONGEST_OPERATOR = len(max(OPERATORS_TABLE.keys(), key=len))
+_PARENS = {
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+}
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    Drop-in replacement of the Tokenizer lexer. Instead of walking the
+    source char by char and re-parsing the collected pieces, a single
+    compiled regular expression splits the source into typed lexemes
+    that are turned into tokens right away, together with splitting
+    them into lines.
+
+    Positions of tokens are exactly the same as the reference lexer
+    reports, so error messages point to the same places
+    """
+
+    def tokenize(self, data: str) -> List[Tokens]:
+        return list(self.tokenize_stream([data]))
+
+    def tokenize_stream(self, stream: Iterable[str]) -> Iterator[Tokens]:
+        return (
+            self._mark_identifiers(self._parse_unary(line))
+            for line in self._lines(stream)
+        )
+
+    def _lines(self, stream: Iterable[str]) -> Iterator[Tokens]:
+        line: Tokens = []
+
+        for token in self._statements(stream):
+            if token is None:
+                yield line
+                line = []
+            else:
+                line.append(token)
+
+        if line:
+            yield line
+
+    def _statements(self, stream: Iterable[str]) -> Iterator[Optional[Token]]:
+        """
+        Lexes the source and yields its tokens one by one. End of every
+        non-empty line is marked by None. Line continuation rules are
+        the same as in Tokenizer._split_lines: line break is ignored
+        inside of parenthesis or after an operator.
+
+        Source is taken by pieces, every piece except the last one
+        must end with a line break (iterating a file gives exactly
+        such pieces)
+        """
+
+        empty = True
+        parens = 0
+        prev_is_op = False
+        lineno = 0
+        # offset of the current piece from the beginning of the source
+        base = 0
+        line_start = 0
+        # reference lexer does not reset its columns counter in the very
+        # beginning, so every line except the first one is shifted by one
+        shift = 0
+        # string that is not terminated in the end of a piece
+        carry = ""
+        carry_pos = (0, 0)
+        # generated sources repeat the same names and operators a lot,
+        # so they are parsed only once
+        words = {}
+        ops = {}
+
+        for data in stream:
+            data = carry + data
+            carry = ""
+            size = len(data)
+
+            if len(words) > _CACHE_SIZE:
+                words.clear()
+
+            for match in _LEXEMES_RE.finditer(data):
+                kind = match.lastgroup
+                start, end = match.span(kind)
+                empty = empty and kind == "EOL"
+
+                if kind == "WORD" or kind == "OPERATOR":
+                    chunk = match.group(kind)
+
+                    # reference lexer reports different positions of words and
+                    # operators depending on what terminated them
+                    if end == size:
+                        pos = (lineno, end - line_start + shift + 1)
+                    elif data[end] in "()":
+                        pos = (lineno, start - line_start + shift)
+                    elif data[end] == "." and not data[end+1:end+2].isdigit():
+                        pos = (lineno, base + start)
+                    else:
+                        pos = (lineno, end - line_start + shift)
+
+                    if kind == "WORD":
+                        if chunk not in words:
+                            words[chunk] = self._parse_word(chunk, pos)
+
+                        tokkind, typeof, value = words[chunk]
+                        yield Token(kind=tokkind, typeof=typeof, value=value, pos=pos)
+                        prev_is_op = False
+                    else:
+                        if chunk not in ops:
+                            ops[chunk] = self._split_ops(chunk, pos)
+
+                        for typeof, value, offset in ops[chunk]:
+                            yield Token(
+                                kind=TokenKind.OPERATOR,
+                                typeof=typeof,
+                                value=value,
+                                pos=(lineno, pos[1] + offset)
+                            )
+
+                        prev_is_op = True
+                elif kind == "PAREN":
+                    char = match.group(kind)
+                    pos = (lineno, start - line_start + shift)
+
+                    if char == "(":
+                        parens += 1
+                    elif not parens:
+                        raise InvalidSyntaxError("unexpected closing parenthesis", pos)
+                    else:
+                        parens -= 1
+
+                    yield Token(kind=TokenKind.PAREN, typeof=_PARENS[char], value=char, pos=pos)
+                    prev_is_op = False
+                elif kind == "EOL":
+                    lineno += 1
+                    line_start = end
+                    shift = 1
+
+                    if not parens and not prev_is_op and not empty:
+                        yield None
+                        empty = True
+
+                    prev_is_op = False
+                elif kind == "STRING":
+                    yield Token(
+                        kind=TokenKind.STRING,
+                        typeof=TokenType.STRING,
+                        value=_prepare_string(match.group(kind)[1:-1]),
+                        pos=(lineno, start - line_start + shift)
+                    )
+                    prev_is_op = False
+                elif kind == "DOT":
+                    if end == size:
+                        raise InvalidSyntaxError(
+                            "unexpected dot in the end of the expression",
+                            (lineno, base + start)
+                        )
+
+                    yield Token(
+                        kind=TokenKind.OPERATOR,
+                        typeof=TokenType.OP_DOT,
+                        value=".",
+                        pos=(lineno, base + start)
+                    )
+                    prev_is_op = True
+                else:
+                    # string may be terminated in one of the next pieces
+                    carry = data[start:]
+                    carry_pos = (lineno, start - line_start + shift)
+                    size = start
+                    break
+
+            # line start is relative to the current piece, so it is
+            # negative in case line began in one of previous pieces
+            line_start -= size
+            base += size
+
+        if carry:
+            raise InvalidSyntaxError("unterminated string", carry_pos)
+
+        if not empty:
+            yield None
+
+    @staticmethod
+    def _split_ops(raw_op: str, pos: Tuple[int, int]) -> List[Tuple[TokenType, str, int]]:
+        """
+        Splits a string of operators into actual and unary operators.
+        Returns their types, values and offsets from the beginning
+        of the string
+        """
+
+        for op_len in range(min(_LONGEST_OPERATOR, len(raw_op)), 0, -1):
+            if raw_op[:op_len] in OPERATORS_TABLE:
+                break
+        else:
+            raise InvalidSyntaxError(f"illegal operator: {raw_op[0]}", pos)
+
+        output = [(OPERATORS_TABLE[raw_op[:op_len]], raw_op[:op_len], 0)]
+
+        for char in raw_op[op_len:]:
+            if char not in OPERATORS_TABLE:
+                raise InvalidSyntaxError(
+                    f"illegal operator: {char}",
+                    (pos[0], pos[1] + op_len)
+                )
+
+            output.append((OPERATORS_TABLE[char], char, op_len))
+
+        return output
+
+    @staticmethod
+    def _parse_word(word: str, pos: Tuple[int, int]) -> Tuple[TokenKind, TokenType, TokenValue]:
+        if word.startswith("0x"):
+            typeof, value, base = TokenType.INTEGER, word[2:], 16
+        elif word[0] in string.digits or word[0] == ".":
+            if word.count(".") > 1:
+                raise InvalidSyntaxError(f"invalid float: {word}", pos)
+
+            typeof = TokenType.FLOAT if "." in word else TokenType.INTEGER
+            value, base = word, 10
+        else:
+            return TokenKind.LITERAL, TokenType.VAR, word
+
+        try:
+            value = float(value) if typeof == TokenType.FLOAT else int(value, base)
+        except ValueError:
+            what = "hexdecimal value" if base == 16 else "number"
+            raise InvalidSyntaxError(f"invalid {what}: {word}", pos) from None
+
+        return TokenKind.NUMBER, typeof, value
+
+
 def _prepare_string(string_val: str) -> str:
     replacements = {
         "\\\"": "\"",
@@ -0,0 +1,372 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Set
+
+from pycalc.tokentypes.tokens import Token, FuncDef
+from pycalc.tokentypes.types import TokenKind, TokenType, Stack, Namespace
+
+
+class ABCOptimizer(ABC):
+    @abstractmethod
+    def optimize(self, stacks: List[Stack[Token]], namespace: Namespace) -> List[Stack[Token]]:
+        """
+        Receives stacks of the whole program from the builder and the
+        namespace it is going to be executed with. Returns stacks
+        those give exactly the same results as the original ones
+        """
+
+    def optimize_stream(self, stacks: Iterable[Stack[Token]], namespace: Namespace) -> Iterator[Stack[Token]]:
+        """
+        Same as optimize(), but takes stacks one by one and yields them
+        as soon as they are optimized. Following lines are unknown yet,
+        so optimizations those depend on the whole program must not be
+        done here
+        """
+
+        for stack in stacks:
+            yield from self.optimize([stack], namespace)
+
+    def names(self, stacks: List[Stack[Token]]) -> Optional[FrozenSet[str]]:
+        """
+        Names of the namespace the optimized stacks may depend on, or None
+        if that is unknown. Found once for the built program, so stacks
+        optimized for it may be reused (see dependencies())
+        """
+
+        return None
+
+    def dependencies(self, names: FrozenSet[str], namespace: Namespace) -> Hashable:
+        """
+        What the optimized stacks depend on among the names (see names())
+        in the namespace: stacks optimized for namespaces with equal
+        dependencies are the same. By default, values of the names by
+        their identities
+        """
+
+        return tuple((name, id(namespace.get(name))) for name in sorted(names))
+
+
+# folding is skipped if the result would be larger than this number
+# of bits or characters: it is not worth to keep it in a program
+_MAX_SIZE = 4096
+
+# operators and pure builtins those always give numbers of known type
+# for operands of known types. Used to prove that identities like x*1
+# do not change the value
+_INT_OPERATORS = {
+    TokenType.OP_ADD, TokenType.OP_SUB, TokenType.OP_MUL, TokenType.OP_FLOORDIV,
+    TokenType.OP_MOD, TokenType.OP_LSHIFT, TokenType.OP_RSHIFT,
+    TokenType.OP_BITWISE_AND, TokenType.OP_BITWISE_OR, TokenType.OP_BITWISE_XOR,
+}
+_FLOAT_OPERATORS = {
+    TokenType.OP_ADD, TokenType.OP_SUB, TokenType.OP_MUL, TokenType.OP_DIV,
+    TokenType.OP_FLOORDIV, TokenType.OP_MOD,
+}
+_COMPARISONS = {
+    TokenType.OP_EQEQ, TokenType.OP_NOTEQ, TokenType.OP_GT,
+    TokenType.OP_GE, TokenType.OP_LT, TokenType.OP_LE,
+}
+_BUILTIN_TYPES = {int: int, float: float, len: int, ord: int}
+
+_NOT_CONSTANT = object()
+
+
+class _Malformed(Exception):
+    """
+    Raised if the stack would fail in runtime because of number of
+    values in it. Such stacks are left as they are, so they fail in
+    the same way
+    """
+
+
+class _Entry:
+    """
+    Value on the stack of the optimizer: index of the first token of
+    the value in the output, the value itself if it is known in advance
+    and the type of the value if it is known
+    """
+
+    __slots__ = ("start", "value", "type")
+
+    def __init__(self, start: int, value=_NOT_CONSTANT, typeof: Optional[type] = None):
+        self.start = start
+        self.value = value
+        self.type = typeof
+
+
+class ConstantFolder(ABCOptimizer):
+    """
+    Computes subexpressions of literals once, drops identities (x*1,
+    1*x, x+0, 0+x, x-0, x**1) where x is proven to be a number for
+    which they change nothing, and computes calls of pure functions
+    with literal arguments. Only integers, floats and strings are ever
+    computed in advance, and operations raising an exception are left
+    to fail in runtime.
+
+    Pure functions are recognized by identity with the values of the
+    namespace, and only if the program never binds their names itself.
+    That can be proven for the whole program only, so calls are not
+    computed in optimize_stream()
+    """
+
+    def __init__(self,
+                 executors: Dict[TokenType, Callable],
+                 unary_executors: Dict[TokenType, Callable],
+                 pure: Iterable[Callable] = ()
+                 ):
+        self.executors = executors
+        self.unary_executors = unary_executors
+        self.pure = tuple(pure)
+        self._pure_ids = {id(func) for func in self.pure}
+
+    def optimize(self, stacks: List[Stack[Token]], namespace: Namespace) -> List[Stack[Token]]:
+        functions = self._pure_functions(self.names(stacks), namespace)
+
+        return [self._optimize(stack, functions) for stack in stacks]
+
+    def optimize_stream(self, stacks: Iterable[Stack[Token]], namespace: Namespace) -> Iterator[Stack[Token]]:
+        return (self._optimize(stack, {}) for stack in stacks)
+
+    def names(self, stacks: List[Stack[Token]]) -> Optional[FrozenSet[str]]:
+        # calls of the pure functions are the only thing taken from
+        # the namespace
+        if not self.pure:
+            return frozenset()
+
+        return frozenset(called_names(stacks) - bound_names(stacks))
+
+    def dependencies(self, names: FrozenSet[str], namespace: Namespace) -> Hashable:
+        # pure functions are kept alive by the folder, so their ids
+        # are not reused
+        return tuple(sorted((name, id(func)) for name, func in self._pure_functions(names, namespace).items()))
+
+    def _pure_functions(self, names: FrozenSet[str], namespace: Namespace) -> Dict[str, Callable]:
+        """
+        Pure functions of the namespace among the names the program
+        calls, but can not override itself
+        """
+
+        return {
+            name: namespace[name] for name in names
+            if name in namespace and id(namespace[name]) in self._pure_ids
+        }
+
+    def _optimize(self, stack: Stack[Token], functions: Dict[str, Callable]) -> Stack[Token]:
+        try:
+            return self._fold(stack, functions)
+        except _Malformed:
+            return stack
+
+    def _fold(self, stack: Stack[Token], functions: Dict[str, Callable]) -> Stack[Token]:
+        output: Stack[Token] = Stack()
+        entries: List[_Entry] = []
+
+        for token in stack:
+            if token.kind in (TokenKind.NUMBER, TokenKind.STRING):
+                entries.append(_Entry(len(output), token.value, type(token.value)))
+                output.append(token)
+            elif token.type in (TokenType.VAR, TokenType.IDENTIFIER):
+                entries.append(_Entry(len(output)))
+                output.append(token)
+            elif token.kind == TokenKind.UNARY_OPERATOR:
+                operand, = self._pop(entries, 1)
+                value = self._compute(self.unary_executors[token.type], operand.value)
+                self._push(entries, output, token, operand.start, value, operand.type)
+            elif token.type == TokenType.OP_SEMICOLON:
+                if len(entries) != 1:
+                    raise _Malformed
+
+                entries.pop()
+                output.append(token)
+            elif token.type == TokenType.OP_EQ:
+                left, _ = self._pop(entries, 2)
+                entries.append(_Entry(left.start))
+                output.append(token)
+            elif token.kind == TokenKind.OPERATOR:
+                left, right = self._pop(entries, 2)
+
+                if self._is_identity(token.type, left, right):
+                    entries.append(_Entry(left.start, left.value, left.type))
+                    del output[right.start:]
+                elif self._is_identity(token.type, right, left, swapped=True):
+                    entries.append(_Entry(left.start, right.value, right.type))
+                    del output[left.start]
+                else:
+                    value = _NOT_CONSTANT
+
+                    if not self._too_big(token.type, left.value, right.value):
+                        value = self._compute(self.executors[token.type], left.value, right.value)
+
+                    typeof = self._result_type(token.type, left.type, right.type)
+                    self._push(entries, output, token, left.start, value, typeof)
+            elif token.type == TokenType.FUNCCALL:
+                args = self._pop(entries, token.value.argscount)
+                start = args[0].start if args else len(output)
+                func = functions.get(token.value.name)
+                value = _NOT_CONSTANT
+
+                if func is not None:
+                    value = self._compute(func, *(arg.value for arg in args))
+
+                typeof = _BUILTIN_TYPES.get(func) if func is not None else None
+                self._push(entries, output, token, start, value, typeof)
+            elif token.type == TokenType.FUNCDEF:
+                entries.append(_Entry(len(output)))
+                output.append(Token(
+                    kind=token.kind,
+                    typeof=token.type,
+                    value=FuncDef(
+                        name=token.value.name,
+                        args=token.value.args,
+                        body=self._optimize(token.value.body, functions)
+                    ),
+                    pos=token.pos
+                ))
+            else:
+                raise _Malformed
+
+        if len(entries) != 1:
+            raise _Malformed
+
+        return output
+
+    @staticmethod
+    def _pop(entries: List[_Entry], count: int) -> List[_Entry]:
+        if len(entries) < count:
+            raise _Malformed
+
+        if not count:
+            return []
+
+        popped = entries[-count:]
+        del entries[-count:]
+
+        return popped
+
+    @staticmethod
+    def _push(entries: List[_Entry], output: Stack[Token], token: Token,
+              start: int, value, typeof: Optional[type]):
+        """
+        Pushes the result of the operation. If it is known in advance,
+        tokens of operands are replaced by a single token of the value
+        """
+
+        if value is _NOT_CONSTANT:
+            entries.append(_Entry(start, typeof=typeof))
+            output.append(token)
+            return
+
+        del output[start:]
+        entries.append(_Entry(start, value, type(value)))
+
+        if isinstance(value, str):
+            kind, typeof = TokenKind.STRING, TokenType.STRING
+        elif isinstance(value, float):
+            kind, typeof = TokenKind.NUMBER, TokenType.FLOAT
+        else:
+            kind, typeof = TokenKind.NUMBER, TokenType.INTEGER
+
+        output.append(Token(kind=kind, typeof=typeof, value=value, pos=token.pos))
+
+    @staticmethod
+    def _compute(func: Callable, *args):
+        if any(arg is _NOT_CONSTANT for arg in args):
+            return _NOT_CONSTANT
+
+        try:
+            value = func(*args)
+        except Exception:
+            # let it fail in runtime, in the same moment
+            return _NOT_CONSTANT
+
+        if isinstance(value, int):
+            # the same conversion the interpreter does
+            value = int(value)
+
+        return value if type(value) in (int, float, str) else _NOT_CONSTANT
+
+    @staticmethod
+    def _too_big(optype: TokenType, left, right) -> bool:
+        if optype == TokenType.OP_POW and type(left) is int and type(right) is int:
+            return abs(left) > 1 and left.bit_length() * right > _MAX_SIZE
+        elif optype == TokenType.OP_LSHIFT and type(right) is int:
+            return right > _MAX_SIZE
+        elif optype == TokenType.OP_MUL:
+            sequence, times = (left, right) if isinstance(left, str) else (right, left)
+
+            return isinstance(sequence, str) and type(times) is int \
+                and len(sequence) * times > _MAX_SIZE
+
+        return False
+
+    @staticmethod
+    def _is_identity(optype: TokenType, value: _Entry, literal: _Entry, swapped: bool = False) -> bool:
+        """
+        Whether applying the operator to the value and the literal
+        gives the value itself
+        """
+
+        if type(literal.value) is not int or value.type not in (int, float):
+            return False
+
+        if optype == TokenType.OP_MUL:
+            return literal.value == 1
+        elif optype == TokenType.OP_ADD:
+            # -0.0 + 0 is 0.0
+            return literal.value == 0 and value.type is int
+        elif optype == TokenType.OP_SUB and not swapped:
+            return literal.value == 0 and value.type is int
+        elif optype == TokenType.OP_POW and not swapped:
+            return literal.value == 1
+
+        return False
+
+    @staticmethod
+    def _result_type(optype: TokenType, left: Optional[type], right: Optional[type]) -> Optional[type]:
+        if left not in (int, float) or right not in (int, float):
+            return None
+        elif optype in _COMPARISONS:
+            return int
+        elif left is int and right is int and optype in _INT_OPERATORS:
+            return int
+        elif optype in _FLOAT_OPERATORS and float in (left, right) or optype == TokenType.OP_DIV:
+            return float
+
+        return None
+
+
+def called_names(stacks: Iterable[Stack[Token]]) -> Set[str]:
+    """
+    Names of the functions the program calls, including the calls in
+    bodies of the functions it defines
+    """
+
+    called: Set[str] = set()
+
+    for stack in stacks:
+        for token in stack:
+            if token.type == TokenType.FUNCCALL:
+                called.add(token.value.name)
+            elif token.type == TokenType.FUNCDEF:
+                called.update(called_names([token.value.body]))
+
+    return called
+
+
+def bound_names(stacks: Iterable[Stack[Token]]) -> Set[str]:
+    """
+    Names the program may bind itself: names it assigns, names of the
+    functions it defines and their arguments
+    """
+
+    bound: Set[str] = set()
+
+    for stack in stacks:
+        for token in stack:
+            if token.type == TokenType.IDENTIFIER:
+                bound.add(token.value)
+            elif token.type == TokenType.FUNCDEF:
+                bound.add(token.value.name)
+                bound.update(arg.value for arg in token.value.args)
+                bound.update(bound_names([token.value.body]))
+
+    return bound
@@ -0,0 +1,301 @@
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
+
+from pycalc.lex.tokenizer import RegexTokenizer
+from pycalc.stack.builder import ABCBuilder
+from pycalc.tokentypes.tokens import Token, Func, FuncDef
+from pycalc.tokentypes.types import (PRIORITIES_TABLE, UNARY_OPERATORS, Priorities,
+                                     TokenKind, TokenType, Stack, InvalidSyntaxError)
+
+
+# marks the end of the token stream. None is already taken: lexer
+# uses it to mark the end of a line
+_EOF = Token(
+    kind=TokenKind.OTHER,
+    typeof=TokenType.OTHER,
+    value="",
+    pos=(-1, -1)
+)
+
+
+class PrattParser(RegexTokenizer, ABCBuilder):
+    """
+    Tokenizer and builder in a single pass. Tokens are taken right from
+    the lexer and are put into the reverse polish notation stacks by a
+    precedence climbing parser, without any intermediate tokens lists.
+    Output is the same as SortingStationBuilder makes from the output
+    of Tokenizer, so the same instance must be passed to the Interpreter
+    both as a tokenizer and a stack builder:
+
+        parser = PrattParser()
+        Interpreter(tokenize=parser, stackbuilder=parser)
+    """
+
+    def tokenize(self, data: str) -> List[Stack[Token]]:
+        return list(self.tokenize_stream([data]))
+
+    def tokenize_stream(self, stream: Iterable[str]) -> Iterator[Stack[Token]]:
+        return _Parser(self._statements(stream)).lines()
+
+    def build(self, tokens: List[Stack[Token]]) -> List[Stack[Token]]:
+        return tokens
+
+    def build_stream(self, tokens: Iterable[Stack[Token]]) -> Iterator[Stack[Token]]:
+        return iter(tokens)
+
+
+class _Parser:
+    def __init__(self, tokens: Iterator[Optional[Token]]):
+        self.tokens = tokens
+        self.lookahead: deque = deque()
+        # previously consumed token. Is None in the beginning of the line
+        self.prev: Optional[Token] = None
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        while len(self.lookahead) <= offset:
+            self.lookahead.append(next(self.tokens, _EOF))
+
+        return self.lookahead[offset]
+
+    def next(self) -> Optional[Token]:
+        if self.lookahead:
+            token = self.lookahead.popleft()
+        else:
+            token = next(self.tokens, _EOF)
+
+        self.prev = token
+        return token
+
+    def lines(self) -> Iterator[Stack[Token]]:
+        while self.peek() is not _EOF:
+            self.prev = None
+            output: Stack[Token] = Stack()
+            self.sequence(output)
+            token = self.next()
+
+            if token is not None:
+                raise self._unexpected(token)
+
+            yield output
+
+    def sequence(self, output: Stack[Token]):
+        """
+        Semicolon-separated expressions. Function body is a sequence too,
+        so it lasts until the comma, closing parenthesis or end of line
+        """
+
+        self.expression(output, Priorities.NONE)
+
+        while self._is(self.peek(), TokenType.OP_SEMICOLON):
+            output.append(self.next())
+
+            if self.peek() is None:
+                # trailing semicolon is allowed in the end of the line
+                return
+
+            self.expression(output, Priorities.NONE)
+
+    def expression(self, output: Stack[Token], min_priority: int):
+        self.operand(output)
+
+        while True:
+            token = self.peek()
+
+            if token is None or token.kind != TokenKind.OPERATOR \
+                    or token.type in (TokenType.OP_COMMA, TokenType.OP_SEMICOLON):
+                return
+
+            priority = PRIORITIES_TABLE[token.type]
+
+            if priority < min_priority:
+                return
+
+            target = self.prev
+            self.next()
+
+            if token.type == TokenType.OP_EQ:
+                if target.type != TokenType.VAR:
+                    raise InvalidSyntaxError(
+                        f"cannot assign to {repr(target.value)}",
+                        target.pos
+                    )
+
+                target.type = TokenType.IDENTIFIER
+
+            if token.type == TokenType.OP_POW:
+                # sorting station never pops power operator from the stack,
+                # so everything after it is its right operand
+                self.expression(output, Priorities.NONE)
+            else:
+                self.expression(output, priority + 1)
+
+            output.append(token)
+
+    def operand(self, output: Stack[Token]):
+        before = self.prev
+        token = self.next()
+
+        if token is None or token is _EOF:
+            if before is not None and before.kind == TokenKind.OPERATOR:
+                raise InvalidSyntaxError(
+                    "unexpected operator in the end of the expression",
+                    before.pos
+                )
+
+            raise InvalidSyntaxError("missing closing parenthesis", before.pos)
+        elif token.kind == TokenKind.OPERATOR:
+            self.unary(output, token, line_start=before is None)
+        elif token.kind in (TokenKind.NUMBER, TokenKind.STRING):
+            output.append(token)
+        elif token.type == TokenType.VAR:
+            if self._is(before, TokenType.OP_DOT):
+                token.type = TokenType.IDENTIFIER
+                output.append(token)
+            elif not self._is(self.peek(), TokenType.LPAREN):
+                output.append(token)
+            elif self._is_funcdef():
+                self.funcdef(output, token, token)
+            else:
+                self.funccall(output, token)
+        elif token.type == TokenType.LPAREN:
+            if self._is_funcdef(opened=True):
+                self.funcdef(output, None, before or token)
+            else:
+                self.expression(output, Priorities.NONE)
+                self.expect_rparen(token)
+        else:
+            raise self._unexpected(token)
+
+    def unary(self, output: Stack[Token], first: Token, line_start: bool):
+        ops = [first]
+
+        while self.peek() is not None and self.peek().kind == TokenKind.OPERATOR:
+            ops.append(self.next())
+
+        for op in ops:
+            if op.value not in UNARY_OPERATORS:
+                raise InvalidSyntaxError(f"illegal unary: {op.value}", op.pos)
+
+        if self.peek() is None or self.peek() is _EOF:
+            raise InvalidSyntaxError(
+                "unexpected operator in the end of the expression",
+                ops[-1].pos
+            )
+
+        # unary in the beginning of the line is always reported in the
+        # beginning of the line
+        pos = (self.peek().pos[0], 0) if line_start else ops[-1].pos
+        negative = sum(op.value == "-" for op in ops) & 1
+
+        self.expression(output, Priorities.HIGH + 1)
+        output.append(Token(
+            kind=TokenKind.UNARY_OPERATOR,
+            typeof=TokenType.UN_NEG if negative else TokenType.UN_POS,
+            value="-" if negative else "+",
+            pos=pos
+        ))
+
+    def funccall(self, output: Stack[Token], name: Token):
+        lparen = self.next()
+        argscount = 0
+
+        while not self._is(self.peek(), TokenType.RPAREN):
+            self.expression(output, Priorities.NONE)
+            argscount += 1
+
+            if not self._is(self.peek(), TokenType.OP_COMMA):
+                break
+
+            self.next()
+
+        self.expect_rparen(lparen)
+        output.append(Token(
+            kind=TokenKind.FUNC,
+            typeof=TokenType.FUNCCALL,
+            value=Func(
+                name=name.value,
+                argscount=argscount
+            ),
+            pos=name.pos
+        ))
+
+    def funcdef(self, output: Stack[Token], name: Optional[Token], before: Token):
+        if name is not None:
+            self.next()  # opening parenthesis
+
+        args = []
+        token = self.next()
+
+        # arguments list is already checked by lookahead
+        while token.type != TokenType.RPAREN:
+            if token.type == TokenType.VAR:
+                token.type = TokenType.IDENTIFIER
+                args.append(token)
+
+            token = self.next()
+
+        if name is None:
+            pos = before.pos
+        else:
+            pos = (name.pos[0], name.pos[1] + 1)
+
+        eq = self.next()
+
+        if name is None and before.type == TokenType.OP_EQ:
+            # reference tokenizer reports lambda assignment in
+            # a position of the lambda's own equality sign
+            before.pos = eq.pos
+
+        body: Stack[Token] = Stack()
+        self.sequence(body)
+
+        output.append(Token(
+            kind=TokenKind.FUNC,
+            typeof=TokenType.FUNCDEF,
+            value=FuncDef(
+                name=name.value if name else "",
+                args=args,
+                body=body
+            ),
+            pos=pos
+        ))
+
+    def expect_rparen(self, lparen: Token):
+        token = self.next()
+
+        if token is None or token is _EOF:
+            raise InvalidSyntaxError("missing closing parenthesis", lparen.pos)
+        elif token.type != TokenType.RPAREN:
+            raise self._unexpected(token)
+
+    def _is_funcdef(self, opened: bool = False) -> bool:
+        """
+        Looks ahead whether parenthesis are followed by arguments list
+        and equality sign
+        """
+
+        offset = 0 if opened else 1
+
+        if self._is(self.peek(offset), TokenType.RPAREN):
+            return self._is(self.peek(offset + 1), TokenType.OP_EQ)
+
+        while self._is(self.peek(offset), TokenType.VAR):
+            if self._is(self.peek(offset + 1), TokenType.RPAREN):
+                return self._is(self.peek(offset + 2), TokenType.OP_EQ)
+            elif not self._is(self.peek(offset + 1), TokenType.OP_COMMA):
+                return False
+
+            offset += 2
+
+        return False
+
+    @staticmethod
+    def _is(token: Optional[Token], typeof: TokenType) -> bool:
+        return token is not None and token.type == typeof
+
+    @staticmethod
+    def _unexpected(token: Token) -> InvalidSyntaxError:
+        if token.type == TokenType.RPAREN:
+            return InvalidSyntaxError("missing opening parenthesis", token.pos)
+
+        return InvalidSyntaxError(f"unexpected {repr(token.value)}", token.pos)
@@ -13,6 +13,8 @@ class Lexeme:
     It may be: number, literal, operator, lbrace, rbrace
     """
 
+    __slots__ = ("type", "value", "pos")
+
     def __init__(self, typeof: types.LexemeType, value: str, pos: Tuple[int, int]):
         self.type = typeof
         self.value = value
@@ -25,6 +27,10 @@ class Lexeme:
 
 
 class Token:
+    # programs consist of a lot of tokens, so they must be as
+    # small and as cheap to create as possible
+    __slots__ = ("kind", "type", "value", "pos")
+
     def __init__(self,
                  kind: types.TokenKind,
                  typeof: types.TokenType,
@@ -47,6 +53,8 @@ class Func:
     Func just represents some information about function call
     """
 
+    __slots__ = ("name", "argscount")
+
     def __init__(self, name: str, argscount: int):
         self.name = name
         self.argscount = argscount
@@ -62,6 +70,8 @@ class FuncDef:
     FuncDef represents function defining
     """
 
+    __slots__ = ("name", "args", "body")
+
     def __init__(self, name: str, args: Tokens, body: types.Stack):
         self.name = name
         self.args = args
@@ -76,9 +86,14 @@ class FuncDef:
 
 
 class Function:
-    def __init__(self, name: str, target: Callable):
+    # definition is set for functions defined by the program, it is
+    # owned by the interpreter that spawned the function
+    __slots__ = ("name", "target", "definition")
+
+    def __init__(self, name: str, target: Callable, definition: object = None):
         self.name = name
         self.target = target
+        self.definition = definition
 
     @property
     def __call__(self):
@@ -9,6 +9,25 @@ Number = Union[int, float]
 NamespaceValue = Union[Number, Callable]
 Namespace = Dict[str, NamespaceValue]
 
+
+class FrozenNamespace(dict):
+    """
+    Namespace that can not be changed, so it may be shared by any number
+    of evaluations (and threads). Binding a name of it in the namespaces
+    stack shadows the name in the namespace right above it instead (see
+    NamespaceStack.set())
+    """
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError("namespace is frozen")
+
+    __setitem__ = __delitem__ = __ior__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
 UNARY_OPERATORS = {"+", "-"}
 ALLOWED_LITERALS = ascii_letters + "_"
 
@@ -164,6 +183,10 @@ class PyCalcError(Exception):
         self.pos = pos
         super().__init__(message)
 
+    def __reduce__(self):
+        # errors are pickled to be sent from the worker processes
+        return type(self), (str(self), self.pos)
+
 
 class InvalidSyntaxError(PyCalcError):
     pass
@@ -185,5 +208,9 @@ class ExternalFunctionError(PyCalcError):
     pass
 
 
+class BudgetExceededError(PyCalcError):
+    pass
+
+
 class NoCodeError(Exception):
     pass
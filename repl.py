@@ -1,13 +1,27 @@
+import os
 from typing import Optional
 from sys import argv, stdin as _stdin, stdout as _stdout
 
-from std.stdlibrary import stdnamespace
+from std.stdlibrary import stdnamespace, stdpure, stdhigherorder
 from pycalc.interpreter import interpret
+from pycalc.interpreter.scriptcache import ScriptCache
+from pycalc.stack.optimizer import ConstantFolder
 from pycalc.tokentypes.types import PyCalcError, NoCodeError
 
 PROMPT = ">> "
 
 
+def _interpreter() -> interpret.Interpreter:
+    return interpret.Interpreter(
+        optimizer=ConstantFolder(
+            executors=interpret.Interpreter.executors,
+            unary_executors=interpret.Interpreter.unary_executors,
+            pure=stdpure
+        ),
+        pure=stdpure | stdhigherorder
+    )
+
+
 def _format_exc(
         code: str,
         exc: PyCalcError,
@@ -27,7 +41,7 @@ class InteractiveShell:
                  interpreter: Optional[interpret.ABCInterpreter] = None
                  ):
         self.prompt = prompt
-        self.interpreter = interpreter or interpret.Interpreter()
+        self.interpreter = interpreter or _interpreter()
 
     def session(self, stdin=_stdin, stdout=_stdout):
         while True:
@@ -53,7 +67,7 @@ class InteractiveShell:
 
 
 def interactive_mode():
-    interpreter = interpret.Interpreter()
+    interpreter = _interpreter()
     shell = InteractiveShell(
         prompt=PROMPT,
         interpreter=interpreter
@@ -63,7 +77,7 @@ def interactive_mode():
 
 def expr_exec_mode(expr: str):
     try:
-        print(interpret.Interpreter().interpret(expr, stdnamespace))
+        print(_interpreter().interpret(expr, stdnamespace))
     except PyCalcError as exc:
         print(_format_exc(expr, exc, file="<cli>"))
     except NoCodeError:
@@ -77,23 +91,23 @@ def script_exec_mode(filename: str):
         print("unsupported file extension:", filename)
         return
 
-    try:
-        with open(filename) as fd:
-            code = fd.read()
-    except FileNotFoundError:
+    if not os.path.isfile(filename):
         print("file not found:", filename)
         return
 
-    interpreter = interpret.Interpreter()
+    interpreter = _interpreter()
 
     try:
-        interpreter.interpret(code, stdnamespace)
+        # unchanged scripts are not tokenized and built again, their
+        # programs are loaded from __pycache__ next to them
+        interpreter.interpret_file(filename, stdnamespace, cache=ScriptCache())
     except PyCalcError as exc:
-        print(_format_exc(code, exc, file=fd.name))
+        with open(filename) as fd:
+            print(_format_exc(fd.read(), exc, file=fd.name))
     except NoCodeError:
         pass
     except Exception as exc:
-        print(f"{fd.name}:?:?: internal interpreter error:")
+        print(f"{filename}:?:?: internal interpreter error:")
         raise exc
 
 
@@ -1,3 +1,4 @@
+import asyncio
 from typing import List
 
 
@@ -23,3 +24,21 @@ def println_mem(mem: List) -> int:
     print(*mem, sep="", end="\n")
 
     return 0
+
+
+async def input_async(prompt: str = "") -> str:
+    """
+    Same as input(), but for Interpreter.interpret_async(): the line is
+    waited for in the thread, so the event loop is not blocked
+    """
+
+    return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+
+
+async def write_async(target, value) -> object:
+    """
+    Same as write(), but for Interpreter.interpret_async(): the value is
+    written in the thread, so the event loop is not blocked by the target
+    """
+
+    return await asyncio.get_running_loop().run_in_executor(None, target.write, value)
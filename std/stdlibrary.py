@@ -1,15 +1,96 @@
 from math import pi
 from functools import reduce
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Union
 
-from . import stdmem, stdstatements, stdio
+from pycalc.tokentypes.types import FrozenNamespace
 
+from . import stdmem, stdstatements, stdstream, stdio
+from .stdstream import Stream
 
-def _as_list(func: Callable) -> Callable[[Callable, Iterable], list]:
-    def decorator(a: Callable, b: Iterable) -> list:
-        return list(func(a, b))
 
-    return decorator
+def _map(func: Callable, iterable: Iterable) -> Union[list, Stream]:
+    # streams stay lazy, so chained maps and filters are fused
+    if isinstance(iterable, Stream):
+        return iterable.map(func)
+
+    return list(map(func, stdstream.values(iterable)))
+
+
+def _filter(func: Callable, iterable: Iterable) -> Union[list, Stream]:
+    if isinstance(iterable, Stream):
+        return iterable.filter(func)
+
+    return list(filter(func, stdstream.values(iterable)))
+
+
+def _map_steps(func: Callable, iterable: Iterable) -> stdstatements.Steps:
+    if isinstance(iterable, Stream):
+        return iterable.map(func)
+
+    results = []
+
+    for value in stdstream.values(iterable):
+        results.append((yield func, (value,)))
+
+    return results
+
+
+def _filter_steps(func: Callable, iterable: Iterable) -> stdstatements.Steps:
+    if isinstance(iterable, Stream):
+        return iterable.filter(func)
+    elif func is None:
+        return list(filter(func, stdstream.values(iterable)))
+
+    results = []
+
+    for value in stdstream.values(iterable):
+        if (yield func, (value,)):
+            results.append(value)
+
+    return results
+
+
+_EMPTY = object()
+
+
+def _reduce(*args):
+    if len(args) > 1:
+        args = (args[0], stdstream.values(args[1]), *args[2:])
+
+    return reduce(*args)
+
+
+def _reduce_steps(*args) -> stdstatements.Steps:
+    if len(args) not in (2, 3) or not hasattr(args[1], "__iter__"):
+        # let reduce itself fail
+        return reduce(*args)
+
+    func, iterable, *initial = args
+    result = initial[0] if initial else _EMPTY
+
+    # values of streams are passed through their stages on the way
+    for value in stdstream.source(iterable):
+        value = yield from stdstream.stages_steps(iterable, value)
+
+        if value is stdstream.SKIPPED:
+            continue
+        elif result is _EMPTY:
+            result = value
+        else:
+            result = yield func, (result, value)
+
+    if result is _EMPTY:
+        return reduce(func, ())
+
+    return result
+
+
+def _strjoin(separator: str, iterable: Iterable) -> str:
+    return str.join(separator, stdstream.values(iterable))
+
+
+def _strjoin_steps(separator: str, iterable: Iterable) -> stdstatements.Steps:
+    return str.join(separator, (yield from stdstream.collect.steps(iterable)))
 
 
 stdnamespace = {
@@ -19,7 +100,7 @@ stdnamespace = {
     "int": int,
     "float": float,
     "str": str,
-    "strjoin": str.join,
+    "strjoin": _strjoin,
     "range": range,
     "inv": lambda a: ~a,
     "pi": pi,
@@ -35,16 +116,48 @@ stdnamespace = {
     "mallocfor": stdmem.mem_allocfor,
     "get": stdmem.mem_get,
     "set": stdmem.mem_set,
+    "view": stdmem.mem_view,
     "slice": stdmem.slice_,
-    "len": len,
+    "len": stdstream.length,
 
-    "map": _as_list(map),
-    "filter": _as_list(filter),
-    "reduce": reduce,
+    "map": _map,
+    "filter": _filter,
+    "reduce": _reduce,
+    "lazy": stdstream.lazy,
+    "collect": stdstream.collect,
+    "foreach": stdstream.foreach,
     "while": stdstatements.while_,
     "if": stdstatements.if_else,
     "branch": stdstatements.branch,
 
     "nop": lambda: 0,
-    "call": lambda func: func(),
+    "call": stdstatements.call,
 }
+
+_map.steps = _map_steps
+_filter.steps = _filter_steps
+_reduce.steps = _reduce_steps
+_strjoin.steps = _strjoin_steps
+
+# functions without side effects, always giving the same result for the
+# same arguments. Their calls with literal arguments may be computed
+# before the program is executed
+stdpure = frozenset(stdnamespace[name] for name in (
+    "rt", "sqrt", "cbrt", "int", "float", "str", "strjoin", "inv", "chr", "ord", "len"
+))
+
+# functions without side effects of their own, those only call the
+# functions they are given. Functions of the program calling nothing but
+# these and the pure ones are pure too, so their results are memoized
+stdhigherorder = frozenset(stdnamespace[name] for name in (
+    "range", "map", "filter", "reduce", "lazy", "collect", "foreach", "if", "branch", "nop", "call"
+))
+
+# the same namespace, but it can not be changed. Programs binding its names
+# shadow them in their own globals, so it is shared by all of them (and by
+# threads) without being copied for every one
+stdlib = FrozenNamespace(stdnamespace)
+
+# the same as stdlib, but for Interpreter.interpret_async(): reading and
+# writing are awaited, so they do not block the event loop
+stdlib_async = FrozenNamespace(stdnamespace, input=stdio.input_async, write=stdio.write_async)
@@ -1,28 +1,184 @@
-from typing import List
+from array import array
+from typing import List, Sequence, Union
 
+from pycalc.interpreter.budget import allocate
 
-def mem_alloc(size: int) -> List[int]:
-    return [0] * size
+# types of elements of the memory, by their names in programs
+TYPES = {
+    "u8": "B",
+    "i8": "b",
+    "u16": "H",
+    "i16": "h",
+    "u32": "I",
+    "i32": "i",
+    "u64": "Q",
+    "i64": "q",
+    "f32": "f",
+    "f64": "d",
+}
+_NAMES = {typecode: name for name, typecode in TYPES.items()}
 
+_I64 = 2 ** 63
+_U64 = 2 ** 64
 
-def mem_allocfor(*values: int) -> List[int]:
-    return list(values)
 
+class Memory(array):
+    """
+    Region of memory: elements of the type are kept in place as raw bytes,
+    not as python objects. Supports the buffer protocol, so python functions
+    may read and write it without copying. Printed as the list of the
+    elements, the same as lists are
+    """
 
-def mem_get(mem: List[int], offset: int) -> int:
+    __slots__ = ()
+
+    @property
+    def type(self) -> str:
+        return _NAMES[self.typecode]
+
+    def __str__(self):
+        return str(self.tolist())
+
+    def __repr__(self):
+        return f"Memory({self.type!r}, {self.tolist()!r})"
+
+
+class View:
+    """
+    The bytes of the memory as elements of another type (see mem_view()).
+    Elements are read and written in place, nothing is copied. Printed as
+    the list of the elements, the same as the memory is. Its buffer is
+    taken by memoryview(view) (since python 3.12), or is the memory
+    attribute
+    """
+
+    __slots__ = ("memory",)
+
+    def __init__(self, memory: memoryview):
+        self.memory = memory
+
+    @property
+    def type(self) -> str:
+        return _NAMES[self.memory.format]
+
+    @property
+    def itemsize(self) -> int:
+        return self.memory.itemsize
+
+    def tolist(self) -> list:
+        return self.memory.tolist()
+
+    def tobytes(self) -> bytes:
+        return self.memory.tobytes()
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __iter__(self):
+        return iter(self.memory)
+
+    def __getitem__(self, index):
+        value = self.memory[index]
+
+        return View(value) if isinstance(value, memoryview) else value
+
+    def __setitem__(self, index, value):
+        self.memory[index] = value
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return memoryview(self.memory)
+
+    def __str__(self):
+        return str(self.tolist())
+
+    def __repr__(self):
+        return f"View({self.type!r}, {self.tolist()!r})"
+
+
+Mem = Union[Memory, View, List[int]]
+
+
+def mem_alloc(size: int, type_: str = "u8") -> Memory:
+    typecode = _typecode(type_)
+    itemsize = array(typecode).itemsize
+
+    if isinstance(size, int):
+        size = max(size, 0)
+        allocate(size * itemsize)
+
+    return Memory(typecode, bytes(size * itemsize))
+
+
+def mem_allocfor(*values: Union[int, float]) -> Memory:
+    """
+    Memory of the narrowest type among u8, i64, u64 and f64 all the values
+    fit. Integers are made floats only if there are floats among them, so
+    integers no integer type fits are an error
+    """
+
+    if not all(isinstance(value, int) for value in values):
+        typecode = "d"
+    elif all(0 <= value <= 255 for value in values):
+        typecode = "B"
+    elif all(-_I64 <= value < _I64 for value in values):
+        typecode = "q"
+    elif all(0 <= value < _U64 for value in values):
+        typecode = "Q"
+    else:
+        raise OverflowError("integers do not fit any type of memory")
+
+    allocate(len(values) * array(typecode).itemsize)
+
+    return Memory(typecode, values)
+
+
+def mem_view(mem: Mem, type_: str) -> View:
+    """
+    The same bytes of the memory, but as elements of another type. Nothing
+    is copied, so changes of the view are changes of the memory
+    """
+
+    if isinstance(mem, View):
+        mem = mem.memory
+
+    return View(memoryview(mem).cast("B").cast(_typecode(type_)))
+
+
+def mem_get(mem: Mem, offset: int) -> int:
     if 0 > offset >= len(mem):
         return -1
 
     return mem[offset]
 
 
-def mem_set(mem: List[int], offset: int, value: int) -> int:
+def mem_set(mem: Mem, offset: int, value: int) -> int:
     if 0 > offset or offset >= len(mem) or 0 > value > 255:
         return -1
 
-    mem[offset] = value
+    try:
+        mem[offset] = value
+    except (OverflowError, TypeError, ValueError):
+        # the value does not fit elements of the memory
+        return -1
+
     return 0
 
 
-def slice_(mem: List[int], begin: int, end: int) -> List[int]:
-    return mem[begin:end]
+def slice_(mem: Sequence, begin: int, end: int) -> Sequence:
+    copy = mem[begin:end]
+
+    if isinstance(copy, View):
+        copy = Memory(copy.memory.format, copy.tobytes())
+    elif isinstance(copy, array):
+        copy = Memory(copy.typecode, copy.tobytes())
+
+    allocate(len(copy) * getattr(copy, "itemsize", 1))
+
+    return copy
+
+
+def _typecode(type_: str) -> str:
+    if type_ not in TYPES:
+        raise ValueError(f"unknown type of memory: {type_} (expected one of {', '.join(TYPES)})")
+
+    return TYPES[type_]
@@ -1,8 +1,22 @@
 from itertools import islice
-from typing import Callable, Optional, Union
+from typing import Callable, Generator, Optional, Tuple, Union
 
 from pycalc.tokentypes.types import Number, ArgumentsError
 
+# statements call one of their callbacks in tail position. Their tailcall
+# attributes tell the interpreter which one would be called (or None if
+# the statement gives a value itself), so recursion through them does
+# not grow the python stack
+TailCall = Optional[Tuple[Callable, tuple]]
+
+# functions calling their callbacks many times may tell which calls they
+# make: steps attribute of such a function receives the same arguments
+# and returns the generator yielding the calls (callable and its
+# arguments), receiving their results and returning the result of the
+# function. So the interpreter may make the calls itself, and pause
+# in between (see Interpreter.interpret_async())
+Steps = Generator[Tuple[Callable, tuple], object, object]
+
 
 def if_else(
         condition: Number,
@@ -18,6 +32,23 @@ def _if(condition: Number, cb: Callable) -> int:
     return cb() if condition else 0
 
 
+def _if_else_tailcall(
+        condition: Number,
+        if_cb: Callable,
+        else_cb: Optional[Callable] = None) -> TailCall:
+    if condition:
+        return if_cb, ()
+
+    return (else_cb, ()) if else_cb is not None else None
+
+
+if_else.tailcall = _if_else_tailcall
+# statement attribute tells which statement the function is, so its calls
+# with lambdas written in place may be compiled into jumps to the code of
+# the lambdas, and the lambdas are never created (see VMInterpreter)
+if_else.statement = "if"
+
+
 def while_(condition: Callable, body: Callable) -> int:
     while condition():
         body()
@@ -25,13 +56,24 @@ def while_(condition: Callable, body: Callable) -> int:
     return 0
 
 
+def _while_steps(condition: Callable, body: Callable) -> Steps:
+    while (yield condition, ()):
+        yield body, ()
+
+    return 0
+
+
+while_.steps = _while_steps
+while_.statement = "while"
+
+
 def branch(*values: Union[Number, Callable]) -> int:
     """
     This is also kind of if, but a bit better
     """
 
     if len(values) < 2 or callable(values[0]):
-        raise ArgumentsError("invalid arguments")
+        raise ArgumentsError("invalid arguments", (-1, -1))
 
     pairs = zip(
         islice(values, None, None, 2),
@@ -46,3 +88,33 @@ def branch(*values: Union[Number, Callable]) -> int:
         return values[-1]()
 
     return 0
+
+
+def _branch_tailcall(*values: Union[Number, Callable]) -> TailCall:
+    if len(values) < 2 or callable(values[0]):
+        return None
+
+    pairs = zip(
+        islice(values, None, None, 2),
+        islice(values, 1, None, 2)
+    )
+
+    for cond, callback in pairs:
+        if cond:
+            return callback, ()
+
+    if len(values) % 2:
+        return values[-1], ()
+
+    return None
+
+
+branch.tailcall = _branch_tailcall
+branch.statement = "branch"
+
+
+def call(func: Callable) -> Number:
+    return func()
+
+
+call.tailcall = lambda func: (func, ())
@@ -0,0 +1,145 @@
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from pycalc.interpreter.budget import metered
+
+from .stdstatements import Steps
+
+# kinds of the stages of streams
+MAP = 0
+FILTER = 1
+
+# value of the source that was filtered out by some of the stages
+SKIPPED = object()
+
+Stage = Tuple[int, Optional[Callable]]
+
+
+class Stream:
+    """
+    Lazy sequence: values of the source are passed through the stages
+    (maps and filters) only while the stream is iterated. Mapping or
+    filtering the stream gives the new stream with one more stage, so
+    chained maps and filters are done in a single pass over the source,
+    and no list of the intermediate values is ever made. Every iteration
+    starts from the source again. Every value of the source is a step of
+    the budget
+    """
+
+    __slots__ = ("source", "stages")
+
+    def __init__(self, source: Iterable, stages: Tuple[Stage, ...] = ()):
+        self.source = source
+        self.stages = stages
+
+    def map(self, func: Callable) -> "Stream":
+        return Stream(self.source, self.stages + ((MAP, func),))
+
+    def filter(self, func: Optional[Callable]) -> "Stream":
+        return Stream(self.source, self.stages + ((FILTER, func),))
+
+    def __iter__(self) -> Iterator:
+        values = iter(metered(self.source))
+
+        for kind, func in self.stages:
+            values = map(func, values) if kind == MAP else filter(func, values)
+
+        return values
+
+    def __repr__(self):
+        return f"<stream of {self.source!r}, {len(self.stages)} stages>"
+
+
+def lazy(iterable: Iterable) -> Stream:
+    return iterable if isinstance(iterable, Stream) else Stream(iterable)
+
+
+def collect(iterable: Iterable) -> list:
+    return list(values(iterable))
+
+
+def length(iterable: Iterable) -> int:
+    if not isinstance(iterable, Stream):
+        return len(iterable)
+
+    count = 0
+
+    for count, _ in enumerate(iterable, 1):
+        pass
+
+    return count
+
+
+def foreach(func: Callable, iterable: Iterable) -> int:
+    """
+    Calls the function for every value, results are dropped
+    """
+
+    deque(map(func, values(iterable)), 0)
+
+    return 0
+
+
+def values(iterable: Iterable) -> Iterable:
+    # streams take steps of the budget for values of their sources themselves
+    return iterable if isinstance(iterable, Stream) else metered(iterable)
+
+
+def source(iterable: Iterable) -> Iterable:
+    return metered(iterable.source if isinstance(iterable, Stream) else iterable)
+
+
+def stages_steps(iterable: Iterable, value: object) -> Steps:
+    """
+    Steps passing the value of the source through the stages of the stream
+    (see Steps). Returns the value it became, or SKIPPED if it is filtered
+    out. Values of other iterables are returned as they are
+    """
+
+    for kind, func in iterable.stages if isinstance(iterable, Stream) else ():
+        if kind == MAP:
+            value = yield func, (value,)
+        elif not ((yield func, (value,)) if func is not None else value):
+            return SKIPPED
+
+    return value
+
+
+def _collect_steps(iterable: Iterable) -> Steps:
+    results: List[object] = []
+
+    for value in source(iterable):
+        value = yield from stages_steps(iterable, value)
+
+        if value is not SKIPPED:
+            results.append(value)
+
+    return results
+
+
+def _length_steps(iterable: Iterable) -> Steps:
+    if not isinstance(iterable, Stream):
+        return len(iterable)
+
+    count = 0
+
+    for value in source(iterable):
+        if (yield from stages_steps(iterable, value)) is not SKIPPED:
+            count += 1
+
+    return count
+
+
+def _foreach_steps(func: Callable, iterable: Iterable) -> Steps:
+    for value in source(iterable):
+        value = yield from stages_steps(iterable, value)
+
+        if value is not SKIPPED:
+            yield func, (value,)
+
+    return 0
+
+
+collect.steps = _collect_steps
+length.steps = _length_steps
+foreach.steps = _foreach_steps
@@ -1,7 +1,8 @@
 from unittest import TestSuite
 
-from .testcases import evaluation_tests
+from .testcases import evaluation_tests, tokenizer_tests
 
 
 full_suite = TestSuite()
 full_suite.addTest(evaluation_tests)
+full_suite.addTest(tokenizer_tests)
@@ -1,15 +1,75 @@
+import os
+import pickle
+import asyncio
+import traceback
+from array import array
+from tempfile import TemporaryDirectory
+from io import StringIO
 from math import pi
-from unittest import TestCase, TestSuite, makeSuite
-
-from std.stdlibrary import stdnamespace
-from pycalc.tokentypes.tokens import Function
-from pycalc.interpreter.interpret import Interpreter
-from pycalc.tokentypes.types import InvalidSyntaxError
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, TestSuite, makeSuite, skipIf
+from multiprocessing.shared_memory import SharedMemory
+
+from std.stdlibrary import stdnamespace, stdlib, stdlib_async, stdpure, stdhigherorder
+from std.stdio import input_async
+from std.stdstream import Stream
+from std.stdmem import Memory
+from pycalc.tokentypes.tokens import Token, Function
+from pycalc.lex.tokenizer import Tokenizer, RegexTokenizer
+from pycalc.stack.builder import SortingStationBuilder
+from pycalc.stack.pratt import PrattParser
+from pycalc.stack.optimizer import ABCOptimizer, ConstantFolder
+from pycalc.interpreter.interpret import Interpreter, NamespaceStack
+from pycalc.interpreter.cache import ProgramCache, program_size
+from pycalc.interpreter.memo import MemoCache
+from pycalc.interpreter.budget import Budget
+from pycalc.interpreter import batch
+from pycalc.interpreter.parallel import ParallelEvaluator, interpret_many
+from pycalc.interpreter.scriptcache import ScriptCache, dump_program, load_program, file_digest
+from pycalc.interpreter.closures import (ClosureInterpreter, Scope, resolve,
+                                         ARGUMENT, CELL, GLOBAL, DYNAMIC)
+from pycalc.interpreter.pyast import AstInterpreter, FILENAME
+from pycalc.interpreter.vm import VMInterpreter, FALLBACK, MAKE_FUNCTION, STATEMENT
+from pycalc.tokentypes.types import (InvalidSyntaxError, NoCodeError, NameNotFoundError, TokenType,
+                                     FrozenNamespace, BudgetExceededError, ExternalFunctionError)
 
 
 interpreter = Interpreter()
 evaluate = lambda code: interpreter.interpret(code, stdnamespace)
 
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def read_examples(directory=EXAMPLES_DIR):
+    # the repl caches built scripts in __pycache__ next to them
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+
+        if filename.endswith(".calc") and os.path.isfile(path):
+            with open(path) as fd:
+                yield fd.read()
+
+
+def dump_tokens(tokens):
+    """
+    Turns tokens into plain tuples, so the output of different
+    implementations can be compared
+    """
+
+    output = []
+
+    for token in tokens:
+        value = token.value
+
+        if token.type == TokenType.FUNCDEF:
+            value = (value.name, dump_tokens(value.args), dump_tokens(value.body))
+        elif token.type == TokenType.FUNCCALL:
+            value = (value.name, value.argscount)
+
+        output.append((token.kind, token.type, value, token.pos))
+
+    return output
+
 
 class TestNumbers(TestCase):
     def test_integer(self):
@@ -227,6 +287,1362 @@ class TestLambdas(TestCase):
             evaluate("a=x)=x+1")
 
 
+class TestRegexTokenizer(TestCase):
+    sources = (
+        "a = 5", "2+-3", "a +-+ b", "--1", "-2**2", "2**3**2",
+        "0x175ffa14", ".1", "0.1", "a.b", "x.y\n a.b", "1+\n2",
+        "\"ab\\\"c\" + \"d\"", "\"a\nb\" x", "a\n\nb", "x;y;z",
+        "((1))\n\n\n(2)", "f(x, y) = x+y\nf(1,\n 2)", "f(x)=x+5;x",
+        "map((x)=x+1, range(0,3))", "a=(x=x+1", "f(a) = y(b) = a * b",
+    )
+
+    def assertSameTokens(self, code):
+        self.assertEqual(
+            [dump_tokens(line) for line in RegexTokenizer().tokenize(code)],
+            [dump_tokens(line) for line in Tokenizer().tokenize(code)],
+        )
+
+    def assertSameError(self, code):
+        with self.assertRaises(InvalidSyntaxError) as expected:
+            Tokenizer().tokenize(code)
+
+        with self.assertRaises(InvalidSyntaxError) as got:
+            RegexTokenizer().tokenize(code)
+
+        self.assertEqual(str(got.exception), str(expected.exception))
+        self.assertEqual(got.exception.pos, expected.exception.pos)
+
+    def test_same_as_reference(self):
+        for code in self.sources:
+            with self.subTest(code=code):
+                self.assertSameTokens(code)
+
+    def test_examples(self):
+        for code in read_examples():
+            self.assertSameTokens(code)
+
+    def test_same_errors(self):
+        for code in ("1.", ")", "a)\n(", "2 ! 3", "0x"):
+            with self.subTest(code=code):
+                self.assertSameError(code)
+
+    def test_invalid_number(self):
+        with self.assertRaises(InvalidSyntaxError):
+            RegexTokenizer().tokenize("12abc")
+
+    def test_unterminated_string(self):
+        with self.assertRaises(InvalidSyntaxError):
+            RegexTokenizer().tokenize("\"abc")
+
+
+class TestPrattParser(TestCase):
+    # values following each other are rejected by the parser instead
+    # of failing in runtime, so such sources are not compared
+    sources = tuple(
+        code for code in TestRegexTokenizer.sources
+        if code not in ("\"a\nb\" x", "a=(x=x+1")
+    ) + (
+        "2**3+1", "-2**2+1", "1+2**3*4-5", "a = b == 2", "x = y = 2",
+        "a = (x) = x + 1", "f() = 5", "x=1;", "f(x)=x;", "-f(2)", "2*-3",
+        "a; -b", "x = -\n 3", "a.b.c", "2 ** a.b", "f(1, (x) = x; 2, 3)",
+        "branch(a, () = 1, b, () = 2,\n)", "f(g(h(1)), 2)",
+        "1 + f(2) * g(3, 4) ** 2 - h()", "f(x) = g(y) = x + y; z",
+        "1 < 2 <= 3 > 4 >= 5 == 6 != 7",
+    )
+
+    def assertSameStacks(self, code):
+        parser = PrattParser()
+        reference = SortingStationBuilder().build(Tokenizer().tokenize(code))
+
+        self.assertEqual(
+            [dump_tokens(stack) for stack in parser.build(parser.tokenize(code))],
+            [dump_tokens(stack) for stack in reference],
+        )
+
+    def test_same_as_reference(self):
+        for code in self.sources:
+            with self.subTest(code=code):
+                self.assertSameStacks(code)
+
+    def test_examples(self):
+        for code in read_examples():
+            self.assertSameStacks(code)
+
+    def test_evaluate(self):
+        parser = PrattParser()
+        pratt = Interpreter(tokenize=parser, stackbuilder=parser)
+
+        self.assertEqual(pratt.interpret("f(x,y)=x*y \n f(2+5, 3*2)", stdnamespace), 42)
+        self.assertEqual(pratt.interpret("2**3**2", stdnamespace), 512)
+        self.assertEqual(pratt.interpret("a=(x)=x+1 \n a(1)", stdnamespace), 2)
+
+    def test_invalid_syntax(self):
+        parser = PrattParser()
+
+        for code in ("f(x+1)=x+2", "f(1)=2", "f(x=2", "fx)=2", "f(x)=",
+                     "a=(x=x+1", "a=x)=x+1", "*3", "a;;b"):
+            with self.subTest(code=code):
+                with self.assertRaises(InvalidSyntaxError):
+                    parser.tokenize(code)
+
+
+class CountingToken(Token):
+    """
+    Token counting reads of its attributes by all the tokens, so amount
+    of work is measured without the timer
+    """
+
+    __slots__ = ()
+    reads = 0
+
+    def __getattribute__(self, name):
+        CountingToken.reads += 1
+        return object.__getattribute__(self, name)
+
+
+class TestSortingStationBuilder(TestCase):
+    @staticmethod
+    def nested_calls(depth):
+        return "f(" * depth + "1" + ")" * depth
+
+    def test_argscount(self):
+        tokens = RegexTokenizer().tokenize("f(1, (2)+3, g((4), h()), (x)=x, 5,)")
+        funccalls = {
+            token.value.name: token.value.argscount
+            for token in SortingStationBuilder().build(tokens)[0]
+            if token.type == TokenType.FUNCCALL
+        }
+
+        self.assertEqual(funccalls, {"f": 5, "g": 2, "h": 0})
+
+    def test_deeply_nested_calls(self):
+        self.assertEqual(evaluate(
+            "f(x)=x+1 \n" + self.nested_calls(2000)
+        ), 2001)
+
+    def test_linear_scaling(self):
+        builder = SortingStationBuilder()
+        small, big = (
+            [CountingToken(token.kind, token.type, token.value, token.pos) for token in
+             RegexTokenizer().tokenize(self.nested_calls(depth))[0]]
+            for depth in (3333, 33333)
+        )
+        self.assertEqual(len(big), 100_000)
+
+        reads = []
+
+        for tokens in (small, big):
+            CountingToken.reads = 0
+            builder._build_line(tokens)
+            reads.append(CountingToken.reads)
+
+        # 10 times more tokens must be read about 10 times more,
+        # quadratic algorithm would read them about 100 times more
+        self.assertLess(reads[1] / reads[0], 11)
+
+
+class TestStreaming(TestCase):
+    code = "a = 5\nf(x) =\n    x * 2\nf(a)\n"
+
+    def test_result(self):
+        self.assertEqual(interpreter.interpret_stream(StringIO(self.code), stdnamespace), 10)
+
+    def test_same_tokens(self):
+        for code in TestRegexTokenizer.sources + tuple(read_examples()):
+            with self.subTest(code=code):
+                self.assertEqual(
+                    [dump_tokens(line) for line in RegexTokenizer().tokenize_stream(StringIO(code))],
+                    [dump_tokens(line) for line in RegexTokenizer().tokenize(code)],
+                )
+
+    def test_executes_while_reading(self):
+        for engine in (Interpreter(), Interpreter(PrattParser(), PrattParser())):
+            executed = []
+            namespace = {**stdnamespace, "log": lambda x: executed.append(x) or 0}
+
+            def lines():
+                yield "log(1)\n"
+                self.assertEqual(executed, [1])
+                yield "log(\n"
+                yield "2)\n"
+                self.assertEqual(executed, [1, 2])
+                yield "f)"
+
+            with self.assertRaises(InvalidSyntaxError):
+                engine.interpret_stream(lines(), namespace)
+
+            self.assertEqual(executed, [1, 2])
+
+    def test_no_code(self):
+        with self.assertRaises(NoCodeError):
+            interpreter.interpret_stream(StringIO("\n\n"), stdnamespace)
+
+
+def run(engine, code):
+    """
+    Result of the code or the error it fails with, so the behaviour
+    of different interpreters can be compared
+    """
+
+    try:
+        result = engine.interpret(code, dict(stdnamespace))
+    except Exception as exc:
+        return type(exc), str(exc), getattr(exc, "pos", None)
+
+    if isinstance(result, Function):
+        return Function, result.name
+
+    return result
+
+
+class TestNamespaceStack(TestCase):
+    def test_copy_is_independent(self):
+        namespaces = NamespaceStack([{"a": 1}, {}])
+        copy = namespaces.copy()
+        namespaces.add_namespace({"a": 2})
+        copy.add_namespace({"b": 3})
+
+        self.assertEqual(namespaces.get("a"), 2)
+        self.assertEqual(copy.get("a"), 1)
+        self.assertRaises(NameNotFoundError, namespaces.get, "b")
+        self.assertEqual(len(namespaces), len(copy))
+
+    def test_copy_shares_namespaces(self):
+        namespaces = NamespaceStack([{"a": 1}, {}])
+        copy = namespaces.copy()
+        copy.set("a", 2)
+        copy.set("b", 3)
+
+        self.assertEqual(list(namespaces), [{"a": 2}, {"b": 3}])
+        self.assertEqual(namespaces.pop(), {"b": 3})
+        self.assertEqual(list(copy), [{"a": 2}, {"b": 3}])
+
+
+class TestClosureInterpreter(TestCase):
+    sources = (
+        "2**3**2+1", "-2**2+1", "--1 + 2 * 3 // 2", "1/0", "x", "a.b", "1 2", "x = 1;", "f(x) = x;;",
+        "a = 5; a * 2", "x = y = 2\nx + y", "f(x) = y(z) = x * z\nf(2)(3)", "a = (x) = x + 1\na(1)",
+        "f(x) = x + 1\nf(1, 2)", "g(1)", "pi(2)", "chr(-1)", "branch(1)", "f(x) = x 1\nf(2)",
+        "fib(n) = if(n < 2, () = n, () = fib(n - 1) + fib(n - 2))\nfib(15)",
+        "c = 0\nwhile(() = c < 10, () = c = c + 1)\nc",
+        "strjoin(\",\", map(str, range(0, 5)))",
+        "+".join(["1"] * 5000),
+        "f(x) = " + "+".join(["x"] * 1000) + "\nf(2)",
+    )
+
+    def test_same_as_interpreter(self):
+        for code in self.sources + tuple(code for code in read_examples() if "input(" not in code):
+            with self.subTest(code=code[:50]):
+                self.assertEqual(run(ClosureInterpreter(), code), run(Interpreter(), code))
+
+    def test_function_body_compiled_once(self):
+        engine = ClosureInterpreter()
+        compile = engine.compile
+        compiled = []
+        engine.compile = lambda expression, *args: compiled.append(expression) or compile(expression, *args)
+        engine.interpret("f(x) = x * 2\nreduce((a, b) = a + f(b), range(0, 100))", stdnamespace)
+
+        # two lines and two function bodies, no matter how many calls were made
+        self.assertEqual(len(compiled), 4)
+
+
+class TestAstInterpreter(TestCase):
+    def test_same_as_interpreter(self):
+        for code in TestClosureInterpreter.sources + tuple(code for code in read_examples() if "input(" not in code):
+            with self.subTest(code=code[:50]):
+                self.assertEqual(run(AstInterpreter(), code), run(Interpreter(), code))
+
+    def test_traceback_position(self):
+        try:
+            AstInterpreter().interpret("a = 1\nb = 0\n\n  a / b", stdnamespace)
+        except ZeroDivisionError as exc:
+            frame = traceback.extract_tb(exc.__traceback__)[-1]
+            self.assertEqual((frame.filename, frame.lineno), (FILENAME, 4))
+        else:
+            self.fail("ZeroDivisionError is not raised")
+
+
+class TestResolver(TestCase):
+    sources = (
+        "counter(c) = () = c = c + 1\nk = counter(0)\nk(); k(); k()",
+        "h(z) = f(x) = (y) = x + y + z\nh(1)(2)(3)",
+        "f(x) = g(y) = x * y\nf(2)\ng(5)",
+        "x = 10\nf(x) = x + 1\nf(1) + x",
+        "f() = y * 2\ny = 4\nf()",
+        "sqrt = 5\nf(x) = sqrt\nf(1)",
+        "f(x) = y\nf(1)",
+        "f(x) = (x) = x * 2\nf(1)(5)",
+        "f(x) = x = x + 1; x\nf(1)",
+        "f(x) = (y) = x = x + y\ng = f(1)\ng(2); g(3)",
+        "f(n) = if(n == 0, () = t, () = t = n; f(n - 1))\nf(3)",
+        "f(n) = m = n; if(n == 0, () = m, () = f(n - 1) * 10 + m)\nf(4)",
+        "f(n, acc) = if(n == 0, () = acc, () = f(n - 1, acc + n))\nf(50, 0)",
+        "outer(a) = inner(b) = a = a + b; inner(1); inner(2); a\nouter(10)",
+        "f(x) = reduce((acc, v) = acc + v * x, range(0, 10))\nf(3)",
+    )
+
+    def test_same_as_interpreter(self):
+        for engine in (ClosureInterpreter, AstInterpreter):
+            for code in self.sources:
+                with self.subTest(engine=engine.__name__, code=code):
+                    self.assertEqual(run(engine(), code), run(Interpreter(), code))
+
+    def test_resolve(self):
+        engine = ClosureInterpreter()
+        (funcdef, *_), = engine.stackbuilder.build(engine.tokenizer.tokenize("f(a, b) = c = (d) = a + d"))
+        outer = Scope(None, funcdef)
+        inner = Scope(outer, [token for token in funcdef.value.body if token.type == TokenType.FUNCDEF][0])
+
+        self.assertEqual(resolve(outer, "a"), (ARGUMENT, 0))
+        self.assertEqual(resolve(outer, "c"), (DYNAMIC, 0))
+        self.assertEqual(resolve(outer, "e"), (GLOBAL, 0))
+        self.assertEqual(resolve(inner, "d"), (ARGUMENT, 0))
+        self.assertEqual(resolve(inner, "b"), (CELL, 0))
+        self.assertEqual(resolve(inner, "c"), (DYNAMIC, 0))
+        self.assertEqual(resolve(None, "a"), (GLOBAL, 0))
+
+
+class TestRecursion(TestCase):
+    # deeper than the python recursion limit
+    depth = 5000
+
+    def test_tail_calls(self):
+        self.assertEqual(
+            evaluate(f"f(n, acc) = if(n == 0, () = acc, () = f(n - 1, acc + n))\nf({self.depth}, 0)"),
+            self.depth * (self.depth + 1) // 2
+        )
+        self.assertEqual(evaluate(f"f(n) = branch(n == 0, () = 0, () = f(n - 1))\nf({self.depth})"), 0)
+        self.assertEqual(evaluate(f"f(n) = call(() = if(n, () = f(n - 1), () = 7))\nf({self.depth})"), 7)
+
+    def test_not_tail_calls(self):
+        self.assertEqual(evaluate(f"f(n) = if(n == 0, () = 0, () = 1 + f(n - 1))\nf({self.depth})"), self.depth)
+
+    def test_same_as_python_recursion(self):
+        sources = TestResolver.sources + (
+            "f(n) = if(n == 0, () = 1 / 0, () = f(n - 1))\nf(10)",
+            "f(n) = if(n == 0, () = g(1), () = f(n - 1))\ng() = 1\nf(10)",
+            "f(n) = if(n == 0, () = x, () = f(n - 1))\nf(10)",
+            "f(n) = if(n == 0, 1, () = f(n - 1))\nf(10)",
+            "f(n) = if(n == 0, () = 1 2, () = 1 + f(n - 1))\nf(10)",
+            "f(n) = branch(n == 0, () = 0, 1)\nf(1)",
+            "if(1, (x) = x)",
+            "if(1, () = 1, () = 2, 3)",
+        )
+
+        for code in sources:
+            with self.subTest(code=code):
+                self.assertEqual(run(Interpreter(), code), run(ClosureInterpreter(), code))
+
+
+class TestVMInterpreter(TestCase):
+    def test_same_as_interpreter(self):
+        for code in TestClosureInterpreter.sources + tuple(code for code in read_examples() if "input(" not in code):
+            with self.subTest(code=code[:50]):
+                self.assertEqual(run(VMInterpreter(), code), run(Interpreter(), code))
+
+    def compile(self, code):
+        engine = VMInterpreter()
+        return [engine.compile(stack) for stack in engine.stackbuilder.build(engine.tokenizer.tokenize(code))]
+
+    def test_stacksize(self):
+        self.assertEqual(self.compile("1")[0].stacksize, 1)
+        self.assertEqual(self.compile("1 + 2 * 3")[0].stacksize, 3)
+        self.assertEqual(self.compile("1 * 2 + 3")[0].stacksize, 2)
+        self.assertEqual(self.compile("f(1, 2, 3 + 4)")[0].stacksize, 4)
+
+    def test_function_body_stacksize(self):
+        block, = self.compile("f(x) = x + x * x")
+        function, = block.consts
+
+        self.assertEqual(function.body.stacksize, 3)
+
+    def test_pools(self):
+        block, = self.compile("a = a + 1 + 1.0 + a")
+
+        self.assertEqual(block.names, ["a"])
+        self.assertEqual(block.consts, ["a", 1, 1.0])
+        self.assertEqual(len(block.code), len(block.positions) * 2)
+
+    def test_fallback(self):
+        block, = self.compile("1 2")
+
+        self.assertEqual(list(block.code), [FALLBACK, 0])
+
+    statements = (
+        "if(0, () = 2, () = 3) + if(1, () = 2) + if(0, () = 2)",
+        "i = 0\nwhile(() = i < 10, () = i = i + 1)\ni",
+        "branch(0, () = 1, 1, () = 2, () = 3) + branch(0, () = 1, 0, () = 2, () = 3) + branch(0, () = 1)",
+        "branch(print, () = 1)",
+        "if(1, () = y = 5)\ny",
+        "y = 1\nif(1, () = y = 5)\ny",
+        "i = 0\nwhile(() = i < 3, () = i = i + 1; g() = i)\ng()",
+        "if(1, () = f = () = 5)\nf()",
+        "if(1, () = if(0, () = 1, () = 2 + if(1, () = 1 / 0)))",
+        "if(1, () = if(0, () = 1, () = 2 + if(1, () = x)))",
+        "f() = 1\nif(1, () = branch(1, () = f(2)))",
+        "if = (a, b, c) = a + 1\nif(1, () = 2, () = 3)",
+        "while(() = 1, () = 1 2)",
+    )
+
+    def test_statements_same_as_interpreter(self):
+        for code in self.statements:
+            with self.subTest(code=code):
+                self.assertEqual(run(VMInterpreter(), code), run(Interpreter(), code))
+
+    def test_statements_inlined(self):
+        block, = self.compile("while(() = 1, () = if(1, () = 2))")
+
+        self.assertEqual(list(block.code[::2]).count(STATEMENT), 2)
+        self.assertNotIn(MAKE_FUNCTION, block.code[::2])
+
+        # callbacks those are not lambdas without arguments are called
+        block, = self.compile("if(1, (x) = 2)")
+
+        self.assertNotIn(STATEMENT, block.code[::2])
+
+
+class Unoptimized(ABCOptimizer):
+    def optimize(self, stacks, namespace):
+        return stacks
+
+
+class TestConstantFolder(TestCase):
+    folder = ConstantFolder(Interpreter.executors, Interpreter.unary_executors, pure=stdpure)
+
+    def optimize(self, code, namespace=stdnamespace):
+        stacks = SortingStationBuilder().build(RegexTokenizer().tokenize(code))
+        return [dump_tokens(stack) for stack in self.folder.optimize(stacks, namespace)]
+
+    def values(self, code):
+        return [[token[2] for token in stack] for stack in self.optimize(code)]
+
+    def test_literals(self):
+        self.assertEqual(self.values("uint32 = 8"), [["uint32", 8, "="]])
+        self.assertEqual(self.values("1 << 5"), [[32]])
+        self.assertEqual(self.values("0x175ffa14 & 0xff"), [[0x14]])
+        self.assertEqual(self.values("-(2 * 3) + 0.5"), [[-5.5]])
+        self.assertEqual(self.values("2 < 3"), [[1]])
+        self.assertEqual(self.values("\"a\" + \"b\""), [["ab"]])
+        self.assertEqual(self.values("x + 2 * 3"), [["x", 6, "+"]])
+
+    def test_function_body(self):
+        (funcdef,), = self.values("f(index) = index * (4 * 2)")
+        self.assertEqual([token[2] for token in funcdef[2]], ["index", 8, "*"])
+
+    def test_typing(self):
+        self.assertEqual(self.values("1 + 1.0"), [[2.0]])
+        self.assertIsInstance(self.values("sqrt(4)")[0][0], float)
+        self.assertIsInstance(self.values("4 // 2")[0][0], int)
+
+    def test_pure_calls(self):
+        self.assertEqual(self.values("chr(ord(\"a\") + 1)"), [["b"]])
+        self.assertEqual(self.values("rt(8, 3) + len(\"abc\")"), [[5.0]])
+        self.assertEqual(self.values("print(1)"), [[1, ("print", 1)]])
+
+    def test_overridden_pure_calls(self):
+        self.assertEqual(self.values("sqrt(x) = x\nsqrt(4)")[1], [4, ("sqrt", 1)])
+        (funcdef,), = self.values("f(chr) = chr(65)")
+        self.assertEqual([token[2] for token in funcdef[2]], [65, ("chr", 1)])
+
+    def test_not_folded(self):
+        self.assertEqual(self.values("1 / 0"), [[1, 0, "/"]])
+        self.assertEqual(self.values("2 ** 100000"), [[2, 100000, "**"]])
+        self.assertEqual(self.values("range(0, 5)"), [[0, 5, ("range", 2)]])
+        self.assertEqual(self.values("1 2"), [[1, 2]])
+
+    def test_identities(self):
+        self.assertEqual(self.values("int(x) * 1 + 0"), [["x", ("int", 1)]])
+        self.assertEqual(self.values("1 * float(x) ** 1"), [["x", ("float", 1)]])
+        self.assertEqual(self.values("x * 1"), [["x", 1, "*"]])
+        self.assertEqual(self.values("float(x) + 0"), [["x", ("float", 1), 0, "+"]])
+
+    def test_same_results(self):
+        optimized = Interpreter(optimizer=self.folder)
+        unoptimized = Interpreter(optimizer=Unoptimized())
+        sources = TestClosureInterpreter.sources + (
+            "sqrt(x) = x\nsqrt(4)", "f() = sqrt(4)\nsqrt = (x) = 1\nf()", "int(\"a\")", "-0.0 + 0",
+            "x = -0.0\nx * 1", "chr(-1)", "2 ** -1 + 1.5 * 2 // 1 % 7",
+        )
+
+        for code in sources + tuple(code for code in read_examples() if "input(" not in code):
+            with self.subTest(code=code[:50]):
+                self.assertEqual(run(optimized, code), run(unoptimized, code))
+
+
+class TestProgramCache(TestCase):
+    def test_hits(self):
+        engine = Interpreter(cache=ProgramCache())
+
+        for _ in range(3):
+            self.assertEqual(engine.interpret("2 + 2 * 2", stdnamespace), 6)
+
+        info = engine.cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 1, 1))
+
+    def test_evictions(self):
+        cache = ProgramCache(maxsize=2)
+        engine = Interpreter(cache=cache)
+
+        for code in ("1", "2", "1", "3"):
+            engine.interpret(code, stdnamespace)
+
+        self.assertEqual(cache.info().evictions, 1)
+        self.assertIn("1", cache)
+        self.assertNotIn("2", cache)
+
+    def test_bytes_budget(self):
+        program = SortingStationBuilder().build(RegexTokenizer().tokenize("1 + 2"))
+        cache = ProgramCache(maxbytes=program_size(program) * 2)
+        engine = Interpreter(cache=cache)
+
+        for code in ("1 + 2", "1 + 3", "1 + 4"):
+            engine.interpret(code, stdnamespace)
+
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.nbytes, cache.maxbytes)
+
+        engine.interpret("+".join(["1"] * 100), stdnamespace)
+        self.assertEqual(len(cache), 2)
+
+    def test_disabled(self):
+        engine = Interpreter(cache=ProgramCache(maxsize=0))
+        engine.interpret("1", stdnamespace)
+
+        self.assertEqual(len(engine.cache), 0)
+
+    def test_shared_functions(self):
+        engine = Interpreter(cache=ProgramCache())
+        code = "c = 0\ninc() = c = c + 1\ninc(); inc()\ninc"
+        first = engine.interpret(code, dict(stdnamespace))
+        second = engine.interpret(code, dict(stdnamespace))
+
+        self.assertEqual(engine.cache.info().hits, 1)
+        self.assertEqual((first(), first(), second()), (3, 4, 3))
+
+    def test_optimized_once(self):
+        class CountingFolder(ConstantFolder):
+            calls = 0
+
+            def optimize(self, stacks, namespace):
+                CountingFolder.calls += 1
+                return super().optimize(stacks, namespace)
+
+        for engine_class in (Interpreter, ClosureInterpreter, VMInterpreter):
+            with self.subTest(engine=engine_class.__name__):
+                CountingFolder.calls = 0
+                engine = engine_class(optimizer=CountingFolder(Interpreter.executors, Interpreter.unary_executors))
+
+                for _ in range(3):
+                    self.assertEqual(engine.interpret("f(x) = x * 2\nf(2 + 2)", dict(stdnamespace)), 8)
+
+                self.assertEqual(CountingFolder.calls, 1)
+
+        folder = CountingFolder(Interpreter.executors, Interpreter.unary_executors, pure=stdpure)
+        engine = Interpreter(optimizer=folder)
+        CountingFolder.calls = 0
+
+        # optimized again once the name is not of the pure function anymore
+        for sqrt in (stdnamespace["sqrt"], stdnamespace["sqrt"], lambda x: -x, lambda x: -x):
+            self.assertEqual(engine.interpret("sqrt(4)", dict(stdnamespace, sqrt=sqrt)), sqrt(4))
+
+        self.assertEqual(CountingFolder.calls, 2)
+
+    def test_compiled_bytes_budget(self):
+        program = SortingStationBuilder().build(RegexTokenizer().tokenize("pi + 1"))
+        engine = Interpreter(cache=ProgramCache(maxbytes=program_size(program) * 2))
+
+        for code in ("pi + 1", "pi + 2", "pi + 3", "+".join(["pi"] * 100)):
+            engine.interpret(code, stdnamespace)
+
+        self.assertEqual(len(engine.compiled), 2)
+        self.assertLessEqual(engine.compiled.nbytes, engine.compiled.maxbytes)
+
+
+class BrokenTokenizer(RegexTokenizer):
+    def tokenize_stream(self, stream):
+        raise AssertionError("script is tokenized")
+
+
+class TestScriptCache(TestCase):
+    code = "f(x) = x * 2\ng = (a, b) = a + f(b)\ng(1, 2)\n"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.script = os.path.join(self.directory.name, "script.calc")
+        self.write(self.code)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, code):
+        with open(self.script, "w") as fd:
+            fd.write(code)
+
+    def test_round_trip(self):
+        for code in (self.code,) + tuple(read_examples()):
+            with self.subTest(code=code[:50]):
+                program = SortingStationBuilder().build(RegexTokenizer().tokenize(code))
+                self.assertEqual(
+                    [dump_tokens(stack) for stack in load_program(dump_program(program))],
+                    [dump_tokens(stack) for stack in program]
+                )
+
+    def test_loaded_instead_of_tokenizing(self):
+        cache = ScriptCache()
+        self.assertEqual(Interpreter().interpret_file(self.script, stdnamespace, cache), 5)
+        self.assertTrue(os.path.isfile(cache.path(self.script)))
+
+        engine = Interpreter(tokenize=BrokenTokenizer())
+        self.assertEqual(engine.interpret_file(self.script, stdnamespace, cache), 5)
+
+    def test_source_changed(self):
+        cache = ScriptCache()
+        Interpreter().interpret_file(self.script, stdnamespace, cache)
+        self.write(self.code + "g(2, 2)\n")
+
+        self.assertEqual(Interpreter().interpret_file(self.script, stdnamespace, cache), 6)
+
+    def test_invalid_file(self):
+        cache = ScriptCache(directory=os.path.join(self.directory.name, "cache"))
+        Interpreter().interpret_file(self.script, stdnamespace, cache)
+
+        with open(cache.path(self.script), "r+b") as fd:
+            fd.truncate(30)
+
+        self.assertIsNone(cache.load(self.script, file_digest(self.script)))
+        self.assertEqual(Interpreter().interpret_file(self.script, stdnamespace, cache), 5)
+        self.assertEqual(len(list(cache.load(self.script, file_digest(self.script)))), 3)
+
+    def test_streamed(self):
+        cache = ScriptCache()
+        digest = file_digest(self.script)
+        program = SortingStationBuilder().build(RegexTokenizer().tokenize(self.code))
+        stacks = cache.storing(self.script, digest, iter(program))
+
+        self.assertIs(next(stacks), program[0])
+        # stored once all of the stacks are
+        self.assertIsNone(cache.load(self.script, digest))
+        self.assertEqual(len(list(stacks)), 2)
+
+        loaded = cache.load(self.script, digest)
+        self.assertEqual(dump_tokens(next(loaded)), dump_tokens(program[0]))
+        loaded.close()
+
+    def test_examples_with_cache(self):
+        cache = ScriptCache()
+        Interpreter().interpret_file(self.script, stdnamespace, cache)
+
+        self.assertTrue(os.path.isfile(cache.path(self.script)))
+        self.assertEqual(list(read_examples(self.directory.name)), [self.code])
+
+    def test_not_stored_on_error(self):
+        cache = ScriptCache()
+        self.write("1\n(")
+
+        with self.assertRaises(InvalidSyntaxError):
+            Interpreter().interpret_file(self.script, stdnamespace, cache)
+
+        self.assertFalse(os.path.exists(cache.path(self.script)))
+
+
+class TestFrozenNamespace(TestCase):
+    engines = (Interpreter, ClosureInterpreter, AstInterpreter, VMInterpreter)
+
+    def test_immutable(self):
+        namespace = FrozenNamespace(a=1)
+
+        for change in (
+            lambda: namespace.__setitem__("a", 2),
+            lambda: namespace.__delitem__("a"),
+            lambda: namespace.update(a=2),
+            lambda: namespace.setdefault("b", 2),
+            lambda: namespace.pop("a"),
+            namespace.popitem,
+            namespace.clear,
+        ):
+            self.assertRaises(TypeError, change)
+
+        self.assertEqual(namespace, {"a": 1})
+        self.assertEqual(pickle.loads(pickle.dumps(namespace)), {"a": 1})
+
+    def test_names_are_shadowed(self):
+        namespaces = NamespaceStack([FrozenNamespace(a=1), {}])
+        namespaces.add_namespace({"b": 2})
+        namespaces.set("a", 3)
+
+        self.assertEqual(list(namespaces), [{"a": 1}, {"a": 3}, {"b": 2}])
+        self.assertEqual(namespaces.get("a"), 3)
+        self.assertRaises(TypeError, NamespaceStack([FrozenNamespace(a=1)]).set, "a", 2)
+
+    def test_same_as_copy(self):
+        sources = (
+            "pi = 3\npi",
+            "pi = pi + 1\npi",
+            "f() = pi = 3\nf()\npi",
+            "f(x) = sqrt = x\nf(5)\nsqrt",
+            "sqrt = 2\nf(x) = x + sqrt\nf(1)",
+        )
+        names = dict(stdlib)
+
+        for engine_class in self.engines:
+            engine = engine_class()
+
+            for source in sources:
+                with self.subTest(engine=engine_class.__name__, source=source):
+                    self.assertEqual(engine.interpret(source, stdlib), engine.interpret(source, dict(stdlib)))
+
+        self.assertEqual(stdlib, names)
+
+    def test_shared_by_threads(self):
+        code = "f(n) = if(n < 2, () = n, () = f(n - 1) + f(n - 2))\nx = n * 2\nf(x) + x"
+        expected = {n: Interpreter().interpret(code, dict(stdlib, n=n)) for n in range(8)}
+        names = dict(stdlib)
+
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                engine = engine_class()
+
+                def interpret(n):
+                    return engine.interpret(f"n = {n}\n{code}", stdlib)
+
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    results = list(executor.map(interpret, [n % 8 for n in range(64)]))
+
+                self.assertEqual(results, [expected[n % 8] for n in range(64)])
+
+        self.assertEqual(stdlib, names)
+
+
+class TestAsync(TestCase):
+    engines = (Interpreter, ClosureInterpreter, AstInterpreter, VMInterpreter)
+    sources = (
+        "f(n) = if(n == 0, () = 0, () = n + f(n - 1))\nf(20)",
+        "i = 0\nwhile(() = i < 10, () = i = i + 1)\ni",
+        "map((x) = x * 2, range(5))",
+        "filter((x) = x % 2, range(7))",
+        "f(x) = x + 1\nreduce((a, b) = f(a) + b, map(f, range(5)), 3)",
+        "reduce((a, b) = a + b, range(0))",
+        "map(1, 5)",
+        "while(() = 1 / 0, () = 0)",
+        "g(x) = x\nmap((x) = g(x, 1), range(3))",
+        "sqrt(4) + unknown",
+    )
+
+    @staticmethod
+    def outcome(evaluate):
+        try:
+            return evaluate()
+        except Exception as exc:
+            return type(exc), str(exc), getattr(exc, "pos", None)
+
+    def test_same_as_interpret(self):
+        for engine_class in self.engines:
+            engine = engine_class()
+
+            for source in self.sources:
+                with self.subTest(engine=engine_class.__name__, source=source):
+                    self.assertEqual(
+                        self.outcome(lambda: asyncio.run(engine.interpret_async(source, dict(stdlib)))),
+                        self.outcome(lambda: engine.interpret(source, dict(stdlib)))
+                    )
+
+    def test_awaits_externals(self):
+        async def double(x):
+            await asyncio.sleep(0)
+            return x * 2
+
+        async def evaluate():
+            namespace = dict(stdlib, double=double)
+
+            return await asyncio.gather(*(
+                Interpreter().interpret_async(f"f(x) = double(x) + 1\nmap(f, range({n}))", namespace)
+                for n in range(10)
+            ))
+
+        self.assertEqual(asyncio.run(evaluate()), [[x * 2 + 1 for x in range(n)] for n in range(10)])
+
+    def test_awaits_in_streams(self):
+        async def fetch(x):
+            await asyncio.sleep(0)
+            return x * 2
+
+        code = "strjoin(\",\", map(str, map(fetch, lazy(range(3)))))"
+
+        self.assertEqual(asyncio.run(Interpreter().interpret_async(code, dict(stdlib, fetch=fetch))), "0,2,4")
+
+    def test_stdlib_async(self):
+        target = StringIO()
+        code = "write(target, \"a\") + write(target, \"bc\")"
+
+        self.assertEqual(asyncio.run(Interpreter().interpret_async(code, dict(stdlib_async, target=target))), 3)
+        self.assertEqual(target.getvalue(), "abc")
+        self.assertIs(stdlib_async["input"], input_async)
+
+    def test_loops_yield(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def evaluate():
+            task = asyncio.ensure_future(ticker())
+            await asyncio.sleep(0)
+            start = len(ticks)
+            result = await Interpreter().interpret_async(
+                "i = 0\nwhile(() = i < 1000, () = i = i + 1)\ni", dict(stdlib), yield_every=100
+            )
+            task.cancel()
+
+            return result, len(ticks) - start
+
+        result, ticked = asyncio.run(evaluate())
+        self.assertEqual(result, 1000)
+        self.assertGreaterEqual(ticked, 10)
+
+
+class TestBudget(TestCase):
+    engines = (Interpreter, ClosureInterpreter, AstInterpreter, VMInterpreter)
+
+    def within(self, engine, budget, code):
+        with budget:
+            return engine.interpret(code, dict(stdlib))
+
+    def test_steps(self):
+        code = "f(x) = x\nlen(map(f, range({})))"
+
+        for engine_class in self.engines:
+            engine = engine_class()
+
+            # a step for every value of the range, and for every call of f
+            for length in (0, 1, 300):
+                with self.subTest(engine=engine_class.__name__, length=length):
+                    self.assertEqual(self.within(engine, Budget(steps=2 * length), code.format(length)), length)
+
+                    with self.assertRaises(BudgetExceededError) as error:
+                        self.within(engine, Budget(steps=2 * length + 1), code.format(length + 1))
+
+                    # located at the outermost call, as arguments errors are
+                    self.assertEqual(str(error.exception), "steps budget exceeded")
+                    self.assertEqual(error.exception.pos, (1, 5))
+
+    def test_external_loops(self):
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                engine = engine_class()
+                self.assertEqual(self.within(engine, Budget(steps=1000), "len(map(sqrt, range(1000)))"), 1000)
+                self.assertRaisesRegex(BudgetExceededError, "steps", self.within, engine,
+                                       Budget(steps=999), "len(map(sqrt, range(1000)))")
+                self.assertRaisesRegex(BudgetExceededError, "steps", self.within, engine,
+                                       Budget(steps=999), "len(filter(sqrt, lazy(range(1000))))")
+                self.assertRaisesRegex(BudgetExceededError, "steps", self.within, engine,
+                                       Budget(steps=999), "reduce(rt, range(1, 1001))")
+
+                with self.assertRaisesRegex(BudgetExceededError, "time"):
+                    self.within(engine, Budget(seconds=.05), "foreach(sqrt, range(10 ** 12))")
+
+    def test_endless_loop(self):
+        code = "i = 0\nwhile(() = 1, () = i = i + 1)"
+
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                with self.assertRaisesRegex(BudgetExceededError, "time"):
+                    self.within(engine_class(), Budget(seconds=.05), code)
+
+    def test_depth(self):
+        code = "f(n) = if(n == 0, () = 0, () = 1 + f(n - 1))\nf({})"
+        engine = Interpreter()
+
+        self.assertEqual(self.within(engine, Budget(depth=40), code.format(40)), 40)
+        self.assertRaisesRegex(BudgetExceededError, "depth", self.within, engine, Budget(depth=40), code.format(41))
+        # calls in tail position replace their callers
+        self.assertEqual(self.within(engine, Budget(depth=3), "f(n) = if(n, () = f(n - 1))\nf(1000)"), 0)
+
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                self.assertRaisesRegex(BudgetExceededError, "depth", self.within, engine_class(),
+                                       Budget(depth=40), code.format(10 ** 5))
+
+    def test_memory(self):
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                engine = engine_class()
+                self.assertEqual(self.within(engine, Budget(memory=10), "len(malloc(6)) + len(mallocfor(1, 2))"), 8)
+
+                with self.assertRaisesRegex(BudgetExceededError, "memory"):
+                    self.within(engine, Budget(memory=10), "a = malloc(6)\nb = malloc(6)")
+                with self.assertRaisesRegex(BudgetExceededError, "memory"):
+                    self.within(engine, Budget(memory=1000), "malloc(10 ** 10)")
+
+    def test_nested(self):
+        code = "f(x) = x\nlen(map(f, range({})))"
+        engine = Interpreter()
+
+        with Budget(steps=1000):
+            with Budget(steps=2000):
+                self.assertEqual(engine.interpret(code.format(300), dict(stdlib)), 300)
+            with Budget(steps=2000):
+                self.assertRaises(BudgetExceededError, engine.interpret, code.format(201), dict(stdlib))
+
+        # budget is over with its block
+        self.assertEqual(engine.interpret(code.format(1000), dict(stdlib)), 1000)
+
+    def test_async(self):
+        async def evaluate(steps):
+            with Budget(steps=steps):
+                return await Interpreter().interpret_async("f(x) = x\nlen(map(f, range(100)))", dict(stdlib))
+
+        self.assertEqual(asyncio.run(evaluate(200)), 100)
+        self.assertRaises(BudgetExceededError, asyncio.run, evaluate(199))
+
+
+class TestLazySequences(TestCase):
+    engines = (Interpreter, ClosureInterpreter, AstInterpreter, VMInterpreter)
+    sources = (
+        "len(filter((x) = x % 2, map((x) = x * 3, lazy(range(1000)))))",
+        "reduce((a, b) = a + b, filter((x) = x % 3, map((x) = x * x, lazy(range(100)))))",
+        "reduce((a, b) = a + b, filter((x) = 0, lazy(range(10))), 7)",
+        "reduce((a, b) = a + b, filter((x) = 0, lazy(range(10))))",
+        "collect(map((x) = x + 1, lazy(range(5))))",
+        "s = map((x) = x + 1, lazy(range(5)))\nlen(s) + len(s)",
+        "n = 0\nforeach((x) = n = n + x, filter((x) = x % 2, lazy(range(100))))\nn",
+        "n = 0\nforeach((x) = n = n + x, range(100))\nn",
+        "strjoin(\",\", map(str, filter((x) = x % 3, map((x) = x * 2, lazy(range(10))))))",
+    )
+
+    def test_same_as_eager(self):
+        for source in self.sources:
+            eager = source.replace("lazy(", "collect(")
+            expected = TestAsync.outcome(lambda: Interpreter().interpret(eager, dict(stdlib)))
+
+            for engine_class in self.engines:
+                with self.subTest(source=source, engine=engine_class.__name__):
+                    engine = engine_class()
+
+                    self.assertEqual(TestAsync.outcome(lambda: engine.interpret(source, dict(stdlib))), expected)
+                    self.assertEqual(
+                        TestAsync.outcome(lambda: asyncio.run(engine.interpret_async(source, dict(stdlib)))),
+                        expected
+                    )
+
+    def test_fused(self):
+        calls = []
+
+        def note(stage, value):
+            calls.append((stage, value))
+            return value
+
+        code = "len(filter((x) = note(2, x), map((x) = note(1, x), lazy(range(3)))))"
+
+        self.assertEqual(Interpreter().interpret(code, dict(stdlib, note=note)), 2)
+        self.assertEqual(calls, [(1, 0), (2, 0), (1, 1), (2, 1), (1, 2), (2, 2)])
+
+    def test_lazy(self):
+        stream = Interpreter().interpret("map((x) = 1 / 0, lazy(range(10 ** 10)))", dict(stdlib))
+
+        self.assertIsInstance(stream, Stream)
+        self.assertIsInstance(Interpreter().interpret("map((x) = x, range(3))", dict(stdlib)), list)
+        self.assertEqual(Interpreter().interpret("foreach((x) = x, lazy(range(10 ** 5)))", dict(stdlib)), 0)
+
+
+class TestMemory(TestCase):
+    def evaluate(self, code, **names):
+        return Interpreter().interpret(code, dict(stdlib, **names))
+
+    def test_types(self):
+        for name, itemsize in (("u8", 1), ("i16", 2), ("u32", 4), ("i64", 8), ("f64", 8)):
+            with self.subTest(type=name):
+                mem = self.evaluate(f'malloc(3, "{name}")')
+
+                self.assertIsInstance(mem, Memory)
+                self.assertEqual((mem.type, len(mem), mem.itemsize), (name, 3, itemsize))
+
+        self.assertEqual(self.evaluate("malloc(2)").type, "u8")
+        self.assertRaisesRegex(ExternalFunctionError, "unknown type", self.evaluate, 'malloc(2, "u7")')
+
+    def test_set(self):
+        code = 'mem = malloc(2, "{}")\nset(mem, {}, {})'
+
+        self.assertEqual(self.evaluate(code.format("i16", 1, -300)), 0)
+        self.assertEqual(self.evaluate(code.format("u8", 0, 256)), -1)
+        self.assertEqual(self.evaluate(code.format("u8", 2, 1)), -1)
+        self.assertEqual(self.evaluate(code.format("i64", 0, 1.5)), -1)
+        self.assertEqual(self.evaluate(code.format("f64", 0, 1.5) + "\nget(mem, 0)"), 1.5)
+
+    def test_mallocfor(self):
+        for code, name in (("mallocfor(1, 255)", "u8"), ("mallocfor(1, -1)", "i64"), ("mallocfor(1, 0.5)", "f64"),
+                           ("mallocfor(1, 2 ** 63)", "u64")):
+            with self.subTest(code=code):
+                self.assertEqual(self.evaluate(code).type, name)
+
+        self.assertEqual(self.evaluate("mallocfor(1, 2, 3)").tolist(), [1, 2, 3])
+        self.assertEqual(self.evaluate("mallocfor(1, (2 ** 63) + 1)").tolist(), [1, 2 ** 63 + 1])
+
+        for code in ("mallocfor(2 ** 64)", "mallocfor(2 ** 63, -1)"):
+            with self.subTest(code=code):
+                self.assertRaisesRegex(ExternalFunctionError, "do not fit", self.evaluate, code)
+
+    def test_view(self):
+        # views share bytes of the memory
+        code = 'mem = malloc(4)\nwide = view(mem, "u16")\nset(wide, 1, 0x0102)\nmem'
+
+        self.assertEqual(self.evaluate(code).tolist(), list(array("H", [0, 0x0102]).tobytes()))
+        self.assertEqual(self.evaluate('get(view(mallocfor(1, 0, 0, 0, 0, 0, 0, 0), "i64"), 0)'),
+                         array("q", bytes([1, 0, 0, 0, 0, 0, 0, 0]))[0])
+
+    def test_buffer_protocol(self):
+        mem = self.evaluate('mem = malloc(2, "u16")\nset(mem, 1, 7)\nmem')
+
+        self.assertEqual(memoryview(mem).tolist(), [0, 7])
+        self.assertEqual(bytes(mem), array("H", [0, 7]).tobytes())
+        # external functions write it in place
+        self.assertEqual(self.evaluate("mem = malloc(2)\nfill(mem)\nget(mem, 1)",
+                                       fill=lambda buffer: memoryview(buffer).__setitem__(1, 9) or 0), 9)
+
+    def test_slice(self):
+        mem = self.evaluate('slice(view(mallocfor(1, 2, 3, 4), "u16"), 1, 2)')
+
+        self.assertIsInstance(mem, Memory)
+        self.assertEqual(mem.tolist(), array("H", bytes([3, 4])).tolist())
+
+    def test_printed_as_list(self):
+        mem = self.evaluate("mallocfor(1, 2)")
+
+        self.assertEqual(str(mem), "[1, 2]")
+        self.assertEqual(pickle.loads(pickle.dumps(mem)), mem)
+        self.assertEqual(str(self.evaluate('view(mallocfor(1, 2), "u16")')), str([0x0201]))
+        self.assertEqual(str(self.evaluate('slice(view(malloc(8), "u32"), 0, 1)')), "[0]")
+
+    def test_budget_in_bytes(self):
+        with Budget(memory=16):
+            self.evaluate('malloc(4, "u32")')
+
+            with self.assertRaisesRegex(BudgetExceededError, "memory"):
+                self.evaluate('malloc(5, "u32")')
+
+
+class TestPrepared(TestCase):
+    engines = (Interpreter, ClosureInterpreter, AstInterpreter, VMInterpreter)
+
+    def engine(self, engine_class):
+        return engine_class(optimizer=ConstantFolder(
+            executors=Interpreter.executors,
+            unary_executors=Interpreter.unary_executors,
+            pure=stdpure
+        ))
+
+    def test_same_as_interpret(self):
+        code = "rate = sqrt(4) * 0.5\nf(x) = x * rate\nf(price) + qty * pi"
+
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                engine = self.engine(engine_class)
+                prepared = engine.prepare(code, stdnamespace, params=["price", "qty"])
+                expected = engine.interpret(code, dict(stdnamespace, price=10, qty=2))
+
+                self.assertEqual(prepared.evaluate(10, 2), expected)
+                self.assertEqual(prepared.evaluate(price=10, qty=2), expected)
+                self.assertEqual(prepared.evaluate(10, qty=2), expected)
+                self.assertEqual(prepared.evaluate(1, 0), 1)
+
+    def test_isolated(self):
+        namespace = dict(stdnamespace)
+
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                prepared = self.engine(engine_class).prepare("pi = pi + x\npi", namespace, params=["x"])
+                self.assertEqual(prepared.evaluate(1), pi + 1)
+                self.assertEqual(prepared.evaluate(1), pi + 1)
+                self.assertEqual(namespace["pi"], pi)
+
+                namespace["pi"] = 3
+                self.assertEqual(prepared.evaluate(1), pi + 1)
+                namespace["pi"] = pi
+
+    def test_parameters_shadow_namespace(self):
+        for engine_class in self.engines:
+            with self.subTest(engine=engine_class.__name__):
+                prepared = self.engine(engine_class).prepare("sqrt(4) + pi", stdnamespace, params=["sqrt", "pi"])
+                self.assertEqual(prepared.evaluate(lambda a: a * 10, 1), 41)
+
+    def test_invalid_bindings(self):
+        prepared = Interpreter().prepare("a + b", stdnamespace, params=["a", "b"])
+
+        for args, kwargs in (
+            ((1,), {}),
+            ((1, 2, 3), {}),
+            ((1,), {"a": 2}),
+            ((1, 2), {"c": 3}),
+        ):
+            with self.subTest(args=args, kwargs=kwargs):
+                with self.assertRaises(TypeError):
+                    prepared.evaluate(*args, **kwargs)
+
+        with self.assertRaises(NameNotFoundError):
+            Interpreter().prepare("a + c", stdnamespace, params=["a"]).evaluate(1)
+
+
+class TestBatch(TestCase):
+    params = ("price", "qty", "discount")
+    sources = (
+        "price * qty * (1 - discount)",
+        "price // (qty + 0.5) + price % 3 - price // -7.5",
+        "(price > qty) * 2.5 - (qty == 3) + (qty > 1) + (qty < 3)",
+        "-price + 10 ** 20 * discount + price ** discount",
+        "(price > 9007199254740993) + sqrt(qty) + int(price)",
+        "price / (qty - 5)",
+        "(qty > 1) + 1 - (price < 0) * 3 + (qty == 2) // 2 % 5",
+        "price + name",
+        "1 + 2",
+        "x = price * 2\nx + qty",
+        "f(x) = x * 2\nf(qty) + f(discount)",
+        "strjoin(\"\", map(str, range(0, qty)))",
+    )
+
+    def columns(self, rows):
+        price = [(i * 7919 % 1000) / 7 - 20 for i in range(rows)]
+        qty = [i * 31 % 11 for i in range(rows)]
+        discount = [(i * 17 % 100) / 100 for i in range(rows)]
+
+        return {"price": price, "qty": qty, "discount": discount}
+
+    def compare(self, columns, chunksize=batch.CHUNKSIZE):
+        engine = Interpreter(pure=stdpure | stdhigherorder)
+
+        for code in self.sources:
+            with self.subTest(code=code):
+                prepared = engine.prepare(code, stdnamespace, params=self.params)
+                rows = zip(*(columns[name] for name in self.params))
+
+                try:
+                    expected = [prepared.evaluate(*map(_python_value, row)) for row in rows]
+                except Exception as exc:
+                    expected = type(exc), str(exc)
+
+                try:
+                    results = prepared.evaluate_columns(columns, chunksize)
+                except Exception as exc:
+                    results = type(exc), str(exc)
+
+                self.assertEqual(results, expected)
+
+                if isinstance(results, list):
+                    self.assertEqual(list(map(type, results)), list(map(type, expected)))
+
+    def test_same_as_rows(self):
+        self.compare(self.columns(1000))
+        self.compare(self.columns(1000), chunksize=64)
+
+    def test_buffers(self):
+        columns = self.columns(1000)
+        columns["price"] = array("d", columns["price"])
+        self.compare(columns, chunksize=100)
+
+    @skipIf(batch.numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        columns = self.columns(1000)
+        columns["price"] = batch.numpy.array(columns["price"])
+        columns["discount"] = array("d", columns["discount"])
+        self.compare(columns, chunksize=300)
+        columns["qty"] = batch.numpy.array(columns["qty"], dtype=float)
+        self.compare(columns, chunksize=300)
+
+    def test_plan(self):
+        engine = Interpreter(pure=stdpure)
+
+        for code, vectorized in (
+            ("price * qty + sqrt(discount)", True),
+            ("price * qty + print(discount)", False),
+            ("price + unknown", False),
+            ("x = price\nx", False),
+            ("price(qty, discount)", False),
+            ("price.real", False),
+        ):
+            with self.subTest(code=code):
+                prepared = engine.prepare(code, dict(stdnamespace, print=print), params=self.params)
+                self.assertEqual(prepared._plan is not None, vectorized)
+
+    def test_higher_order(self):
+        engine = Interpreter(pure=stdpure | stdhigherorder)
+        calls = []
+        namespace = dict(stdnamespace, print=calls.append)
+
+        for code in ("len(map(print, range(0, qty))) + \"a\"", "len(map(print, range(0, qty)))"):
+            with self.subTest(code=code):
+                prepared = engine.prepare(code, namespace, params=self.params)
+                self.assertIsNone(prepared._plan)
+
+        calls.clear()
+        prepared.evaluate_columns({"price": [0] * 3, "qty": [1, 2, 3], "discount": [0] * 3})
+        self.assertEqual(calls, [0, 0, 1, 0, 1, 2])
+
+    def test_invalid_columns(self):
+        prepared = Interpreter().prepare("a + b", stdnamespace, params=["a", "b"])
+
+        with self.assertRaises(TypeError):
+            prepared.evaluate_columns({"a": [1]})
+        with self.assertRaises(TypeError):
+            prepared.evaluate_columns({"a": [1], "b": [2], "c": [3]})
+        with self.assertRaises(ValueError):
+            prepared.evaluate_columns({"a": [1], "b": [2, 3]})
+
+        self.assertEqual(prepared.evaluate_columns({"a": [], "b": []}), [])
+
+
+class TestParallel(TestCase):
+    namespace = "std.stdlibrary:stdnamespace"
+    code = "f(x) = x * 2 + 1\nf(a) * b"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.evaluator = ParallelEvaluator(cls.code, cls.namespace, ["a", "b"], workers=2, chunksize=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.evaluator.close()
+
+    def columns(self, rows):
+        return {"a": list(range(rows)), "b": array("d", [i / 3 for i in range(rows)])}
+
+    def test_same_as_prepared(self):
+        prepared = Interpreter().prepare(self.code, stdnamespace, ["a", "b"])
+
+        for rows in (0, 1, 100, 1234):
+            with self.subTest(rows=rows):
+                columns = self.columns(rows)
+                expected = prepared.evaluate_columns(columns)
+
+                self.assertEqual(self.evaluator.evaluate_columns(columns), expected)
+                self.assertEqual(
+                    [len(chunk) for chunk in self.evaluator.imap_columns(columns)],
+                    [min(100, rows - start) for start in range(0, rows, 100)]
+                )
+
+    def test_shared_memory(self):
+        columns = self.columns(1234)
+        memory = SharedMemory(create=True, size=1234 * 8)
+
+        try:
+            self.assertIsNone(self.evaluator.evaluate_columns(columns, out=memory))
+            self.assertEqual(memory.buf.cast("d").tolist(), self.evaluator.evaluate_columns(columns))
+
+            with self.assertRaises(ValueError):
+                self.evaluator.evaluate_columns(self.columns(2000), out=memory)
+        finally:
+            memory.close()
+            memory.unlink()
+
+    def test_errors(self):
+        with ParallelEvaluator("1 / a + x(a)", self.namespace, ["a"], workers=1) as evaluator:
+            with self.assertRaises(ZeroDivisionError):
+                evaluator.evaluate_columns({"a": [0, 1]})
+            with self.assertRaises(NameNotFoundError) as context:
+                evaluator.evaluate_columns({"a": [1, 2]})
+
+        self.assertEqual(context.exception.pos, (0, 8))
+
+        with self.assertRaises(TypeError):
+            self.evaluator.evaluate_columns({"a": [1]})
+
+    def test_scripts(self):
+        scripts = ["1 + 2", "f(x) = x * 3\nf(5)", "sqrt(16)", "pi = 3\npi"] * 10
+        expected = [Interpreter().interpret(code, dict(stdnamespace)) for code in scripts]
+
+        self.assertEqual(list(interpret_many(scripts, self.namespace, workers=2, chunksize=3)), expected)
+
+
+def _python_value(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+class TestMemo(TestCase):
+    fib = "fib(n) = if(n < 2, () = n, () = fib(n - 1) + fib(n - 2))\n"
+
+    def engine(self, **kwargs):
+        return Interpreter(pure=stdpure | stdhigherorder, **kwargs)
+
+    def test_same_results(self):
+        sources = TestResolver.sources + TestClosureInterpreter.sources + (
+            self.fib + "fib(15)",
+            "f(x) = str(x)\nf(1) + f(1.0) + f(1)",
+            "f(x) = 1 / x\nf(1) + f(0)",
+            "f(x) = 1 / x\nf(1) + f(0) + f(1)",
+        )
+        engine = self.engine()
+
+        for code in sources + tuple(code for code in read_examples() if "input(" not in code):
+            with self.subTest(code=code[:50]):
+                expected = run(Interpreter(memo=MemoCache(maxsize=0)), code)
+                self.assertEqual(run(engine, code), expected)
+                self.assertEqual(run(engine, code), expected)
+
+    def test_hits(self):
+        engine = self.engine()
+        self.assertEqual(engine.interpret(self.fib + "fib(30)", dict(stdnamespace)), 832040)
+
+        info = engine.memo.info()
+        self.assertEqual(info.misses, 31)
+        self.assertGreater(info.hit_rate, 0.4)
+
+    def test_not_pure(self):
+        for code in (
+            "c = 0\nf(x) = c = c + x\nf(1)\nf(1)\nc",
+            "f(x) = println(x)\nf(1)\nf(1)",
+            "f(x) = g(x)\ng(x) = println(x)\nf(1)\nf(1)",
+            "f(x) = if(g(y) = y, () = x)\nf(1)\nf(1)",
+            "f(x) = get(malloc(2), x)\nf(1)\nf(1)",
+            "f(m) = len(m)\nf(malloc(1))\nf(malloc(1))",
+            "f = (x) = x\nf(1)\nf(1)",
+            "f(x) = x * 2\nf(1)\nf(1)",
+        ):
+            with self.subTest(code=code):
+                engine = self.engine()
+                engine.interpret(code, dict(stdnamespace, println=lambda *args: 0))
+                self.assertEqual(len(engine.memo), 0)
+
+    def test_names_changed(self):
+        # g calls nothing, so only its caller is cached
+        code = "k = 1\ng(x) = x * 2\nf(x) = g(x) + k\nf(1); f(1)\n{}\nf(1)"
+
+        for change, result, hits in (("k = 2", 4, 1), ("g(x) = 0", 1, 1), ("h = 0", 3, 2)):
+            with self.subTest(change=change):
+                engine = self.engine()
+
+                self.assertEqual(engine.interpret(code.format(change), dict(stdnamespace)), result)
+
+                info = engine.memo.info()
+                self.assertEqual((info.misses, info.hits, info.currsize), (1, hits, 1))
+
+    def test_evictions(self):
+        engine = self.engine(memo=MemoCache(maxsize=2))
+        engine.interpret("f(x) = int(x * 2)\nf(1) + f(2) + f(3) + f(1)", dict(stdnamespace))
+
+        info = engine.memo.info()
+        self.assertEqual((info.currsize, info.evictions, info.hits), (2, 2, 0))
+
+    def test_persistence(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "memo")
+            engine = self.engine(memo=MemoCache(path=path))
+            self.assertEqual(engine.interpret(self.fib + "fib(20)", dict(stdnamespace)), 6765)
+            engine.memo.save()
+
+            engine = self.engine(memo=MemoCache(path=path))
+            self.assertEqual(len(engine.memo), 21)
+            self.assertEqual(engine.interpret(self.fib + "fib(20)", dict(stdnamespace)), 6765)
+            self.assertEqual((engine.memo.hits, engine.memo.misses), (1, 0))
+
+            # another function under the same name
+            code = "fib(n) = if(n < 2, () = 1, () = fib(n - 1) + fib(n - 2))\nfib(20)"
+            self.assertEqual(engine.interpret(code, dict(stdnamespace)), 10946)
+
+            with open(path, "r+b") as fd:
+                fd.truncate(20)
+
+            self.assertEqual(len(MemoCache(path=path)), 0)
+
+
 evaluation_tests = TestSuite()
 evaluation_tests.addTest(makeSuite(TestNumbers))
 evaluation_tests.addTest(makeSuite(TestBasicOperations))
@@ -234,3 +1650,27 @@ evaluation_tests.addTest(makeSuite(TestOperatorsPriority))
 evaluation_tests.addTest(makeSuite(TestVariables))
 evaluation_tests.addTest(makeSuite(TestFunctions))
 evaluation_tests.addTest(makeSuite(TestLambdas))
+evaluation_tests.addTest(makeSuite(TestNamespaceStack))
+evaluation_tests.addTest(makeSuite(TestClosureInterpreter))
+evaluation_tests.addTest(makeSuite(TestAstInterpreter))
+evaluation_tests.addTest(makeSuite(TestResolver))
+evaluation_tests.addTest(makeSuite(TestRecursion))
+evaluation_tests.addTest(makeSuite(TestVMInterpreter))
+evaluation_tests.addTest(makeSuite(TestConstantFolder))
+evaluation_tests.addTest(makeSuite(TestProgramCache))
+evaluation_tests.addTest(makeSuite(TestScriptCache))
+evaluation_tests.addTest(makeSuite(TestFrozenNamespace))
+evaluation_tests.addTest(makeSuite(TestAsync))
+evaluation_tests.addTest(makeSuite(TestBudget))
+evaluation_tests.addTest(makeSuite(TestLazySequences))
+evaluation_tests.addTest(makeSuite(TestMemory))
+evaluation_tests.addTest(makeSuite(TestPrepared))
+evaluation_tests.addTest(makeSuite(TestBatch))
+evaluation_tests.addTest(makeSuite(TestParallel))
+evaluation_tests.addTest(makeSuite(TestMemo))
+
+tokenizer_tests = TestSuite()
+tokenizer_tests.addTest(makeSuite(TestRegexTokenizer))
+tokenizer_tests.addTest(makeSuite(TestPrattParser))
+tokenizer_tests.addTest(makeSuite(TestSortingStationBuilder))
+tokenizer_tests.addTest(makeSuite(TestStreaming))